@@ -5,6 +5,7 @@ Django settings for Ahmad Poultry Services.
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 import dj_database_url
 from decouple import config
 
@@ -90,6 +91,40 @@ else:
         'default': dj_database_url.parse(database_url)
     }
 
+# Caches
+# Report results are cached per data version (see reports.cache). The
+# "locmem" backend is per process; "file" is shared by all processes on
+# the host. Neither needs an outside service.
+REPORT_CACHE_BACKEND = config('REPORT_CACHE_BACKEND', default='locmem')
+REPORT_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reports',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('REPORT_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'ahmad_poultry_reports')),
+    },
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        **REPORT_CACHE_BACKENDS[REPORT_CACHE_BACKEND],
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': config('REPORT_CACHE_MAX_ENTRIES', default=2000, cast=int)},
+    },
+}
+
+# Backups
+# Files written by backup_data from the API. Backup jobs run on an
+# in-process thread pool (see sales.jobs) and are failed once they make no
+# progress for BACKUP_JOB_STALE_SECONDS.
+BACKUP_DIR = config('BACKUP_DIR', default='backups')
+BACKUP_JOB_WORKERS = config('BACKUP_JOB_WORKERS', default=1, cast=int)
+BACKUP_JOB_STALE_SECONDS = config('BACKUP_JOB_STALE_SECONDS', default=900, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -149,6 +184,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'if-none-match',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -156,7 +192,9 @@ CORS_ALLOW_HEADERS = [
 ]
 CORS_EXPOSE_HEADERS = [
     'content-type',
+    'etag',
     'x-csrftoken',
+    'x-report-cache',
 ]
 CORS_ALLOW_ALL_ORIGINS = False
 CORS_ALLOW_METHODS = [
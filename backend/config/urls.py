@@ -9,11 +9,11 @@ from sales.views import (
     CustomerViewSet, DailyRateViewSet, PurchaseViewSet,
     SaleViewSet, PaymentViewSet, ExpenseViewSet, CustomerDeductionViewSet,
     SupplierViewSet, SupplierPaymentViewSet,
-    backup_database, backup_status
+    backup_database, backup_status, backup_jobs, backup_job_detail, backup_job_download
 )
 from reports.views import (
     DailyReportView, PeriodReportView, ExpenseReportView, CustomerReportView,
-    SalesAnalyticsView
+    SalesAnalyticsView, ReportCacheStatsView
 )
 from .views import api_root, health_check
 
@@ -50,11 +50,15 @@ urlpatterns = [
     path('api/reports/period/', PeriodReportView.as_view(), name='period-report'),
     path('api/reports/expenses/', ExpenseReportView.as_view(), name='expense-report'),
     path('api/reports/sales-analytics/', SalesAnalyticsView.as_view(), name='sales-analytics'),
+    path('api/reports/cache-stats/', ReportCacheStatsView.as_view(), name='report-cache-stats'),
     path('api/customers/<int:customer_id>/report/', CustomerReportView.as_view(), name='customer-report'),
     
     # Backup
     path('api/backup/', backup_database, name='backup-database'),
     path('api/backup/status/', backup_status, name='backup-status'),
+    path('api/backup/jobs/', backup_jobs, name='backup-jobs'),
+    path('api/backup/jobs/<uuid:job_id>/', backup_job_detail, name='backup-job-detail'),
+    path('api/backup/jobs/<uuid:job_id>/download/', backup_job_download, name='backup-job-download'),
     
     # API Documentation
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -0,0 +1,101 @@
+"""
+Versioned cache for report results.
+
+A report is cached under its endpoint, its parsed parameters and the data
+version of its date range: the sum and count of ``DailySummary.version``
+over the range. Every transaction write bumps the version of the dates it
+touches (see ``reports.rollups``), so a write only changes the keys of
+reports covering those dates and cached historical ranges stay valid
+indefinitely. Reports showing customer names also include the latest
+customer ``updated_at`` in their key, so renames are picked up.
+
+Values that depend on all history rather than the range (stored balances,
+stock as of a date) are read fresh by the views on every request.
+
+Results live in the ``reports`` cache alias (``REPORT_CACHE_BACKEND`` selects
+local memory or files, see settings). Hit and miss counts are kept in the
+same cache per endpoint.
+"""
+import hashlib
+import json
+
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+
+from sales.models import Customer
+
+from .models import DailySummary
+
+CACHE_ALIAS = 'reports'
+ENDPOINTS = ['daily', 'period', 'expenses', 'sales-analytics', 'customer']
+
+
+def report_cache():
+    return caches[CACHE_ALIAS]
+
+
+def data_version(start_date=None, end_date=None, customers=False):
+    """Fingerprint of all transaction data in the date range"""
+    summaries = DailySummary.objects.all()
+    if start_date:
+        summaries = summaries.filter(date__gte=start_date)
+    if end_date:
+        summaries = summaries.filter(date__lte=end_date)
+    totals = summaries.aggregate(version=Sum('version'), days=Count('id'))
+    version = f"{totals['version'] or 0}.{totals['days']}"
+    if customers:
+        latest = Customer.objects.aggregate(updated=Max('updated_at'), count=Count('id'))
+        version += f"-{latest['updated'].timestamp() if latest['updated'] else 0}.{latest['count']}"
+    return version
+
+
+def cache_key(endpoint, params, version):
+    raw = json.dumps(sorted(params.items()), default=str)
+    return f'report:{endpoint}:{hashlib.sha256(raw.encode()).hexdigest()[:32]}:{version}'
+
+
+def _count(endpoint, outcome):
+    key = f'report-stats:{endpoint}:{outcome}'
+    cache = report_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set yet; add() keeps a concurrent first increment from being lost
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cached_report(endpoint, params, compute, start_date=None, end_date=None, customers=False):
+    """
+    Return ``(data, hit)`` for a report, computing and storing it on a miss.
+
+    ``params`` are the parsed request parameters the result depends on and
+    ``compute`` builds the result when it is not cached.
+    """
+    cache = report_cache()
+    key = cache_key(endpoint, params, data_version(start_date, end_date, customers))
+    data = cache.get(key)
+    if data is not None:
+        _count(endpoint, 'hits')
+        return data, True
+    data = compute()
+    cache.set(key, data, timeout=None)
+    _count(endpoint, 'misses')
+    return data, False
+
+
+def cache_stats():
+    """Hit and miss counts per endpoint and in total"""
+    keys = [f'report-stats:{endpoint}:{outcome}' for endpoint in ENDPOINTS for outcome in ('hits', 'misses')]
+    counts = report_cache().get_many(keys)
+    endpoints = {
+        endpoint: {
+            outcome: counts.get(f'report-stats:{endpoint}:{outcome}', 0) for outcome in ('hits', 'misses')
+        }
+        for endpoint in ENDPOINTS
+    }
+    return {
+        'hits': sum(stats['hits'] for stats in endpoints.values()),
+        'misses': sum(stats['misses'] for stats in endpoints.values()),
+        'endpoints': endpoints,
+    }
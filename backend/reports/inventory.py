@@ -0,0 +1,103 @@
+"""
+Perpetual inventory ledger.
+
+Each ``InventoryLedger`` row holds the opening stock, kg purchased, kg sold
+and closing stock of one date. A purchase or sale changes its own date's row
+and shifts the opening and closing of every later row by the same net
+amount with one relative ``UPDATE``; reading the stock as of a date is a
+single indexed lookup. ``python manage.py rebuild_inventory`` recomputes the
+ledger from the raw transactions.
+
+The running totals are stored rather than summed on read, which favours the
+report reads: a write dated today touches one row, but a back-dated write
+rewrites every later row, so its cost grows with the number of dates after
+it. Back-dated corrections are rare here and still a single statement.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from sales.models import Purchase, Sale
+
+from .models import InventoryLedger
+
+ZERO = Decimal('0.000')
+
+
+def apply_stock_change(day, kg_in=ZERO, kg_out=ZERO):
+    """Record ``kg_in`` purchased and ``kg_out`` sold on ``day``"""
+    if not kg_in and not kg_out:
+        return
+    if not InventoryLedger.objects.filter(date=day).exists():
+        # Lock the preceding row so a concurrent backdated change cannot
+        # shift it between reading its closing and inserting this row.
+        opening = (
+            InventoryLedger.objects.select_for_update()
+            .filter(date__lt=day).order_by('-date')
+            .values_list('closing_kg', flat=True).first()
+        ) or ZERO
+        InventoryLedger.objects.bulk_create(
+            [InventoryLedger(date=day, opening_kg=opening, closing_kg=opening)], ignore_conflicts=True
+        )
+    net = kg_in - kg_out
+    InventoryLedger.objects.filter(date=day).update(
+        kg_in=F('kg_in') + kg_in,
+        kg_out=F('kg_out') + kg_out,
+        closing_kg=F('closing_kg') + net,
+    )
+    if net:
+        InventoryLedger.objects.filter(date__gt=day).update(
+            opening_kg=F('opening_kg') + net,
+            closing_kg=F('closing_kg') + net,
+        )
+
+
+def stock_as_of(day):
+    """
+    Return ``{'opening_kg', 'kg_in', 'kg_out', 'closing_kg'}`` for ``day``.
+
+    Dates without their own ledger row carry the closing stock of the latest
+    earlier row.
+    """
+    row = (
+        InventoryLedger.objects.filter(date__lte=day).order_by('-date')
+        .values('date', 'opening_kg', 'kg_in', 'kg_out', 'closing_kg').first()
+    )
+    if row is None:
+        return {'opening_kg': ZERO, 'kg_in': ZERO, 'kg_out': ZERO, 'closing_kg': ZERO}
+    if row.pop('date') != day:
+        return {'opening_kg': row['closing_kg'], 'kg_in': ZERO, 'kg_out': ZERO, 'closing_kg': row['closing_kg']}
+    return row
+
+
+def ledger_rows(purchases, sales):
+    """
+    Build ledger rows from ``(date, kg)`` totals of purchases and sales.
+
+    Shared with the data migration, which passes historical querysets.
+    """
+    moves = defaultdict(lambda: [ZERO, ZERO])
+    for row in purchases:
+        moves[row['date']][0] += row['total_kg']
+    for row in sales:
+        moves[row['date']][1] += row['total_kg']
+
+    rows, stock = [], ZERO
+    for day in sorted(moves):
+        kg_in, kg_out = moves[day]
+        rows.append(dict(date=day, opening_kg=stock, kg_in=kg_in, kg_out=kg_out, closing_kg=stock + kg_in - kg_out))
+        stock += kg_in - kg_out
+    return rows
+
+
+def grouped_kg(queryset):
+    return queryset.order_by().values('date').annotate(total_kg=Sum('kg'))
+
+
+def rebuild_inventory_ledger():
+    """Recompute the whole ledger with one grouped query per source table"""
+    rows = ledger_rows(grouped_kg(Purchase.objects.all()), grouped_kg(Sale.objects.all()))
+    InventoryLedger.objects.all().delete()
+    InventoryLedger.objects.bulk_create([InventoryLedger(**row) for row in rows], batch_size=1000)
+    return len(rows)
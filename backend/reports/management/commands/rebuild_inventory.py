@@ -0,0 +1,20 @@
+"""
+Management command to rebuild the inventory ledger from purchases and sales
+Usage: python manage.py rebuild_inventory
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from reports.inventory import rebuild_inventory_ledger, stock_as_of
+from reports.models import InventoryLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-date inventory ledger (opening, in, out, closing stock) from all history'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            days = rebuild_inventory_ledger()
+        latest = InventoryLedger.objects.order_by('-date').values_list('date', flat=True).first()
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt inventory ledger for {days} dates'))
+        if latest:
+            self.stdout.write(f'  Closing stock on {latest}: {stock_as_of(latest)["closing_kg"]} kg')
@@ -0,0 +1,26 @@
+"""
+Management command to rebuild the daily report rollups from raw transactions
+Usage: python manage.py rebuild_rollups [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from reports.rollups import rebuild_rollups
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-date report rollups from purchases, sales, payments and expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=parse_date, help='First date to rebuild (default: all)')
+        parser.add_argument('--end-date', type=parse_date, help='Last date to rebuild (default: all)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            days = rebuild_rollups(options['start_date'], options['end_date'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt rollups for {days} dates'))
@@ -0,0 +1,205 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:20
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rollups(apps, schema_editor):
+    """Build the rollup tables from existing transactions"""
+    def money(expression):
+        return Coalesce(Sum(expression), Decimal('0.000'), output_field=DecimalField(max_digits=18, decimal_places=6))
+
+    def grouped(model_name, *fields, **aggregates):
+        queryset = apps.get_model('sales', model_name).objects.order_by()
+        return queryset.values('date', *fields).annotate(**aggregates)
+
+    summaries = {}
+    sources = [
+        grouped('Purchase', purchases_kg=money('kg'),
+                purchases_cost=money(F('kg') * F('cost_rate_per_kg')), purchases_count=Count('id')),
+        grouped('Sale', sales_kg=money('kg'), sales_revenue=money(F('kg') * F('sale_rate_per_kg')),
+                profit=money(F('kg') * (F('sale_rate_per_kg') - F('cost_rate_snapshot'))),
+                sales_count=Count('id'), cash_from_sales=money('amount_received')),
+        grouped('Payment', payments_total=money('amount'), payments_count=Count('id')),
+        grouped('Expense', expenses_total=money('amount')),
+    ]
+    for rows in sources:
+        for row in rows:
+            summaries.setdefault(row.pop('date'), {}).update(row)
+
+    DailySummary = apps.get_model('reports', 'DailySummary')
+    DailyExpenseTotal = apps.get_model('reports', 'DailyExpenseTotal')
+    DailyVehicleTotal = apps.get_model('reports', 'DailyVehicleTotal')
+    DailySummary.objects.bulk_create(
+        [DailySummary(date=day, **fields) for day, fields in summaries.items()], batch_size=1000
+    )
+    DailyExpenseTotal.objects.bulk_create([
+        DailyExpenseTotal(
+            date=row['date'], category=row['category'], amount=row['total_amount'], count=row['total_count'],
+        )
+        for row in grouped('Expense', 'category', total_amount=money('amount'), total_count=Count('id'))
+    ], batch_size=1000)
+    DailyVehicleTotal.objects.bulk_create([
+        DailyVehicleTotal(
+            date=row['date'], vehicle_number=row['vehicle_number'],
+            kg=row['total_kg'], cost=row['total_cost'], count=row['total_count'],
+        )
+        for row in grouped('Purchase', 'vehicle_number', total_kg=money('kg'),
+                           total_cost=money(F('kg') * F('cost_rate_per_kg')), total_count=Count('id'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("sales", "0008_payment_allocation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyExpenseTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("category", models.CharField(max_length=20)),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-date", "category"],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailySummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                (
+                    "purchases_kg",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "purchases_cost",
+                    models.DecimalField(
+                        decimal_places=6, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("purchases_count", models.IntegerField(default=0)),
+                (
+                    "sales_kg",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "sales_revenue",
+                    models.DecimalField(
+                        decimal_places=6, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                (
+                    "profit",
+                    models.DecimalField(
+                        decimal_places=6, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("sales_count", models.IntegerField(default=0)),
+                (
+                    "cash_from_sales",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                (
+                    "payments_total",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("payments_count", models.IntegerField(default=0)),
+                (
+                    "expenses_total",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "daily summaries",
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyVehicleTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("vehicle_number", models.CharField(max_length=50)),
+                (
+                    "kg",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "cost",
+                    models.DecimalField(
+                        decimal_places=6, default=Decimal("0.000"), max_digits=18
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-date", "vehicle_number"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyexpensetotal",
+            constraint=models.UniqueConstraint(
+                fields=("date", "category"), name="unique_daily_expense_category"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyvehicletotal",
+            constraint=models.UniqueConstraint(
+                fields=("date", "vehicle_number"), name="unique_daily_vehicle"
+            ),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:27
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_inventory_ledger(apps, schema_editor):
+    """Build the ledger from existing purchases and sales"""
+    from reports.inventory import grouped_kg, ledger_rows
+
+    InventoryLedger = apps.get_model('reports', 'InventoryLedger')
+    rows = ledger_rows(
+        grouped_kg(apps.get_model('sales', 'Purchase').objects.all()),
+        grouped_kg(apps.get_model('sales', 'Sale').objects.all()),
+    )
+    InventoryLedger.objects.bulk_create([InventoryLedger(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0001_daily_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryLedger",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                (
+                    "opening_kg",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "kg_in",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "kg_out",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                (
+                    "closing_kg",
+                    models.DecimalField(
+                        decimal_places=3, default=Decimal("0.000"), max_digits=14
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.RunPython(backfill_inventory_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0002_inventory_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailysummary",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,88 @@
 from django.db import models
+from decimal import Decimal
 
-# Create your models here.
+
+class DailySummary(models.Model):
+    """
+    Per-date rollup of all transactions, maintained incrementally on every
+    Purchase, Sale, Payment and Expense write (see ``reports.rollups``)
+    """
+    date = models.DateField(unique=True)
+    purchases_kg = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    purchases_cost = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0.000'))
+    purchases_count = models.IntegerField(default=0)
+    sales_kg = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    sales_revenue = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0.000'))
+    profit = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0.000'))
+    sales_count = models.IntegerField(default=0)
+    cash_from_sales = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0.000'))
+    payments_total = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0.000'))
+    payments_count = models.IntegerField(default=0)
+    expenses_total = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0.000'))
+    # Bumped by every write touching this date; keys the report cache (see ``reports.cache``)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily summaries'
+
+    def __str__(self):
+        return f"{self.date} - Sales: {self.sales_revenue}, Purchases: {self.purchases_cost}"
+
+
+class DailyExpenseTotal(models.Model):
+    """Per-date expense total for one category"""
+    date = models.DateField()
+    category = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0.000'))
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'category']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='unique_daily_expense_category'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.category}: {self.amount}"
+
+
+class DailyVehicleTotal(models.Model):
+    """Per-date purchase kg and cost for one vehicle"""
+    date = models.DateField()
+    vehicle_number = models.CharField(max_length=50)
+    kg = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    cost = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0.000'))
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'vehicle_number']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'vehicle_number'], name='unique_daily_vehicle'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.vehicle_number}: {self.kg}kg"
+
+
+class InventoryLedger(models.Model):
+    """
+    Perpetual stock ledger with one row per date that had a purchase or sale.
+
+    ``closing_kg`` of a row is the stock at the end of that date, so the
+    stock as of any date is the closing of the latest row on or before it
+    (see ``reports.inventory``).
+    """
+    date = models.DateField(unique=True)
+    opening_kg = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    kg_in = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    kg_out = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    closing_kg = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date} - Closing stock: {self.closing_kg}kg"
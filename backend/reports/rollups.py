@@ -0,0 +1,189 @@
+"""
+Incrementally maintained per-date rollups feeding the report endpoints.
+
+Every Purchase, Sale, Payment and Expense write is turned into per-date
+deltas which are applied with relative ``F()`` updates inside the write's
+transaction (see ``reports.signals``), together with the stock movements of
+the inventory ledger (``reports.inventory``). Those writes and CustomerDeduction
+writes also bump ``DailySummary.version`` of every date they touch, which
+keys the report cache (``reports.cache``). ``rebuild_rollups`` recomputes
+the tables from the raw transactions with grouped queries.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+from sales.models import Expense, Payment, Purchase, Sale
+
+from .inventory import apply_stock_change
+from .models import DailyExpenseTotal, DailySummary, DailyVehicleTotal
+
+ZERO = Decimal('0.000')
+
+
+def summary_contributions(model, values):
+    """Return the ``DailySummary`` field values one row of ``model`` adds to its date"""
+    if model is Purchase:
+        return {
+            'purchases_kg': values['kg'],
+            'purchases_cost': values['kg'] * values['cost_rate_per_kg'],
+            'purchases_count': 1,
+        }
+    if model is Sale:
+        return {
+            'sales_kg': values['kg'],
+            'sales_revenue': values['kg'] * values['sale_rate_per_kg'],
+            'profit': values['kg'] * (values['sale_rate_per_kg'] - values['cost_rate_snapshot']),
+            'sales_count': 1,
+            'cash_from_sales': values['amount_received'],
+        }
+    if model is Payment:
+        return {'payments_total': values['amount'], 'payments_count': 1}
+    if model is Expense:
+        return {'expenses_total': values['amount']}
+    return {}
+
+
+class RollupDelta:
+    """Accumulates per-date deltas for the rollup tables and applies them"""
+
+    def __init__(self):
+        self.touched = set()
+        self.summary = defaultdict(lambda: defaultdict(lambda: 0))
+        self.expenses = defaultdict(lambda: defaultdict(lambda: 0))
+        self.vehicles = defaultdict(lambda: defaultdict(lambda: 0))
+        self.stock = defaultdict(lambda: defaultdict(lambda: ZERO))
+
+    def add(self, model, values, sign):
+        day = values['date']
+        self.touched.add(day)
+        for field, amount in summary_contributions(model, values).items():
+            self.summary[day][field] += sign * amount
+        if model is Expense:
+            key = (day, values['category'])
+            self.expenses[key]['amount'] += sign * values['amount']
+            self.expenses[key]['count'] += sign
+        elif model is Purchase:
+            key = (day, values['vehicle_number'])
+            self.vehicles[key]['kg'] += sign * values['kg']
+            self.vehicles[key]['cost'] += sign * values['kg'] * values['cost_rate_per_kg']
+            self.vehicles[key]['count'] += sign
+            self.stock[day]['kg_in'] += sign * values['kg']
+        elif model is Sale:
+            self.stock[day]['kg_out'] += sign * values['kg']
+
+    def apply(self):
+        for day in self.touched:
+            self.summary[day]['version'] += 1
+        _apply(DailySummary, self.summary, lambda day: {'date': day})
+        _apply(DailyExpenseTotal, self.expenses, lambda key: {'date': key[0], 'category': key[1]})
+        _apply(DailyVehicleTotal, self.vehicles, lambda key: {'date': key[0], 'vehicle_number': key[1]})
+        for day, moves in self.stock.items():
+            apply_stock_change(day, **moves)
+
+
+def _apply(model, deltas, lookup):
+    for key, fields in deltas.items():
+        updates = {field: F(field) + amount for field, amount in fields.items() if amount}
+        if not updates:
+            continue
+        model.objects.bulk_create([model(**lookup(key))], ignore_conflicts=True)
+        model.objects.filter(**lookup(key)).update(**updates)
+
+
+def record_rollup_change(model, previous, current):
+    """
+    Apply the rollup change caused by one write.
+
+    ``previous`` is the row before the write and ``current`` the row after it;
+    either may be ``None`` for inserts and deletes respectively.
+    """
+    delta = RollupDelta()
+    if previous is not None:
+        delta.add(model, previous, -1)
+    if current is not None:
+        delta.add(model, current, 1)
+    delta.apply()
+
+
+def record_received_change(changes):
+    """Apply ``(sale_id, date, delta)`` changes of ``Sale.amount_received``"""
+    delta = RollupDelta()
+    for _, day, amount in changes:
+        delta.touched.add(day)
+        delta.summary[day]['cash_from_sales'] += amount
+    delta.apply()
+
+
+def _money(expression):
+    return Coalesce(Sum(expression), ZERO, output_field=DecimalField(max_digits=18, decimal_places=6))
+
+
+def _in_range(queryset, start_date, end_date):
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    return queryset.order_by()
+
+
+def rebuild_rollups(start_date=None, end_date=None):
+    """
+    Recompute all rollup rows in the date range from the raw transactions.
+
+    Each source table is read with one grouped query; existing rows in the
+    range are replaced. ``DailySummary.version`` only ever grows, so every
+    date keeps its row and gets its version bumped. Returns the number of
+    ``DailySummary`` rows written.
+    """
+    summaries = defaultdict(dict)
+    for day, version in _in_range(DailySummary.objects.all(), start_date, end_date).values_list('date', 'version'):
+        summaries[day]['version'] = version + 1
+    grouped = {
+        Purchase: dict(
+            purchases_kg=_money('kg'),
+            purchases_cost=_money(F('kg') * F('cost_rate_per_kg')),
+            purchases_count=Count('id'),
+        ),
+        Sale: dict(
+            sales_kg=_money('kg'),
+            sales_revenue=_money(F('kg') * F('sale_rate_per_kg')),
+            profit=_money(F('kg') * (F('sale_rate_per_kg') - F('cost_rate_snapshot'))),
+            sales_count=Count('id'),
+            cash_from_sales=_money('amount_received'),
+        ),
+        Payment: dict(payments_total=_money('amount'), payments_count=Count('id')),
+        Expense: dict(expenses_total=_money('amount')),
+    }
+    for model, aggregates in grouped.items():
+        for row in _in_range(model.objects.all(), start_date, end_date).values('date').annotate(**aggregates):
+            summaries[row.pop('date')].update(row)
+
+    expenses = [
+        DailyExpenseTotal(
+            date=row['date'], category=row['category'], amount=row['total_amount'], count=row['total_count'],
+        )
+        for row in _in_range(Expense.objects.all(), start_date, end_date)
+        .values('date', 'category')
+        .annotate(total_amount=_money('amount'), total_count=Count('id'))
+    ]
+    vehicles = [
+        DailyVehicleTotal(
+            date=row['date'], vehicle_number=row['vehicle_number'],
+            kg=row['total_kg'], cost=row['total_cost'], count=row['total_count'],
+        )
+        for row in _in_range(Purchase.objects.all(), start_date, end_date)
+        .values('date', 'vehicle_number')
+        .annotate(total_kg=_money('kg'), total_cost=_money(F('kg') * F('cost_rate_per_kg')), total_count=Count('id'))
+    ]
+
+    for model in (DailySummary, DailyExpenseTotal, DailyVehicleTotal):
+        _in_range(model.objects.all(), start_date, end_date).delete()
+    DailySummary.objects.bulk_create(
+        [DailySummary(date=day, **{'version': 1, **fields}) for day, fields in summaries.items()], batch_size=1000
+    )
+    DailyExpenseTotal.objects.bulk_create(expenses, batch_size=1000)
+    DailyVehicleTotal.objects.bulk_create(vehicles, batch_size=1000)
+    return len(summaries)
@@ -0,0 +1,38 @@
+"""
+Signal receivers keeping the report rollups in step with transaction writes.
+
+They run inside the write's transaction (see ``sales.models.TrackedModel``),
+so a rollup never disagrees with the rows it summarizes.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from sales.models import CustomerDeduction, Expense, Payment, Purchase, Sale
+from sales.signals import deleted_values, received_changed, row_values
+
+from .rollups import record_received_change, record_rollup_change
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=CustomerDeduction)
+def rollup_source_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_rollup_change(sender, getattr(instance, '_previous', None), row_values(instance))
+
+
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=CustomerDeduction)
+def rollup_source_deleted(sender, instance, **kwargs):
+    record_rollup_change(sender, deleted_values(instance), None)
+
+
+@receiver(received_changed, sender=Sale)
+def rollup_received_changed(sender, changes, **kwargs):
+    record_received_change(changes)
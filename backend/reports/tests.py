@@ -1,3 +1,312 @@
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from reports.cache import report_cache
+from reports.inventory import stock_as_of
+from reports.models import DailyExpenseTotal, DailySummary, DailyVehicleTotal, InventoryLedger
+from reports.views import SUMMARY_FIELDS
+from sales.models import Customer, Expense, Payment, Purchase, Sale, Supplier
+
+
+class ReportQueryCountTests(TestCase):
+    """Each report runs a small fixed number of queries however many rows are in range"""
+
+    start = date(2024, 1, 1)
+    end = date(2024, 1, 31)
+
+    def setUp(self):
+        report_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reporter', password='secret'))
+        self.supplier = Supplier.objects.create(name='Supplier')
+        self.customers = [Customer.objects.create(name=f'Customer {i}') for i in range(3)]
+        self.created = 0
+
+    def add_rows(self, count):
+        for i in range(self.created, self.created + count):
+            day = self.start + timedelta(days=i % 28)
+            customer = self.customers[i % len(self.customers)]
+            Purchase.objects.create(
+                date=day, supplier=self.supplier, vehicle_number=f'V{i % 2}',
+                kg=Decimal('50.000'), cost_rate_per_kg=Decimal('200.000'),
+            )
+            Sale.objects.create(
+                date=day, customer=customer, kg=Decimal('10.500'),
+                sale_rate_per_kg=Decimal('260.000'), cost_rate_snapshot=Decimal('200.000'),
+                amount_received=Decimal('100.000'),
+            )
+            Payment.objects.create(date=day, customer=customer, amount=Decimal('500.000'))
+            Expense.objects.create(
+                date=day, category=Expense.EXPENSE_CATEGORIES[i % 5][0], amount=Decimal('75.000'),
+            )
+        self.created += count
+
+    def report_urls(self):
+        period = {'start_date': str(self.start), 'end_date': str(self.end)}
+        return [
+            ('/api/reports/daily/', {'date': str(self.start)}),
+            ('/api/reports/period/', period),
+            ('/api/reports/expenses/', period),
+            ('/api/reports/expenses/', {**period, 'category': 'feed'}),
+            ('/api/reports/sales-analytics/', period),
+            (f'/api/customers/{self.customers[0].pk}/report/', period),
+        ]
+
+    def count_queries(self):
+        counts = {}
+        for url, params in self.report_urls():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url, tuple(params.items())] = len(queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(5)
+        small = self.count_queries()
+        self.add_rows(60)
+        large = self.count_queries()
+
+        self.assertEqual(small, large)
+        for key, count in large.items():
+            self.assertLessEqual(count, 5, key)
+
+
+class ReportCacheTests(TestCase):
+    """Report results are reused until a write touches a date in their range"""
+
+    def setUp(self):
+        report_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reporter', password='secret'))
+        self.customer = Customer.objects.create(name='Customer')
+        self.sale(date(2024, 1, 10))
+        self.params = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+
+    def sale(self, day):
+        return Sale.objects.create(
+            date=day, customer=self.customer, kg=Decimal('10.000'),
+            sale_rate_per_kg=Decimal('250.000'), cost_rate_snapshot=Decimal('200.000'),
+        )
+
+    def get_period(self):
+        return self.client.get('/api/reports/period/', self.params)
+
+    def test_hit_until_write_in_range(self):
+        self.assertEqual(self.get_period()['X-Report-Cache'], 'miss')
+        self.assertEqual(self.get_period()['X-Report-Cache'], 'hit')
+
+        # A write on a date outside the range keeps the cached result
+        self.sale(date(2024, 2, 5))
+        response = self.get_period()
+        self.assertEqual(response['X-Report-Cache'], 'hit')
+        self.assertEqual(response.data['sales_kg'], Decimal('10.000'))
+        # but running balances are always current
+        self.assertEqual(response.data['customer_breakdown']['Customer']['running_balance'], Decimal('5000'))
+
+        self.sale(date(2024, 1, 20))
+        response = self.get_period()
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        self.assertEqual(response.data['sales_kg'], Decimal('20.000'))
+
+        stats = self.client.get('/api/reports/cache-stats/').data
+        self.assertEqual(stats['endpoints']['period'], {'hits': 2, 'misses': 2})
+
+
+class RollupTests(TestCase):
+    """Per-date rollups stay equal to the raw aggregates through edits, moves and deletes"""
+
+    def rollups(self):
+        summaries = {
+            row.pop('date'): row
+            for row in DailySummary.objects.values('date', *SUMMARY_FIELDS)
+            if any(row[field] for field in SUMMARY_FIELDS)
+        }
+        expenses = set(DailyExpenseTotal.objects.filter(count__gt=0).values_list('date', 'category', 'amount', 'count'))
+        vehicles = set(
+            DailyVehicleTotal.objects.filter(count__gt=0).values_list('date', 'vehicle_number', 'kg', 'cost', 'count')
+        )
+        return summaries, expenses, vehicles
+
+    def assertRollupsMatchTransactions(self):
+        maintained = self.rollups()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(maintained, self.rollups())
+
+    def test_rollups_follow_edits_moves_and_deletes(self):
+        first, second = date(2024, 1, 1), date(2024, 1, 2)
+        customer = Customer.objects.create(name='Customer')
+        supplier = Supplier.objects.create(name='Supplier')
+        purchase = Purchase.objects.create(
+            date=first, supplier=supplier, vehicle_number='V1', kg=Decimal('100'), cost_rate_per_kg=Decimal('200')
+        )
+        sale = Sale.objects.create(
+            date=first, customer=customer, kg=Decimal('40'), sale_rate_per_kg=Decimal('250'),
+            cost_rate_snapshot=Decimal('200'), amount_received=Decimal('1000')
+        )
+        payment = Payment.objects.create(date=first, customer=customer, amount=Decimal('3000'))
+        payment.allocate_to_sales()
+        expense = Expense.objects.create(date=first, category='feed', amount=Decimal('75'))
+        self.assertRollupsMatchTransactions()
+        summary = DailySummary.objects.get(date=first)
+        self.assertEqual(
+            (summary.purchases_kg, summary.sales_revenue, summary.profit, summary.cash_from_sales),
+            (100, 10000, 2000, 4000),
+        )
+
+        for row in (purchase, sale, payment, expense):
+            row.date = second
+        purchase.vehicle_number = 'V2'
+        purchase.save()
+        sale.kg = Decimal('30')
+        sale.save()
+        payment.save()
+        expense.category = 'petrol'
+        expense.save()
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(self.rollups()[0][second]['sales_kg'], 30)
+        self.assertNotIn(first, self.rollups()[0])
+
+        Purchase.objects.create(
+            date=second, supplier=supplier, vehicle_number='V2', kg=Decimal('10'), cost_rate_per_kg=Decimal('200')
+        )
+        for row in (sale, payment, expense, purchase):
+            row.delete()
+        self.assertRollupsMatchTransactions()
+        summaries, expenses, vehicles = self.rollups()
+        self.assertEqual(list(summaries), [second])
+        self.assertEqual(summaries[second]['purchases_kg'], 10)
+        self.assertEqual((expenses, vehicles), (set(), {(second, 'V2', 10, 2000, 1)}))
+
+
+class InventoryLedgerTests(TestCase):
+    """The stock ledger stays a correct running total whatever order rows are written in"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Customer')
+        self.supplier = Supplier.objects.create(name='Supplier')
+
+    def purchase(self, day, kg):
+        return Purchase.objects.create(
+            date=date(2024, 1, day), supplier=self.supplier, kg=Decimal(kg), cost_rate_per_kg=Decimal('200')
+        )
+
+    def sale(self, day, kg):
+        return Sale.objects.create(
+            date=date(2024, 1, day), customer=self.customer, kg=Decimal(kg),
+            sale_rate_per_kg=Decimal('250'), cost_rate_snapshot=Decimal('200')
+        )
+
+    def ledger(self):
+        return list(InventoryLedger.objects.order_by('date').values_list(
+            'date', 'opening_kg', 'kg_in', 'kg_out', 'closing_kg'
+        ))
+
+    def test_back_dated_writes_shift_later_dates(self):
+        self.purchase(10, 100)
+        self.sale(12, 30)
+        self.purchase(5, 50)
+        sale = self.sale(11, 20)
+        self.assertEqual([row[4] for row in self.ledger()], [50, 150, 130, 100])
+
+        sale.date = date(2024, 1, 3)
+        sale.save()
+        self.sale(3, 5).delete()
+        maintained = self.ledger()
+        self.assertEqual([row[4] for row in maintained], [-20, 30, 130, 130, 100])
+
+        # Dates whose only row moved away keep an empty row until a rebuild
+        call_command('rebuild_inventory', stdout=io.StringIO())
+        self.assertEqual(self.ledger(), [row for row in maintained if row[2] or row[3]])
+
+    def test_stock_as_of(self):
+        zero = {'opening_kg': 0, 'kg_in': 0, 'kg_out': 0, 'closing_kg': 0}
+        self.assertEqual(stock_as_of(date(2024, 1, 1)), zero)
+        self.purchase(10, 100)
+        self.sale(10, 40)
+        self.sale(12, 10)
+
+        self.assertEqual(stock_as_of(date(2024, 1, 9)), zero)
+        self.assertEqual(
+            stock_as_of(date(2024, 1, 10)), {'opening_kg': 0, 'kg_in': 100, 'kg_out': 40, 'closing_kg': 60}
+        )
+        self.assertEqual(stock_as_of(date(2024, 1, 11)), {**zero, 'opening_kg': 60, 'closing_kg': 60})
+        self.assertEqual(stock_as_of(date(2024, 2, 1)), {**zero, 'opening_kg': 50, 'closing_kg': 50})
+
+
+class PeriodReportSortTests(TestCase):
+    """The period report's customer breakdown can be sorted and cut to the top N"""
+
+    def setUp(self):
+        report_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reporter', password='secret'))
+        for name, kg, rate in [('Bilal', 30, 200), ('Ahmad', 10, 300), ('Zubair', 20, 260)]:
+            customer = Customer.objects.create(name=name)
+            Sale.objects.create(
+                date=date(2024, 1, 5), customer=customer, kg=Decimal(kg),
+                sale_rate_per_kg=Decimal(rate), cost_rate_snapshot=Decimal('190')
+            )
+        self.params = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+
+    def breakdown(self, **params):
+        response = self.client.get('/api/reports/period/', {**self.params, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return list(response.data['customer_breakdown'])
+
+    def test_sort_and_top_n(self):
+        self.assertEqual(self.breakdown(), ['Ahmad', 'Bilal', 'Zubair'])
+        self.assertEqual(self.breakdown(sort='-kg'), ['Bilal', 'Zubair', 'Ahmad'])
+        self.assertEqual(self.breakdown(sort='-revenue', top_n=2), ['Bilal', 'Zubair'])
+        self.assertEqual(self.breakdown(sort='profit', top_n=1), ['Bilal'])
+        self.assertEqual(self.breakdown(sort='-running_balance', top_n=1), ['Bilal'])
+
+    def test_invalid_sort_and_top_n_are_rejected(self):
+        for params in ({'sort': 'phone'}, {'top_n': '0'}, {'top_n': 'all'}):
+            response = self.client.get('/api/reports/period/', {**self.params, **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+class SalesAnalyticsGranularityTests(TestCase):
+    """Sales analytics buckets by day, week or month, keyed by the bucket's first date"""
+
+    def setUp(self):
+        report_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reporter', password='secret'))
+        customer = Customer.objects.create(name='Customer')
+        # Tuesday 30 Jan, Wednesday 31 Jan and Thursday 1 Feb share a week but not a month
+        for day in (date(2024, 1, 30), date(2024, 1, 31), date(2024, 2, 1), date(2024, 2, 12)):
+            Sale.objects.create(
+                date=day, customer=customer, kg=Decimal('10'),
+                sale_rate_per_kg=Decimal('250'), cost_rate_snapshot=Decimal('200')
+            )
+
+    def breakdown(self, granularity):
+        response = self.client.get('/api/reports/sales-analytics/', {
+            'start_date': '2024-01-01', 'end_date': '2024-02-29', 'granularity': granularity,
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['granularity'], granularity)
+        return {key: row['sales_count'] for key, row in response.data['breakdown'].items()}
+
+    def test_bucket_keys(self):
+        self.assertEqual(
+            self.breakdown('day'), {'2024-01-30': 1, '2024-01-31': 1, '2024-02-01': 1, '2024-02-12': 1}
+        )
+        self.assertEqual(self.breakdown('week'), {'2024-01-29': 3, '2024-02-12': 1})
+        self.assertEqual(self.breakdown('month'), {'2024-01-01': 2, '2024-02-01': 2})
 
-# Create your tests here.
+    def test_unknown_granularity_is_rejected(self):
+        response = self.client.get('/api/reports/sales-analytics/', {
+            'start_date': '2024-01-01', 'end_date': '2024-02-29', 'granularity': 'year',
+        })
+        self.assertEqual(response.status_code, 400)
@@ -1,10 +1,46 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Q
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
 from decimal import Decimal
 from datetime import datetime, date
-from sales.models import Purchase, Sale, Payment, Expense, Customer
+from sales.models import Sale, Expense, Customer
+from .cache import cache_stats, cached_report
+from .inventory import stock_as_of
+from .models import DailySummary, DailyExpenseTotal, DailyVehicleTotal
+
+SUMMARY_FIELDS = [
+    'purchases_kg', 'purchases_cost', 'purchases_count', 'sales_kg', 'sales_revenue',
+    'profit', 'sales_count', 'cash_from_sales', 'payments_total', 'payments_count',
+    'expenses_total',
+]
+
+
+def decimal_sum(expression, **extra):
+    """``Sum`` that yields zero instead of ``NULL`` for empty groups"""
+    return Coalesce(
+        Sum(expression, **extra), Decimal('0.000'),
+        output_field=DecimalField(max_digits=18, decimal_places=6),
+    )
+
+
+# Generated columns on Sale
+SALE_REVENUE = F('total_amount')
+SALE_PROFIT = F('profit')
+
+
+def summary_totals(start_date, end_date):
+    """Sum the daily rollups over a date range with a single query"""
+    totals = DailySummary.objects.filter(date__gte=start_date, date__lte=end_date).aggregate(
+        **{field: Sum(field) for field in SUMMARY_FIELDS}
+    )
+    return {field: value if value is not None else Decimal('0.000') for field, value in totals.items()}
+
+
+def report_response(data, hit):
+    """Report response telling whether it came from the report cache"""
+    return Response(data, headers={'X-Report-Cache': 'hit' if hit else 'miss'})
 
 
 class DailyReportView(APIView):
@@ -18,69 +54,72 @@ class DailyReportView(APIView):
         else:
             report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
         
-        # Purchases
-        purchases = Purchase.objects.filter(date=report_date)
-        purchases_kg = purchases.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        purchases_cost = sum([p.total_cost for p in purchases]) or Decimal('0.000')
+        data, hit = cached_report(
+            'daily', {'date': report_date}, lambda: self.build_report(report_date),
+            start_date=report_date, end_date=report_date,
+        )
         
+        # Inventory as of the report date depends on all earlier dates, so it is never cached
+        stock = stock_as_of(report_date)
+        data['opening_stock'] = stock['opening_kg']
+        data['closing_stock'] = stock['closing_kg']
+        return report_response(data, hit)
+    
+    def build_report(self, report_date):
+        summary = DailySummary.objects.filter(date=report_date).first() or DailySummary(date=report_date)
+
         # Purchases by vehicle
         purchases_by_vehicle = {}
-        for purchase in purchases:
-            vehicle = purchase.vehicle_number or 'Not Specified'
+        for vehicle_total in DailyVehicleTotal.objects.filter(date=report_date, count__gt=0):
+            vehicle = vehicle_total.vehicle_number or 'Not Specified'
             if vehicle not in purchases_by_vehicle:
                 purchases_by_vehicle[vehicle] = {
                     'kg': Decimal('0.000'),
                     'cost': Decimal('0.000'),
                     'count': 0
                 }
-            purchases_by_vehicle[vehicle]['kg'] += purchase.kg
-            purchases_by_vehicle[vehicle]['cost'] += purchase.total_cost
-            purchases_by_vehicle[vehicle]['count'] += 1
+            purchases_by_vehicle[vehicle]['kg'] += vehicle_total.kg
+            purchases_by_vehicle[vehicle]['cost'] += vehicle_total.cost
+            purchases_by_vehicle[vehicle]['count'] += vehicle_total.count
         
         # Sales
-        sales = Sale.objects.filter(date=report_date)
-        sales_kg = sales.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        sales_revenue = sum([s.total_amount for s in sales]) or Decimal('0.000')
-        cash_from_sales = sales.aggregate(total=Sum('amount_received'))['total'] or Decimal('0.000')
-        borrow = sales_revenue - cash_from_sales
-        profit = sum([s.profit for s in sales]) or Decimal('0.000')
-        
-        # Payments (cash received separately from sales)
-        payments = Payment.objects.filter(date=report_date)
-        cash_from_payments = payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.000')
+        borrow = summary.sales_revenue - summary.cash_from_sales
         
         # Total cash received = cash from sales + payments received
-        total_cash_received = cash_from_sales + cash_from_payments
+        total_cash_received = summary.cash_from_sales + summary.payments_total
         
-        # Expenses
-        expenses = Expense.objects.filter(date=report_date)
-        expenses_total = expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0.000')
-        
-        # Inventory
-        total_purchases = Purchase.objects.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        total_sales = Sale.objects.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        closing_stock = total_purchases - total_sales
-        
-        return Response({
+        return {
             'date': report_date,
-            'purchases_kg': purchases_kg,
-            'purchases_cost': purchases_cost,
+            'purchases_kg': summary.purchases_kg,
+            'purchases_cost': summary.purchases_cost,
             'purchases_by_vehicle': purchases_by_vehicle,
-            'sales_kg': sales_kg,
-            'sales_revenue': sales_revenue,
-            'profit': profit,
+            'sales_kg': summary.sales_kg,
+            'sales_revenue': summary.sales_revenue,
+            'profit': summary.profit,
             'cash_received': total_cash_received,
-            'cash_from_sales': cash_from_sales,
-            'cash_from_payments': cash_from_payments,
+            'cash_from_sales': summary.cash_from_sales,
+            'cash_from_payments': summary.payments_total,
             'borrow': borrow,
-            'expenses_total': expenses_total,
-            'closing_stock': closing_stock,
-        })
+            'expenses_total': summary.expenses_total,
+        }
 
 
 class PeriodReportView(APIView):
-    """Generate report for a date range"""
+    """
+    Generate report for a date range.
+
+    ``customer_breakdown`` can be ordered with ``sort`` (one of
+    ``CUSTOMER_SORT_KEYS``, prefix ``-`` for descending; default ``name``)
+    and limited to the first ``top_n`` customers.
+    """
     permission_classes = [IsAuthenticated]
+    CUSTOMER_SORT_KEYS = {
+        'name': 'customer__name',
+        'kg': 'total_kg',
+        'revenue': 'revenue',
+        'profit': 'total_profit',
+        'running_balance': 'customer__current_balance',
+    }
     
     def get(self, request):
         start_date = request.query_params.get('start_date')
@@ -92,58 +131,85 @@ class PeriodReportView(APIView):
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Purchases
-        purchases = Purchase.objects.filter(date__gte=start_date, date__lte=end_date)
-        purchases_kg = purchases.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        purchases_cost = sum([p.total_cost for p in purchases]) or Decimal('0.000')
+        sort = request.query_params.get('sort', 'name')
+        descending = sort.startswith('-')
+        if sort.lstrip('-') not in self.CUSTOMER_SORT_KEYS:
+            return Response({
+                'error': f"sort must be one of: {', '.join(self.CUSTOMER_SORT_KEYS)} (prefix '-' for descending)"
+            }, status=400)
+        order_field = self.CUSTOMER_SORT_KEYS[sort.lstrip('-')]
         
-        # Sales
-        sales = Sale.objects.filter(date__gte=start_date, date__lte=end_date)
-        sales_kg = sales.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        sales_revenue = sum([s.total_amount for s in sales]) or Decimal('0.000')
-        cash_received = sales.aggregate(total=Sum('amount_received'))['total'] or Decimal('0.000')
-        borrow = sales_revenue - cash_received
-        profit = sum([s.profit for s in sales]) or Decimal('0.000')
+        top_n = request.query_params.get('top_n')
+        if top_n is not None:
+            if not top_n.isdigit() or int(top_n) < 1:
+                return Response({'error': 'top_n must be a positive integer'}, status=400)
+            top_n = int(top_n)
+        
+        def build():
+            return self.build_report(start_date, end_date, f"{'-' if descending else ''}{order_field}", top_n)
+        
+        if order_field == 'customer__current_balance':
+            # Ranking by live balances cannot be reused across writes outside the range
+            data, hit = build(), False
+        else:
+            data, hit = cached_report(
+                'period', {'start_date': start_date, 'end_date': end_date, 'sort': sort, 'top_n': top_n},
+                build, start_date=start_date, end_date=end_date, customers=True,
+            )
+        
+        if hit:
+            # Running balances cover all history, refresh them in one query
+            breakdown = data['customer_breakdown']
+            balances = Customer.objects.filter(name__in=list(breakdown)).values_list('name', 'current_balance')
+            for name, balance in balances:
+                breakdown[name]['running_balance'] = balance
+        return report_response(data, hit)
+    
+    def build_report(self, start_date, end_date, ordering, top_n):
+        totals = summary_totals(start_date, end_date)
+        borrow = totals['sales_revenue'] - totals['cash_from_sales']
         
         # Expenses
-        expenses = Expense.objects.filter(date__gte=start_date, date__lte=end_date)
-        expenses_total = expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0.000')
-        expenses_by_category = {}
-        for category, _ in Expense.EXPENSE_CATEGORIES:
-            cat_total = expenses.filter(category=category).aggregate(
-                total=Sum('amount')
-            )['total'] or Decimal('0.000')
-            expenses_by_category[category] = cat_total
-        
-        # Customer breakdown with running balance
+        expenses_by_category = {category: Decimal('0.000') for category, _ in Expense.EXPENSE_CATEGORIES}
+        category_totals = DailyExpenseTotal.objects.filter(
+            date__gte=start_date, date__lte=end_date
+        ).values('category').annotate(total=Sum('amount'))
+        for row in category_totals:
+            expenses_by_category[row['category']] = row['total']
+        
+        # Customer breakdown with running balance, one grouped query
+        customer_rows = Sale.objects.filter(
+            date__gte=start_date, date__lte=end_date
+        ).order_by().values('customer__name', 'customer__current_balance').annotate(
+            total_kg=decimal_sum('kg'),
+            revenue=decimal_sum(SALE_REVENUE),
+            total_profit=decimal_sum(SALE_PROFIT),
+        ).order_by(ordering, 'customer__name')
+        if top_n is not None:
+            customer_rows = customer_rows[:top_n]
         customer_sales = {}
-        for sale in sales:
-            cust_name = sale.customer.name
-            if cust_name not in customer_sales:
-                customer_sales[cust_name] = {
-                    'kg': Decimal('0.000'),
-                    'revenue': Decimal('0.000'),
-                    'profit': Decimal('0.000'),
-                    'running_balance': sale.customer.running_balance,  # Grand closing balance
-                }
-            customer_sales[cust_name]['kg'] += sale.kg
-            customer_sales[cust_name]['revenue'] += sale.total_amount
-            customer_sales[cust_name]['profit'] += sale.profit
-        
-        return Response({
+        for row in customer_rows:
+            customer_sales[row['customer__name']] = {
+                'kg': row['total_kg'],
+                'revenue': row['revenue'],
+                'profit': row['total_profit'],
+                'running_balance': row['customer__current_balance'],  # Grand closing balance
+            }
+        
+        return {
             'start_date': start_date,
             'end_date': end_date,
-            'purchases_kg': purchases_kg,
-            'purchases_cost': purchases_cost,
-            'sales_kg': sales_kg,
-            'sales_revenue': sales_revenue,
-            'profit': profit,
-            'cash_received': cash_received,
+            'purchases_kg': totals['purchases_kg'],
+            'purchases_cost': totals['purchases_cost'],
+            'sales_kg': totals['sales_kg'],
+            'sales_revenue': totals['sales_revenue'],
+            'profit': totals['profit'],
+            'cash_received': totals['cash_from_sales'],
             'borrow': borrow,
-            'expenses_total': expenses_total,
+            'expenses_total': totals['expenses_total'],
             'expenses_by_category': expenses_by_category,
             'customer_breakdown': customer_sales,
-        })
+        }
 
 
 class ExpenseReportView(APIView):
@@ -155,45 +221,56 @@ class ExpenseReportView(APIView):
         end_date = request.query_params.get('end_date')
         category = request.query_params.get('category')
         
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        
+        data, hit = cached_report(
+            'expenses', {'start_date': start_date, 'end_date': end_date, 'category': category},
+            lambda: self.build_report(start_date, end_date, category),
+            start_date=start_date, end_date=end_date,
+        )
+        return report_response(data, hit)
+    
+    def build_report(self, start_date, end_date, category):
         expenses = Expense.objects.all()
         
         if start_date:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             expenses = expenses.filter(date__gte=start_date)
         
         if end_date:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
             expenses = expenses.filter(date__lte=end_date)
         
         if category:
             expenses = expenses.filter(category=category)
         
-        total_amount = expenses.aggregate(total=Sum('amount'))['total'] or Decimal('0.000')
-        
-        # Breakdown by category
-        by_category = {}
-        for cat, _ in Expense.EXPENSE_CATEGORIES:
-            cat_total = expenses.filter(category=cat).aggregate(
-                total=Sum('amount')
-            )['total'] or Decimal('0.000')
-            by_category[cat] = cat_total
+        # Total and breakdown by category in one pass with filtered aggregates
+        totals = expenses.aggregate(
+            total=decimal_sum('amount'),
+            **{
+                f'category_{cat}': decimal_sum('amount', filter=Q(category=cat))
+                for cat, _ in Expense.EXPENSE_CATEGORIES
+            },
+        )
+        total_amount = totals['total']
+        by_category = {cat: totals[f'category_{cat}'] for cat, _ in Expense.EXPENSE_CATEGORIES}
         
         # Breakdown by date
-        by_date = {}
-        for expense in expenses:
-            date_str = str(expense.date)
-            if date_str not in by_date:
-                by_date[date_str] = Decimal('0.000')
-            by_date[date_str] += expense.amount
-        
-        return Response({
+        by_date = {
+            str(row['date']): row['total']
+            for row in expenses.order_by('-date').values('date').annotate(total=Sum('amount'))
+        }
+        
+        return {
             'start_date': start_date,
             'end_date': end_date,
             'category': category,
             'total_amount': total_amount,
             'by_category': by_category,
             'by_date': by_date,
-        })
+        }
 
 
 class CustomerReportView(APIView):
@@ -209,46 +286,73 @@ class CustomerReportView(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+        
+        data, hit = cached_report(
+            'customer', {'customer_id': customer.id, 'start_date': start_date, 'end_date': end_date},
+            lambda: self.build_report(customer, start_date, end_date),
+            start_date=start_date, end_date=end_date,
+        )
+        
+        # The customer row is read fresh for every request
+        data['customer'] = {
+            'id': customer.id,
+            'name': customer.name,
+            'opening_balance': customer.opening_balance,
+            'running_balance': customer.running_balance,
+        }
+        return report_response(data, hit)
+    
+    def build_report(self, customer, start_date, end_date):
         sales = customer.sales.all()
         payments = customer.payments.all()
         
         if start_date:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             sales = sales.filter(date__gte=start_date)
             payments = payments.filter(date__gte=start_date)
         
         if end_date:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
             sales = sales.filter(date__lte=end_date)
             payments = payments.filter(date__lte=end_date)
         
-        total_sales_amount = sum([s.total_amount for s in sales]) or Decimal('0.000')
-        total_payments = payments.aggregate(total=Sum('amount'))['total'] or Decimal('0.000')
-        total_kg = sales.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
+        sale_totals = sales.aggregate(amount=decimal_sum(SALE_REVENUE), kg=decimal_sum('kg'))
+        total_sales_amount = sale_totals['amount']
+        total_payments = payments.aggregate(total=decimal_sum('amount'))['total']
+        total_kg = sale_totals['kg']
         
-        return Response({
-            'customer': {
-                'id': customer.id,
-                'name': customer.name,
-                'opening_balance': customer.opening_balance,
-                'running_balance': customer.running_balance,
-            },
+        return {
             'start_date': start_date,
             'end_date': end_date,
             'total_sales_amount': total_sales_amount,
             'total_payments': total_payments,
             'total_kg': total_kg,
             'outstanding': total_sales_amount - total_payments,
-        })
+        }
 
 
 class SalesAnalyticsView(APIView):
-    """Generate sales analytics for selected dates - total kgs sold and sale price"""
+    """
+    Generate sales analytics for selected dates - total kgs sold and sale price.
+
+    ``granularity`` (``day``, ``week`` or ``month``; default ``day``) sets the
+    bucket size of the breakdown. Buckets are keyed by their first date.
+    """
     permission_classes = [IsAuthenticated]
+    GRANULARITIES = {
+        'day': None,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+    TOP_CUSTOMERS = 10
     
     def get(self, request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
+        granularity = request.query_params.get('granularity', 'day')
         
         if not start_date or not end_date:
             return Response({
@@ -263,15 +367,39 @@ class SalesAnalyticsView(APIView):
                 'error': 'Invalid date format. Use YYYY-MM-DD'
             }, status=400)
         
-        # Get sales within date range
-        sales = Sale.objects.filter(date__gte=start_date, date__lte=end_date)
-        
-        if not sales.exists():
+        if granularity not in self.GRANULARITIES:
             return Response({
+                'error': f"granularity must be one of: {', '.join(self.GRANULARITIES)}"
+            }, status=400)
+        
+        data, hit = cached_report(
+            'sales-analytics', {'start_date': start_date, 'end_date': end_date, 'granularity': granularity},
+            lambda: self.build_report(start_date, end_date, granularity),
+            start_date=start_date, end_date=end_date, customers=True,
+        )
+        return report_response(data, hit)
+    
+    def build_report(self, start_date, end_date, granularity):
+        # Breakdown per bucket, grouped in the database over the daily rollups
+        trunc = self.GRANULARITIES[granularity]
+        bucket = trunc('date') if trunc else F('date')
+        buckets = DailySummary.objects.filter(
+            date__gte=start_date, date__lte=end_date, sales_count__gt=0
+        ).order_by().annotate(bucket=bucket).values('bucket').annotate(
+            total_kgs=Sum('sales_kg'),
+            total_sale_price=Sum('sales_revenue'),
+            sales_count=Sum('sales_count'),
+            total_profit=Sum('profit'),
+        ).order_by('bucket')
+        breakdown = {str(row.pop('bucket')): row for row in buckets}
+        
+        if not breakdown:
+            return {
                 'date_range': {
                     'start_date': start_date,
                     'end_date': end_date,
                 },
+                'granularity': granularity,
                 'analytics': {
                     'total_kgs_sold': Decimal('0.000'),
                     'total_sale_price': Decimal('0.000'),
@@ -280,68 +408,51 @@ class SalesAnalyticsView(APIView):
                     'total_profit': Decimal('0.000'),
                 },
                 'message': 'No sales found for the selected date range'
-            })
+            }
         
         # Calculate analytics
-        total_kgs_sold = sales.aggregate(total=Sum('kg'))['total'] or Decimal('0.000')
-        total_sale_price = sum([s.total_amount for s in sales]) or Decimal('0.000')
-        total_sales_count = sales.count()
-        total_profit = sum([s.profit for s in sales]) or Decimal('0.000')
+        totals = summary_totals(start_date, end_date)
+        total_kgs_sold = totals['sales_kg']
+        total_sale_price = totals['sales_revenue']
         
         # Calculate average rate per kg
         average_rate_per_kg = Decimal('0.000')
         if total_kgs_sold > 0:
             average_rate_per_kg = total_sale_price / total_kgs_sold
         
-        # Daily breakdown
-        daily_breakdown = {}
-        for sale in sales:
-            date_str = str(sale.date)
-            if date_str not in daily_breakdown:
-                daily_breakdown[date_str] = {
-                    'total_kgs': Decimal('0.000'),
-                    'total_sale_price': Decimal('0.000'),
-                    'sales_count': 0,
-                    'total_profit': Decimal('0.000'),
-                }
-            daily_breakdown[date_str]['total_kgs'] += sale.kg
-            daily_breakdown[date_str]['total_sale_price'] += sale.total_amount
-            daily_breakdown[date_str]['sales_count'] += 1
-            daily_breakdown[date_str]['total_profit'] += sale.profit
-        
-        # Top customers by sales volume
-        customer_breakdown = {}
-        for sale in sales:
-            customer_name = sale.customer.name
-            if customer_name not in customer_breakdown:
-                customer_breakdown[customer_name] = {
-                    'total_kgs': Decimal('0.000'),
-                    'total_sale_price': Decimal('0.000'),
-                    'sales_count': 0,
-                }
-            customer_breakdown[customer_name]['total_kgs'] += sale.kg
-            customer_breakdown[customer_name]['total_sale_price'] += sale.total_amount
-            customer_breakdown[customer_name]['sales_count'] += 1
-        
-        # Sort top customers by total sale price
-        top_customers = sorted(
-            customer_breakdown.items(), 
-            key=lambda x: x[1]['total_sale_price'], 
-            reverse=True
-        )[:10]  # Top 10 customers
-        
-        return Response({
+        # Top customers by sales volume, ranked and limited in the database
+        top_customers = Sale.objects.filter(
+            date__gte=start_date, date__lte=end_date
+        ).order_by().values('customer__name').annotate(
+            total_kgs=decimal_sum('kg'),
+            total_sale_price=decimal_sum(SALE_REVENUE),
+            sales_count=Count('id'),
+        ).order_by('-total_sale_price', 'customer__name')[:self.TOP_CUSTOMERS]
+        
+        response = {
             'date_range': {
                 'start_date': start_date,
                 'end_date': end_date,
             },
+            'granularity': granularity,
             'analytics': {
                 'total_kgs_sold': total_kgs_sold,
                 'total_sale_price': total_sale_price,
-                'total_sales_count': total_sales_count,
+                'total_sales_count': totals['sales_count'],
                 'average_rate_per_kg': average_rate_per_kg,
-                'total_profit': total_profit,
+                'total_profit': totals['profit'],
             },
-            'daily_breakdown': daily_breakdown,
-            'top_customers': dict(top_customers),
-        })
+            'breakdown': breakdown,
+            'top_customers': {row.pop('customer__name'): row for row in top_customers},
+        }
+        if granularity == 'day':
+            response['daily_breakdown'] = breakdown
+        return response
+
+
+class ReportCacheStatsView(APIView):
+    """Hit and miss counts of the report cache"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        return Response(cache_stats())
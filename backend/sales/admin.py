@@ -1,13 +1,17 @@
 from django.contrib import admin
-from .models import Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment
+from .models import (
+    Customer, DailyRate, Purchase, Sale, Payment, PaymentAllocation, Expense, CustomerDeduction,
+    Supplier, SupplierPayment
+)
 
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
-    list_display = ['name', 'phone', 'opening_balance', 'is_active', 'created_at']
+    list_display = ['name', 'phone', 'opening_balance', 'current_balance', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'phone', 'address']
     ordering = ['name']
+    readonly_fields = ['current_balance']
 
 
 @admin.register(DailyRate)
@@ -19,10 +23,11 @@ class DailyRateAdmin(admin.ModelAdmin):
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
-    list_display = ['name', 'phone', 'opening_balance', 'is_active', 'created_at']
+    list_display = ['name', 'phone', 'opening_balance', 'current_balance', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'phone']
     ordering = ['name']
+    readonly_fields = ['current_balance']
 
 
 @admin.register(Purchase)
@@ -48,6 +53,14 @@ class SaleAdmin(admin.ModelAdmin):
     autocomplete_fields = ['customer']
 
 
+class PaymentAllocationInline(admin.TabularInline):
+    model = PaymentAllocation
+    fields = ['sale', 'amount', 'created_at']
+    readonly_fields = ['sale', 'amount', 'created_at']
+    extra = 0
+    can_delete = False
+
+
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ['date', 'customer', 'amount', 'method', 'auto_allocated', 'created_at']
@@ -56,6 +69,7 @@ class PaymentAdmin(admin.ModelAdmin):
     ordering = ['-date', '-created_at']
     autocomplete_fields = ['customer']
     readonly_fields = ['auto_allocated']
+    inlines = [PaymentAllocationInline]
 
 
 @admin.register(Expense)
@@ -0,0 +1,354 @@
+"""
+Set-based allocation of customer payments to outstanding sales.
+
+Every allocation is recorded as a ``PaymentAllocation`` row, so edits and
+deletes only reverse and reapply the allocations they affect:
+
+* only sales that still have something outstanding are read (served by the
+  ``sale_outstanding_idx`` partial index),
+* the customer's row is locked so concurrent payments from several workers
+  are serialized,
+* every touched sale is written back with a single bulk update.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import signals
+from .models import Customer, Payment, PaymentAllocation, Sale
+
+OUTSTANDING = Q(borrow_amount__gt=0)
+CENT = Decimal('0.001')
+ZERO = Decimal('0.000')
+
+
+def _lock_customers(*customer_ids):
+    """Lock the customers in primary key order, the order the balance updates use"""
+    list(
+        Customer.objects.select_for_update().filter(pk__in=set(customer_ids)).order_by('pk').values_list('pk')
+    )
+
+
+def _save_received(changes):
+    """
+    Add each ``(sale, delta)`` to the sale's ``amount_received``.
+
+    All sales are written back with one bulk update, which sends no model
+    signals, so ``received_changed`` is sent for the derived data instead.
+    """
+    if not changes:
+        return
+    now = timezone.now()
+    sales = []
+    for sale, delta in changes:
+        sale.amount_received += delta
+        sale.updated_at = now
+        sales.append(sale)
+    Sale.objects.bulk_update(sales, ['amount_received', 'updated_at'])
+    signals.received_changed.send(
+        sender=Sale, changes=[(sale.pk, sale.date, delta) for sale, delta in changes]
+    )
+
+
+def outstanding_sales(customer_id, payment_date):
+    """
+    Lock and return a customer's outstanding sales in allocation order.
+
+    Sales from the payment's own date come first, then the oldest.
+    """
+    return list(
+        Sale.objects.select_for_update()
+        .filter(OUTSTANDING, customer_id=customer_id)
+        .order_by(
+            Case(When(date=payment_date, then=Value(0)), default=Value(1), output_field=IntegerField()),
+            'date', 'created_at', 'id',
+        )
+        .only('id', 'date', 'created_at', 'kg', 'sale_rate_per_kg', 'amount_received')
+    )
+
+
+def plan_allocations(amount, sales):
+    """
+    Spread ``amount`` greedily over ``sales`` in the given order.
+
+    Returns a list of ``(sale, allocation)`` pairs; sales are not modified.
+    Only plain model fields are used, so historical models work as well.
+    """
+    plan = []
+    remaining = amount
+    for sale in sales:
+        if remaining <= 0:
+            break
+        owed = (sale.kg * sale.sale_rate_per_kg - sale.amount_received).quantize(CENT, rounding=ROUND_HALF_UP)
+        if owed <= 0:
+            continue
+        allocation = min(remaining, owed)
+        plan.append((sale, allocation))
+        remaining -= allocation
+    return plan
+
+
+def allocated_amount(payment_id):
+    """Total of a payment that is currently allocated to sales"""
+    return PaymentAllocation.objects.filter(payment_id=payment_id).aggregate(
+        total=Sum('amount')
+    )['total'] or ZERO
+
+
+def allocate_payment(payment):
+    """
+    Allocate the unallocated remainder of ``payment`` to outstanding sales.
+
+    Safe to call concurrently: the customer row and the payment row are
+    locked for the duration, so the same money is never allocated twice.
+    """
+    with transaction.atomic():
+        _lock_customers(payment.customer_id)
+        locked = (
+            Payment.objects.select_for_update()
+            .filter(pk=payment.pk)
+            .values('customer_id', 'date', 'amount')
+            .first()
+        )
+        if locked is None:
+            return []
+
+        remaining = locked['amount'] - allocated_amount(payment.pk)
+        plan = []
+        if remaining > 0:
+            plan = plan_allocations(remaining, outstanding_sales(locked['customer_id'], locked['date']))
+
+        existing = {
+            allocation.sale_id: allocation
+            for allocation in PaymentAllocation.objects.filter(
+                payment_id=payment.pk, sale_id__in=[sale.pk for sale, _ in plan]
+            )
+        }
+        new_rows, grown_rows = [], []
+        for sale, amount in plan:
+            if sale.pk in existing:
+                existing[sale.pk].amount += amount
+                grown_rows.append(existing[sale.pk])
+            else:
+                new_rows.append(PaymentAllocation(payment_id=payment.pk, sale_id=sale.pk, amount=amount))
+
+        _save_received(plan)
+        PaymentAllocation.objects.bulk_create(new_rows)
+        if grown_rows:
+            for row in grown_rows:
+                row.updated_at = timezone.now()
+            PaymentAllocation.objects.bulk_update(grown_rows, ['amount', 'updated_at'])
+
+        payment.auto_allocated = True
+        payment.updated_at = timezone.now()
+        Payment.objects.filter(pk=payment.pk).update(auto_allocated=True, updated_at=payment.updated_at)
+        return plan
+
+
+def release_allocations(allocations, limit=None, adjust_received=True):
+    """
+    Undo ``allocations`` (newest first) up to ``limit`` in total.
+
+    Allocation rows are shrunk or deleted and, if ``adjust_received``, the
+    released amounts are taken back off the sales' ``amount_received``.
+    Returns the set of payment ids that got money back.
+    """
+    released = defaultdict(lambda: ZERO)
+    payment_ids = set()
+    to_delete, to_shrink = [], []
+    remaining = limit
+    for allocation in allocations.select_for_update().order_by('-created_at', '-id'):
+        if remaining is not None and remaining <= 0:
+            break
+        amount = allocation.amount if remaining is None else min(allocation.amount, remaining)
+        if amount == allocation.amount:
+            to_delete.append(allocation.pk)
+        else:
+            allocation.amount -= amount
+            allocation.updated_at = timezone.now()
+            to_shrink.append(allocation)
+        released[allocation.sale_id] += amount
+        payment_ids.add(allocation.payment_id)
+        if remaining is not None:
+            remaining -= amount
+
+    PaymentAllocation.objects.filter(pk__in=to_delete).delete()
+    if to_shrink:
+        PaymentAllocation.objects.bulk_update(to_shrink, ['amount', 'updated_at'])
+
+    if adjust_received and released:
+        sales = Sale.objects.select_for_update().filter(pk__in=released).only('id', 'date', 'amount_received')
+        _save_received([
+            (sale, -min(released[sale.pk], sale.amount_received)) for sale in sales
+        ])
+    return payment_ids
+
+
+def reverse_payment(payment_id):
+    """Take every allocation of a payment back off its sales"""
+    return release_allocations(PaymentAllocation.objects.filter(payment_id=payment_id))
+
+
+def allocate_free_credit(customer_id, exclude_payment_ids=()):
+    """Allocate the unallocated remainder of a customer's allocated payments"""
+    payments = (
+        Payment.objects.filter(customer_id=customer_id, auto_allocated=True)
+        .exclude(pk__in=exclude_payment_ids)
+        .annotate(allocated=Coalesce(
+            Sum('allocations__amount'), Value(ZERO), output_field=DecimalField(max_digits=12, decimal_places=3)
+        ))
+        .filter(amount__gt=F('allocated'))
+        .order_by('date', 'created_at', 'id')
+    )
+    for payment in payments:
+        allocate_payment(payment)
+
+
+def payment_changed(payment, previous):
+    """
+    Reapply an allocated payment after an edit.
+
+    A change of customer or date reverses and reallocates the whole payment;
+    an amount change only releases (newest first) or allocates the difference.
+    """
+    if previous is None or not previous['auto_allocated']:
+        return
+    with transaction.atomic():
+        _lock_customers(payment.customer_id, previous['customer_id'])
+        if (previous['customer_id'], previous['date']) != (payment.customer_id, payment.date):
+            reverse_payment(payment.pk)
+            allocate_payment(payment)
+            allocate_free_credit(previous['customer_id'], exclude_payment_ids=[payment.pk])
+        elif previous['amount'] != payment.amount:
+            over = allocated_amount(payment.pk) - payment.amount
+            if over > 0:
+                release_allocations(PaymentAllocation.objects.filter(payment_id=payment.pk), limit=over)
+                allocate_free_credit(payment.customer_id, exclude_payment_ids=[payment.pk])
+            else:
+                allocate_payment(payment)
+
+
+def sale_changed(sale, previous):
+    """
+    Keep allocations consistent after a sale edit.
+
+    If the sale moved to another customer, or now holds more than its total,
+    the affected allocations are released and those payments reallocated to
+    other sales; if its total grew, unallocated credit is applied again.
+    """
+    if previous is None:
+        return
+    allocations = PaymentAllocation.objects.filter(sale_id=sale.pk)
+    total = sale.kg * sale.sale_rate_per_kg
+    previous_total = previous['kg'] * previous['sale_rate_per_kg']
+
+    with transaction.atomic():
+        _lock_customers(sale.customer_id, previous['customer_id'])
+        if previous['customer_id'] != sale.customer_id:
+            payment_ids = release_allocations(allocations)
+        else:
+            payment_ids = set()
+            if sale.amount_received > total:
+                payment_ids |= release_allocations(allocations, limit=sale.amount_received - total)
+                sale.refresh_from_db(fields=['amount_received'])
+            # amount_received lowered by hand below what payments put in
+            over = (allocations.aggregate(total=Sum('amount'))['total'] or ZERO) - sale.amount_received
+            if over > 0:
+                payment_ids |= release_allocations(allocations, limit=over, adjust_received=False)
+
+        for payment in Payment.objects.filter(pk__in=payment_ids).order_by('date', 'created_at', 'id'):
+            allocate_payment(payment)
+        if previous['customer_id'] != sale.customer_id or total > previous_total:
+            allocate_free_credit(sale.customer_id, exclude_payment_ids=payment_ids)
+        sale.refresh_from_db(fields=['amount_received'])
+
+
+def sale_deleted(payment_ids):
+    """Reallocate the money a deleted sale held for ``payment_ids``"""
+    for payment in Payment.objects.filter(pk__in=payment_ids).order_by('date', 'created_at', 'id'):
+        allocate_payment(payment)
+
+
+def _allocation_order(sales, payment_date, by_date, cursor):
+    """Yield sales same-date first, then oldest, skipping the settled prefix"""
+    yield from by_date.get(payment_date, ())
+    for index in range(cursor[0], len(sales)):
+        sale = sales[index]
+        if sale.amount_received >= sale.kg * sale.sale_rate_per_kg and index == cursor[0]:
+            cursor[0] += 1
+            continue
+        if sale.date != payment_date:
+            yield sale
+
+
+def rebuild_customer_allocations(customer_id, sale_model=Sale, payment_model=Payment,
+                                 allocation_model=PaymentAllocation, adopt_legacy=False):
+    """
+    Replay all allocated payments of one customer from scratch.
+
+    Each sale keeps its directly received cash (``amount_received`` minus
+    recorded allocations) and every ``auto_allocated`` payment is applied
+    again in date order. With ``adopt_legacy``, the amounts of allocated
+    payments that have no allocation rows yet are first taken back off the
+    oldest sales, since they were added to ``amount_received`` before
+    allocations were recorded.
+
+    The model arguments allow running this from a data migration, in which
+    case ``received_changed`` is not sent.
+    """
+    sales = list(
+        sale_model.objects.select_for_update()
+        .filter(customer_id=customer_id)
+        .order_by('date', 'created_at', 'id')
+    )
+    payments = list(
+        payment_model.objects.filter(customer_id=customer_id, auto_allocated=True)
+        .order_by('date', 'created_at', 'id')
+    )
+    existing = allocation_model.objects.filter(payment__customer_id=customer_id)
+    recorded = defaultdict(lambda: ZERO)
+    recorded_payments = set()
+    for sale_id, payment_id, amount in existing.values_list('sale_id', 'payment_id', 'amount'):
+        recorded[sale_id] += amount
+        recorded_payments.add(payment_id)
+
+    original = {sale.pk: sale.amount_received for sale in sales}
+    for sale in sales:
+        sale.amount_received = max(sale.amount_received - recorded[sale.pk], ZERO)
+
+    if adopt_legacy:
+        legacy = sum((p.amount for p in payments if p.pk not in recorded_payments), ZERO)
+        for sale in sales:
+            if legacy <= 0:
+                break
+            taken = min(sale.amount_received, legacy)
+            sale.amount_received -= taken
+            legacy -= taken
+
+    by_date = defaultdict(list)
+    for sale in sales:
+        by_date[sale.date].append(sale)
+    cursor = [0]
+    rows = []
+    for payment in payments:
+        plan = plan_allocations(payment.amount, _allocation_order(sales, payment.date, by_date, cursor))
+        for sale, amount in plan:
+            sale.amount_received += amount
+            rows.append(allocation_model(payment_id=payment.pk, sale_id=sale.pk, amount=amount))
+
+    now = timezone.now()
+    changed = [sale for sale in sales if sale.amount_received != original[sale.pk]]
+    for sale in changed:
+        sale.updated_at = now
+    sale_model.objects.bulk_update(changed, ['amount_received', 'updated_at'], batch_size=1000)
+    if sale_model is Sale:
+        signals.received_changed.send(sender=Sale, changes=[
+            (sale.pk, sale.date, sale.amount_received - original[sale.pk]) for sale in changed
+        ])
+    existing.delete()
+    allocation_model.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
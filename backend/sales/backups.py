@@ -0,0 +1,419 @@
+"""
+Helpers shared by the backup and restore management commands.
+
+JSON backups may be written plain, gzip- or zstd-compressed; the
+compression is chosen from (and detected by) the file extension.
+``zstd`` needs the optional ``zstandard`` package.
+
+Full JSON backups record the latest ``updated_at`` of every table and the
+latest ``DeletionLog`` entry as high-water ``marks`` in their header. An
+incremental backup holds only the rows changed after the previous backup's
+marks, plus the ids deleted since, and ``merge_backups`` folds a full backup
+and its incrementals back into one restorable snapshot.
+
+Each backup directory keeps a ``manifest.json`` listing its backup files,
+newest first. ``backup_data`` adds to it as it writes files, so listing
+backups reads one small file instead of scanning and stat-ing the
+directory. A missing manifest is rebuilt from a scan; delete it after
+removing backup files by hand.
+"""
+import gzip
+import io
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from django.core import serializers
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Customer, CustomerDeduction, DailyRate, DeletionLog, Expense, Payment, PaymentAllocation, Purchase, Sale,
+    Supplier, SupplierPayment
+)
+
+# Section name and model of every table in a JSON backup, in write order.
+# Referenced tables come first, so a restore can insert in this order.
+JSON_SECTIONS = [
+    ('customers', Customer),
+    ('suppliers', Supplier),
+    ('daily_rates', DailyRate),
+    ('purchases', Purchase),
+    ('sales', Sale),
+    ('payments', Payment),
+    ('payment_allocations', PaymentAllocation),
+    ('customer_deductions', CustomerDeduction),
+    ('supplier_payments', SupplierPayment),
+    ('expenses', Expense),
+]
+
+# Tables reported by ``table_counts``
+STATISTICS_MODELS = {
+    'customers': Customer,
+    'suppliers': Supplier,
+    'daily_rates': DailyRate,
+    'purchases': Purchase,
+    'sales': Sale,
+    'payments': Payment,
+    'supplier_payments': SupplierPayment,
+    'customer_deductions': CustomerDeduction,
+    'expenses': Expense,
+}
+
+COMPRESSION_EXTENSIONS = {
+    'none': '.json',
+    'gzip': '.json.gz',
+    'zstd': '.json.zst',
+}
+COMPRESSION_SUFFIXES = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+# Native snapshot file extension per database vendor
+NATIVE_EXTENSIONS = {
+    'sqlite': '.sqlite3',
+    'postgresql': '.pgdata.sql',
+}
+
+# Rows read per database round trip while serializing
+CHUNK_SIZE = 2000
+# Characters read per call while parsing a backup
+READ_SIZE = 1 << 16
+
+# Incremental backups start this long before the previous marks, so rows
+# written by transactions still open when the marks were read are not missed
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+
+BACKUP_PREFIX = 'ahmad_poultry_backup_'
+MANIFEST_NAME = 'manifest.json'
+# Entries kept in a manifest
+MANIFEST_LIMIT = 100
+
+
+class BackupError(Exception):
+    """Raised when a backup file cannot be written or read"""
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise BackupError('zstd compression needs the zstandard package (pip install zstandard)')
+    return zstandard
+
+
+def open_binary_writer(path, compression='none'):
+    """Open ``path`` for writing bytes with the given compression"""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        compressor = _zstandard().ZstdCompressor()
+        return compressor.stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+
+def open_binary_reader(path):
+    """Open a file for reading bytes, decompressing by extension"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        decompressor = _zstandard().ZstdDecompressor()
+        return io.BufferedReader(decompressor.stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def open_backup_writer(path, compression='none'):
+    """Open ``path`` for writing text with the given compression"""
+    return io.TextIOWrapper(open_binary_writer(path, compression), encoding='utf-8')
+
+
+def open_backup_reader(path):
+    """Open a backup file for reading text, decompressing by extension"""
+    return io.TextIOWrapper(open_binary_reader(path), encoding='utf-8')
+
+
+def table_counts(models=None):
+    """
+    Row counts of ``models`` (default ``STATISTICS_MODELS``) from one query.
+
+    Each table is counted in a scalar subquery of a single SELECT, so all
+    counts come from one round trip and one snapshot.
+    """
+    models = models or STATISTICS_MODELS
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        f'(SELECT COUNT(*) FROM {quote(model._meta.db_table)}) AS {quote(name)}'
+        for name, model in models.items()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {columns}')
+        return dict(zip(models, cursor.fetchone()))
+
+
+def high_water_marks():
+    """
+    Latest ``updated_at`` of every backed-up table and latest deletion.
+
+    Keyed by section (``deletions`` for the delete log), as ISO strings or
+    ``None`` for empty tables.
+    """
+    marks = {section: model.objects.aggregate(mark=Max('updated_at'))['mark'] for section, model in JSON_SECTIONS}
+    marks['deletions'] = DeletionLog.objects.aggregate(mark=Max('deleted_at'))['mark']
+    return {key: mark.isoformat() if mark else None for key, mark in marks.items()}
+
+
+def changed_since(marks):
+    """
+    Querysets of the rows changed and ids deleted after ``marks``.
+
+    Returns ``(changed, deleted)``: ``changed`` maps each section to its
+    queryset, ``deleted`` maps sections to lists of deleted ids. Each mark
+    is moved back by ``INCREMENTAL_OVERLAP``; a missing mark selects all.
+    """
+    def since(key):
+        mark = marks.get(key)
+        return datetime.fromisoformat(mark) - INCREMENTAL_OVERLAP if mark else None
+
+    changed = {}
+    for section, model in JSON_SECTIONS:
+        queryset = model.objects.all()
+        if since(section):
+            queryset = queryset.filter(updated_at__gt=since(section))
+        changed[section] = queryset
+
+    deletions = DeletionLog.objects.all()
+    if since('deletions'):
+        deletions = deletions.filter(deleted_at__gt=since('deletions'))
+    deleted = {}
+    for section, object_id in deletions.order_by('id').values_list('section', 'object_id').iterator():
+        deleted.setdefault(section, []).append(object_id)
+    return changed, deleted
+
+
+class _Counter:
+    """Passes items through while counting them, calling ``on_chunk(count)`` every ``CHUNK_SIZE`` items"""
+
+    def __init__(self, iterable, on_chunk=None):
+        self.iterable = iterable
+        self.on_chunk = on_chunk
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            if self.on_chunk and not self.count % CHUNK_SIZE:
+                self.on_chunk(self.count)
+            yield item
+
+
+def write_json_records(stream, queryset, on_chunk=None):
+    """
+    Serialize ``queryset`` as a JSON array onto ``stream``.
+
+    Rows are read with a chunked iterator and written one by one, so memory
+    use does not depend on the table size. ``on_chunk`` is called with the
+    running count every ``CHUNK_SIZE`` records. Returns the number of records.
+    """
+    rows = _Counter(queryset.order_by('pk').iterator(chunk_size=CHUNK_SIZE), on_chunk)
+    serializers.get_serializer('json')().serialize(rows, stream=stream, ensure_ascii=False)
+    return rows.count
+
+
+def write_json_dicts(stream, records):
+    """Write already serialized ``records`` as a JSON array onto ``stream``; returns the count"""
+    count = 0
+    stream.write('[')
+    for record in records:
+        if count:
+            stream.write(', ')
+        stream.write(json.dumps(record, ensure_ascii=False))
+        count += 1
+    stream.write(']')
+    return count
+
+
+class BackupReader:
+    """
+    Streaming reader of a JSON backup.
+
+    ``sections()`` yields ``(section, records)`` for each table in the
+    file, ``records`` being an iterator of the serialized records. Only the
+    record being decoded is held in memory. The other top-level values
+    (timestamps, counts) are collected in ``metadata`` as they are passed;
+    ``counts`` follows the data, so it is available once all sections have
+    been read.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+        self.metadata = {}
+
+    def _fill(self):
+        chunk = self.stream.read(READ_SIZE)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """The next non-whitespace character, without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise BackupError('Unexpected end of backup file')
+
+    def _expect(self, *characters):
+        character = self._peek()
+        if character not in characters:
+            raise BackupError(f'Malformed backup file: expected {" or ".join(characters)}, found {character!r}')
+        self.pos += 1
+        return character
+
+    def _value(self):
+        """Decode the next complete JSON value"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise BackupError('Malformed backup file')
+            # A value running to the end of the buffer may continue past it
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _keys(self):
+        """Keys of the object being read; the caller reads each value"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            yield key
+            if self._expect(',', '}') == '}':
+                return
+
+    def _items(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(',', ']') == ']':
+                return
+
+    def header(self):
+        """The top-level values written before the data, reading no records"""
+        for key in self._keys():
+            if key == 'data':
+                break
+            self.metadata[key] = self._value()
+        return self.metadata
+
+    def sections(self):
+        for key in self._keys():
+            if key != 'data':
+                self.metadata[key] = self._value()
+                continue
+            for section in self._keys():
+                records = self._items()
+                yield section, records
+                # Skip whatever the caller left unread
+                for _ in records:
+                    pass
+
+
+def read_backup_header(path):
+    """Header values (timestamps, kind, marks) of the JSON backup at ``path``"""
+    with open_backup_reader(path) as stream:
+        return BackupReader(stream).header()
+
+
+_manifest_lock = threading.RLock()
+
+
+def backup_format(filename):
+    """``'excel'``, ``'json'`` or ``'native'`` for a backup file name, else ``None``"""
+    if not filename.startswith(BACKUP_PREFIX):
+        return None
+    if filename.endswith('.xlsx'):
+        return 'excel'
+    if any(filename.endswith(extension) for extension in COMPRESSION_EXTENSIONS.values()):
+        return 'json'
+    if any(
+        filename.endswith(extension + suffix)
+        for extension in NATIVE_EXTENSIONS.values() for suffix in COMPRESSION_SUFFIXES.values()
+    ):
+        return 'native'
+    return None
+
+
+def manifest_entry(path):
+    """Manifest entry describing the backup file at ``path``"""
+    stat = os.stat(path)
+    filename = os.path.basename(path)
+    return {
+        'filename': filename,
+        'format': backup_format(filename),
+        'size': stat.st_size,
+        'created_at': timezone.make_aware(datetime.fromtimestamp(stat.st_mtime)).isoformat(),
+    }
+
+
+def scan_backups(directory):
+    """Manifest entries of every backup file in ``directory``, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    entries = [
+        manifest_entry(os.path.join(directory, filename))
+        for filename in os.listdir(directory) if backup_format(filename)
+    ]
+    entries.sort(key=lambda entry: (entry['created_at'], entry['filename']), reverse=True)
+    return entries[:MANIFEST_LIMIT]
+
+
+def _write_manifest(directory, entries):
+    path = os.path.join(directory, MANIFEST_NAME)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as stream:
+        json.dump(entries, stream)
+    os.replace(temporary, path)
+
+
+def read_manifest(directory):
+    """Backup files listed in ``directory``'s manifest, newest first"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        pass
+    entries = scan_backups(directory)
+    if os.path.isdir(directory):
+        with _manifest_lock:
+            _write_manifest(directory, entries)
+    return entries
+
+
+def record_backups(directory, paths):
+    """Add the files at ``paths`` to the top of ``directory``'s manifest"""
+    added = [manifest_entry(path) for path in paths]
+    names = {entry['filename'] for entry in added}
+    with _manifest_lock:
+        entries = [entry for entry in read_manifest(directory) if entry['filename'] not in names]
+        _write_manifest(directory, (added + entries)[:MANIFEST_LIMIT])
@@ -0,0 +1,185 @@
+"""
+Materialized customer and supplier balances.
+
+``Customer.current_balance`` holds ``opening_balance + sales - payments -
+deductions`` and ``Supplier.current_balance`` holds ``opening_balance +
+purchases - amount paid in purchases - supplier payments``. Both are kept in
+step by the receivers in ``sales.signals`` using relative ``F()`` updates,
+and can be rebuilt or verified in bulk with ``python manage.py
+rebuild_balances``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Customer, CustomerDeduction, Payment, Purchase, Sale, Supplier, SupplierPayment
+
+BALANCE_FIELD = DecimalField(max_digits=18, decimal_places=6)
+ZERO = Decimal('0.000')
+
+
+def balance_contributions(model, values):
+    """
+    Yield ``(owner_model, owner_id, amount)`` for a row of ``model``.
+
+    ``values`` is a dict of the row's attribute values. Sales and purchases
+    increase the balance, payments and deductions reduce it.
+    """
+    if model is Sale:
+        yield Customer, values['customer_id'], values['kg'] * values['sale_rate_per_kg']
+    elif model in (Payment, CustomerDeduction):
+        yield Customer, values['customer_id'], -values['amount']
+    elif model is Purchase:
+        if values['supplier_id'] is not None:
+            yield (
+                Supplier,
+                values['supplier_id'],
+                values['kg'] * values['cost_rate_per_kg'] - values['amount_paid'],
+            )
+    elif model is SupplierPayment:
+        yield Supplier, values['supplier_id'], -values['amount']
+
+
+def apply_balance_deltas(deltas):
+    """
+    Add each ``{(owner_model, owner_id): delta}`` to the stored balances.
+
+    Owners are updated in one global order, model label then primary key, so
+    two writes moving rows between the same owners lock them in the same
+    order and cannot deadlock.
+    """
+    for (owner_model, owner_id), delta in sorted(deltas.items(), key=lambda item: (item[0][0]._meta.label, item[0][1])):
+        if delta:
+            owner_model.objects.filter(pk=owner_id).update(
+                current_balance=F('current_balance') + delta
+            )
+
+
+def record_balance_change(model, previous, current):
+    """
+    Apply the balance change caused by one write.
+
+    ``previous`` is the row before the write and ``current`` the row after it;
+    either may be ``None`` for inserts and deletes respectively.
+    """
+    deltas = defaultdict(lambda: ZERO)
+    if previous is not None:
+        for owner_model, owner_id, amount in balance_contributions(model, previous):
+            deltas[owner_model, owner_id] -= Decimal(amount)
+    if current is not None:
+        for owner_model, owner_id, amount in balance_contributions(model, current):
+            deltas[owner_model, owner_id] += Decimal(amount)
+    apply_balance_deltas(deltas)
+
+
+def _owner_total(queryset, owner_field, expression):
+    """Correlated subquery summing ``expression`` per owner"""
+    subquery = (
+        queryset.filter(**{owner_field: OuterRef('pk')})
+        .order_by()
+        .values(owner_field)
+        .annotate(total=Sum(expression, output_field=BALANCE_FIELD))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery), Value(ZERO), output_field=BALANCE_FIELD)
+
+
+def customer_movement(**filters):
+    """Expression for the net change of a customer's balance from the transactions matching ``filters``"""
+    return (
+        _owner_total(Sale.objects.filter(**filters), 'customer', F('total_amount'))
+        - _owner_total(Payment.objects.filter(**filters), 'customer', F('amount'))
+        - _owner_total(CustomerDeduction.objects.filter(**filters), 'customer', F('amount'))
+    )
+
+
+def computed_customer_balance():
+    """Expression recomputing a customer's balance from the raw transactions"""
+    return F('opening_balance') + customer_movement()
+
+
+def computed_supplier_balance():
+    """Expression recomputing a supplier's payable balance from the raw transactions"""
+    return (
+        F('opening_balance')
+        + _owner_total(Purchase.objects.all(), 'supplier', F('kg') * F('cost_rate_per_kg'))
+        - _owner_total(Purchase.objects.all(), 'supplier', F('amount_paid'))
+        - _owner_total(SupplierPayment.objects.all(), 'supplier', F('amount'))
+    )
+
+
+def rebuild_customer_balances(queryset=None):
+    """Recompute stored customer balances with a single set-based UPDATE"""
+    if queryset is None:
+        queryset = Customer.objects.all()
+    return queryset.update(current_balance=computed_customer_balance())
+
+
+def rebuild_supplier_balances(queryset=None):
+    """Recompute stored supplier balances with a single set-based UPDATE"""
+    if queryset is None:
+        queryset = Supplier.objects.all()
+    return queryset.update(current_balance=computed_supplier_balance())
+
+
+def _mismatches(queryset, expression, tolerance):
+    mismatches = []
+    for owner in queryset.annotate(computed_balance=expression).iterator(chunk_size=2000):
+        if abs(owner.current_balance - owner.computed_balance) > tolerance:
+            mismatches.append((owner, owner.current_balance, owner.computed_balance))
+    return mismatches
+
+
+def customer_balance_mismatches(queryset=None, tolerance=Decimal('0.001')):
+    """
+    Compare stored customer balances against a full recomputation.
+
+    Returns a list of ``(customer, stored, computed)`` tuples for every
+    customer whose balances differ by more than ``tolerance``.
+    """
+    if queryset is None:
+        queryset = Customer.objects.all()
+    return _mismatches(queryset, computed_customer_balance(), tolerance)
+
+
+def supplier_balance_mismatches(queryset=None, tolerance=Decimal('0.001')):
+    """Like ``customer_balance_mismatches`` for supplier payable balances"""
+    if queryset is None:
+        queryset = Supplier.objects.all()
+    return _mismatches(queryset, computed_supplier_balance(), tolerance)
+
+
+class BalanceLoader:
+    """
+    Request-scoped batch reader of stored customer and supplier balances.
+
+    Serializers ``prime`` it with the owner ids of every row on a page before
+    rendering any of them. The first ``get`` for a model then reads the
+    balances of all ids collected for that model with one query, and each id
+    is read at most once per request. Ids asked for without priming are
+    batched the same way on the next miss.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(set)
+        self.loaded = defaultdict(dict)
+
+    def prime(self, model, ids):
+        loaded = self.loaded[model]
+        self.pending[model].update(pk for pk in ids if pk is not None and pk not in loaded)
+
+    def put(self, model, pk, balance):
+        """Record a balance already read with the row, e.g. through ``select_related``"""
+        self.loaded[model][pk] = balance
+        self.pending[model].discard(pk)
+
+    def get(self, model, pk):
+        if pk is None:
+            return None
+        loaded = self.loaded[model]
+        if pk not in loaded:
+            ids = self.pending.pop(model, set()) | {pk}
+            loaded.update(model.objects.filter(pk__in=ids).values_list('pk', 'current_balance'))
+        return loaded.get(pk)
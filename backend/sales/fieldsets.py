@@ -0,0 +1,80 @@
+"""
+Sparse fieldsets for the API serializers.
+
+On GET requests ``?fields=a,b`` keeps only the named fields of each row and
+``?omit=a,b`` drops them; ``id`` is always kept. The same names can be
+passed to a serializer as ``fields``/``omit`` keyword arguments. Dropped
+fields are removed from the serializer before anything is serialized, so
+the properties, method fields and related rows behind them are never read.
+
+``Meta.field_sources`` on a serializer maps each field that is not a plain
+model field to the model fields it reads. ``SparseQuerysetMixin`` uses it
+to narrow list, retrieve and export querysets with ``only()`` and to follow
+just the relations the kept fields need. The paginator's ``keyset_fields``
+are always loaded so cursors can still be built.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+SPARSE_ACTIONS = ('list', 'retrieve', 'export')
+
+
+def field_names(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [name.strip() for name in value if name.strip()]
+
+
+class SparseFieldsMixin:
+    """Serializer mixin applying ``fields``/``omit`` to its declared fields"""
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None and request.method in SAFE_METHODS:
+            fields = fields or request.query_params.get('fields')
+            omit = omit or request.query_params.get('omit')
+        fields, omit = field_names(fields), field_names(omit)
+        self.sparse = bool(fields or omit)
+        if not self.sparse:
+            return
+
+        unknown = sorted(set(fields + omit) - set(self.fields))
+        if unknown:
+            raise ValidationError({
+                'fields': f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.fields)}"
+            })
+        keep = set(fields or self.fields) - set(omit) | {'id'}
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    def only_fields(self):
+        """Model field paths the kept fields read, for ``QuerySet.only()``"""
+        sources = getattr(self.Meta, 'field_sources', {})
+        paths = set()
+        for name, field in self.fields.items():
+            paths.update(sources.get(name, [field.source.replace('.', '__')]))
+        return sorted(paths)
+
+
+class SparseQuerysetMixin:
+    """ViewSet mixin loading only the columns a sparse fieldset serializes"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS or self.action not in SPARSE_ACTIONS:
+            return queryset
+        serializer = self.get_serializer()
+        if not getattr(serializer, 'sparse', False):
+            return queryset
+
+        paths = serializer.only_fields() + list(getattr(self.pagination_class, 'keyset_fields', ()))
+        related = sorted({path.split('__')[0] for path in paths if '__' in path})
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*paths, *related)
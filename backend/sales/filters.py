@@ -2,6 +2,13 @@ from django_filters import rest_framework as filters
 from .models import Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment
 
 
+def filter_outstanding(queryset, name, value):
+    """Rows with (``true``) or without (``false``) an amount still owed"""
+    if value:
+        return queryset.filter(borrow_amount__gt=0)
+    return queryset.filter(borrow_amount__lte=0)
+
+
 class CustomerFilter(filters.FilterSet):
     """Filter for Customer model"""
     name = filters.CharFilter(lookup_expr='icontains')
@@ -40,6 +47,11 @@ class PurchaseFilter(filters.FilterSet):
     date_to = filters.DateFilter(field_name='date', lookup_expr='lte')
     supplier = filters.NumberFilter()
     supplier_name = filters.CharFilter(field_name='supplier__name', lookup_expr='icontains')
+    total_cost_min = filters.NumberFilter(field_name='total_cost', lookup_expr='gte')
+    total_cost_max = filters.NumberFilter(field_name='total_cost', lookup_expr='lte')
+    borrow_amount_min = filters.NumberFilter(field_name='borrow_amount', lookup_expr='gte')
+    borrow_amount_max = filters.NumberFilter(field_name='borrow_amount', lookup_expr='lte')
+    outstanding = filters.BooleanFilter(method=filter_outstanding)
     
     class Meta:
         model = Purchase
@@ -53,6 +65,13 @@ class SaleFilter(filters.FilterSet):
     date_to = filters.DateFilter(field_name='date', lookup_expr='lte')
     customer = filters.NumberFilter()
     customer_name = filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
+    total_amount_min = filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
+    total_amount_max = filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
+    borrow_amount_min = filters.NumberFilter(field_name='borrow_amount', lookup_expr='gte')
+    borrow_amount_max = filters.NumberFilter(field_name='borrow_amount', lookup_expr='lte')
+    profit_min = filters.NumberFilter(field_name='profit', lookup_expr='gte')
+    profit_max = filters.NumberFilter(field_name='profit', lookup_expr='lte')
+    outstanding = filters.BooleanFilter(method=filter_outstanding)
     
     class Meta:
         model = Sale
@@ -0,0 +1,121 @@
+"""
+Background backup jobs.
+
+``enqueue_backup`` records a ``BackupJob`` and runs ``backup_data`` for it on
+a small in-process thread pool, so the request returns at once with the job
+id. While the backup runs, the job row is updated with the rows written per
+file and table (every ``CHUNK_SIZE`` rows and at the end of each table).
+Clients poll the job and download its files by id once it has completed.
+
+The pool lives in the web process. A job whose process stopped mid-run makes
+no more progress, and is marked failed by ``expire_stale_jobs`` once it has
+not been updated for ``BACKUP_JOB_STALE_SECONDS``.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Exists, Q
+from django.utils import timezone
+
+from .management.commands.backup_data import Command as BackupCommand
+from .models import BackupJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """The process-wide backup thread pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKUP_JOB_WORKERS, thread_name_prefix='backup'
+            )
+        return _executor
+
+
+class JobProgress:
+    """``backup_data`` progress listener saving the counts on the job row"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def started(self, statistics):
+        self.job.totals = statistics
+        self.job.save(update_fields=['totals', 'updated_at'])
+
+    def wrote(self, stage, table, rows):
+        self.job.progress.setdefault(stage, {})[table] = rows
+        self.job.save(update_fields=['progress', 'updated_at'])
+
+
+def enqueue_backup(user=None, **options):
+    """Create a queued job for ``backup_data`` with ``options`` and submit it once committed"""
+    job = BackupJob.objects.create(
+        requested_by=user if user and user.is_authenticated else None,
+        options=options,
+    )
+    transaction.on_commit(lambda: executor().submit(run_backup_job, job.pk))
+    return job
+
+
+def run_backup_job(job_id):
+    """Run a queued job to completion, recording its outcome on the row"""
+    close_old_connections()
+    try:
+        # Claim the job; it may have expired while waiting in the queue
+        claimed = BackupJob.objects.filter(pk=job_id, status='queued').update(
+            status='running', started_at=timezone.now(), updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = BackupJob.objects.get(pk=job_id)
+        command = BackupCommand()
+        try:
+            call_command(
+                command,
+                output_dir=settings.BACKUP_DIR,
+                progress=JobProgress(job),
+                stdout=io.StringIO(),
+                **job.options,
+            )
+        except Exception as exc:
+            logger.exception('Backup job %s failed', job_id)
+            outcome = {'status': 'failed', 'error': str(exc)}
+        else:
+            outcome = {'status': 'completed', 'excel_file': command.excel_file or '', 'json_file': command.json_file}
+        # Only a job still running is finished here; one expired meanwhile stays failed
+        now = timezone.now()
+        BackupJob.objects.filter(pk=job_id, status='running').update(finished_at=now, updated_at=now, **outcome)
+    finally:
+        connection.close()
+
+
+def expire_stale_jobs():
+    """
+    Fail jobs that stopped making progress.
+
+    A running job is stale once it has not been updated for
+    ``BACKUP_JOB_STALE_SECONDS``; a queued job is stale after as long if no
+    job is running ahead of it.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.BACKUP_JOB_STALE_SECONDS)
+    live = BackupJob.objects.filter(status='running', updated_at__gte=cutoff)
+    return BackupJob.objects.filter(
+        Q(status='running') | Q(status='queued') & ~Exists(live),
+        updated_at__lt=cutoff,
+    ).update(
+        status='failed',
+        error='The backup stopped making progress (the server may have restarted)',
+        finished_at=now,
+    )
@@ -0,0 +1,220 @@
+"""
+Chronological customer ledger with a running balance.
+
+``GET /api/customers/<id>/statement/?mode=ledger`` lists the customer's
+sales (debits), payments and deductions (credits) in one sequence ordered by
+``(date, created_at, kind, id)``, each with the balance after it.
+
+One SQL statement builds a page: a ``UNION ALL`` of the three tables, each
+branch reading at most one page of rows after the cursor through its
+``(customer, date)`` index, and ``SUM(debit - credit) OVER (...)`` for the
+running movement within the page. The balance the page starts from comes
+from the cursor, which carries the position and the balance there (signed,
+so it cannot be edited). The first page starts from the balance as of
+``start_date``: the stored balance less everything dated on or after it.
+The cost of a page therefore does not depend on how much history lies
+before it.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection
+from django.db.models import CharField, DateField, DateTimeField, DecimalField, IntegerField, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+from .balances import customer_movement
+from .models import Customer, CustomerDeduction, Payment, Sale
+
+CURSOR_SALT = 'sales.ledger'
+CURSOR_QUERY_PARAM = 'cursor'
+MONEY = DecimalField(max_digits=18, decimal_places=6)
+RATE = DecimalField(max_digits=10, decimal_places=3)
+
+# Output columns with the fields used to convert the database values
+COLUMNS = [
+    ('kind', CharField()),
+    ('id', IntegerField()),
+    ('date', DateField()),
+    ('created_at', DateTimeField()),
+    ('kg', RATE),
+    ('rate', RATE),
+    ('method', CharField()),
+    ('deduction_type', CharField()),
+    ('note', CharField()),
+    ('debit', MONEY),
+    ('credit', MONEY),
+    ('movement', MONEY),
+]
+
+# kind -> (model, {output column: model field}); kinds sort alphabetically on ties
+BRANCHES = {
+    'deduction': (CustomerDeduction, {'deduction_type': 'deduction_type', 'note': 'note', 'credit': 'amount'}),
+    'payment': (Payment, {'method': 'method', 'note': 'note', 'credit': 'amount'}),
+    'sale': (Sale, {'kg': 'kg', 'rate': 'sale_rate_per_kg', 'note': 'note', 'debit': 'total_amount'}),
+}
+# What a branch selects for the columns its table lacks, typed so the branches union cleanly
+MISSING = {
+    'kg': 'CAST(NULL AS DECIMAL(10, 3))',
+    'rate': 'CAST(NULL AS DECIMAL(10, 3))',
+    'method': 'CAST(NULL AS VARCHAR(20))',
+    'deduction_type': 'CAST(NULL AS VARCHAR(20))',
+    'note': "''",
+    'debit': 'CAST(0 AS DECIMAL(18, 6))',
+    'credit': 'CAST(0 AS DECIMAL(18, 6))',
+}
+
+
+def _branch_sql(kind, position, start_date, end_date, limit):
+    """One table's rows after ``position`` in ledger order, at most ``limit`` of them"""
+    quote = connection.ops.quote_name
+    adapt_date = connection.ops.adapt_datefield_value
+    model, sources = BRANCHES[kind]
+    names = {field.attname: quote(field.column) for field in model._meta.concrete_fields}
+    select = ', '.join(
+        [f"'{kind}' AS {quote('kind')}", names['id'], names['date'], names['created_at']]
+        + [
+            f'{names[sources[column]] if column in sources else MISSING[column]} AS {quote(column)}'
+            for column in MISSING
+        ]
+    )
+    where, params = [f"{names['customer_id']} = %s"], []
+    if start_date:
+        where.append(f"{names['date']} >= %s")
+        params.append(adapt_date(start_date))
+    if end_date:
+        where.append(f"{names['date']} <= %s")
+        params.append(adapt_date(end_date))
+    if position:
+        day, created_at, after_kind, pk = position
+        day, created_at = adapt_date(day), connection.ops.adapt_datetimefield_value(created_at)
+        # At the cursor's (date, created_at), later kinds come after it, earlier
+        # kinds before it, and the cursor's own kind continues by id
+        same_time = f"{names['date']} = %s AND {names['created_at']} {'>=' if kind > after_kind else '>'} %s"
+        condition = f"{names['date']} > %s OR ({same_time})"
+        params += [day, day, created_at]
+        if kind == after_kind:
+            condition += f" OR ({names['date']} = %s AND {names['created_at']} = %s AND {names['id']} > %s)"
+            params += [day, created_at, pk]
+        where.append(f'({condition})')
+    sql = (
+        f'SELECT * FROM (SELECT {select} FROM {quote(model._meta.db_table)} WHERE {" AND ".join(where)} '
+        f"ORDER BY {names['date']}, {names['created_at']}, {names['id']} LIMIT %s) AS {quote(kind + '_rows')}"
+    )
+    return sql, params + [limit]
+
+
+def ledger_rows(customer_id, start_date=None, end_date=None, position=None, limit=100):
+    """
+    Up to ``limit`` ledger entries after ``position``, with their running movement.
+
+    ``position`` is the ``(date, created_at, kind, id)`` of the last entry
+    already returned, or ``None`` for the start of the range. ``movement``
+    is the net change of the balance from ``position`` through the entry.
+    """
+    quote = connection.ops.quote_name
+    branches, params = [], []
+    for kind in BRANCHES:
+        sql, branch_params = _branch_sql(kind, position, start_date, end_date, limit)
+        branches.append(sql)
+        params += [customer_id] + branch_params
+    order = ', '.join(quote(name) for name in ('date', 'created_at', 'kind', 'id'))
+    columns = ', '.join(quote(name) for name, _ in COLUMNS[:-1])
+    sql = (
+        f'SELECT {columns}, SUM({quote("debit")} - {quote("credit")}) OVER '
+        f'(ORDER BY {order} ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS {quote("movement")} '
+        f'FROM ({" UNION ALL ".join(branches)}) AS {quote("entries")} ORDER BY {order} LIMIT %s'
+    )
+    converters = []
+    for name, field in COLUMNS:
+        expression = Value(None, output_field=field)
+        converters.append((name, expression, connection.ops.get_db_converters(expression)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        rows = cursor.fetchall()
+    entries = []
+    for row in rows:
+        entry = {}
+        for (name, expression, functions), value in zip(converters, row):
+            for function in functions:
+                value = function(value, expression, connection)
+            entry[name] = value
+        entries.append(entry)
+    return entries
+
+
+def range_balances(customer, start_date=None, end_date=None):
+    """The customer's balance at the start of ``start_date`` and at the end of ``end_date``"""
+    movements = {}
+    if start_date:
+        movements['from_start'] = customer_movement(date__gte=start_date)
+    if end_date:
+        movements['after_end'] = customer_movement(date__gt=end_date)
+    values = {'current': customer.current_balance}
+    if movements:
+        values = Customer.objects.filter(pk=customer.pk).annotate(**movements).values(
+            'current_balance', *movements
+        ).get()
+        values['current'] = values.pop('current_balance')
+    opening = values['current'] - values['from_start'] if start_date else customer.opening_balance
+    closing = values['current'] - values.get('after_end', Decimal('0'))
+    return opening, closing
+
+
+class LedgerPage:
+    """One cursor page of a customer's ledger, with the balances of the whole range"""
+
+    def __init__(self, request, customer, start_date=None, end_date=None, page_size=100):
+        self.request = request
+        self.customer = customer
+        self.start_date = start_date
+        self.end_date = end_date
+        self.page_size = page_size
+        self.range_key = [customer.pk, str(start_date or ''), str(end_date or '')]
+
+        position, balance, opening, closing = self.decode_cursor()
+        if position is None:
+            opening, closing = range_balances(customer, start_date, end_date)
+            balance = opening
+        self.opening_balance, self.closing_balance = opening, closing
+
+        entries = ledger_rows(customer.pk, start_date, end_date, position, page_size + 1)
+        self.has_next = len(entries) > page_size
+        self.entries = entries[:page_size]
+        for entry in self.entries:
+            entry['balance'] = balance + entry.pop('movement')
+
+    def decode_cursor(self):
+        token = self.request.query_params.get(CURSOR_QUERY_PARAM)
+        if not token:
+            return None, None, None, None
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT)
+            if payload['r'] != self.range_key:
+                raise ValueError('Cursor of another ledger')
+            position = (
+                date.fromisoformat(payload['d']),
+                datetime.fromisoformat(payload['c']),
+                payload['k'],
+                int(payload['i']),
+            )
+            return position, Decimal(payload['b']), Decimal(payload['o']), Decimal(payload['e'])
+        except (signing.BadSignature, TypeError, ValueError, KeyError, ArithmeticError):
+            raise NotFound('Invalid cursor')
+
+    def next_link(self):
+        if not self.has_next:
+            return None
+        last = self.entries[-1]
+        token = signing.dumps({
+            'r': self.range_key,
+            'd': last['date'].isoformat(),
+            'c': last['created_at'].isoformat(),
+            'k': last['kind'],
+            'i': last['id'],
+            'b': str(last['balance']),
+            'o': str(self.opening_balance),
+            'e': str(self.closing_balance),
+        }, salt=CURSOR_SALT, compress=True)
+        return replace_query_param(self.request.build_absolute_uri(), CURSOR_QUERY_PARAM, token)
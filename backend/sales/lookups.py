@@ -0,0 +1,122 @@
+"""
+Lightweight name lookups for dropdowns and autocomplete.
+
+``GET /api/customers/lookup/`` and ``/api/suppliers/lookup/`` return a plain
+list of ``{id, name, is_active}`` without balances or pagination. ``search``
+keeps names starting with the text (case-insensitive), ``is_active`` filters
+on the flag and ``limit`` caps the number of rows.
+
+Each process keeps the whole list per model, read in name-index order and
+kept sorted by case-folded name, so a prefix search is a bisect into it
+rather than a table scan. An entry is tagged with the model's version, a
+counter in the ``reports`` cache alias that ``sales.signals`` bumps whenever
+a row of the model is saved or deleted, so a request costs one cache read
+and no query. With ``REPORT_CACHE_BACKEND=file`` the counter is shared by
+all processes on the host, so their changes are picked up too. Clearing the
+cache (restores do) starts the counter from a new value. The version and
+parameters form the response ETag: a client sending it back in
+``If-None-Match`` gets an empty 304 while nothing has changed.
+"""
+import bisect
+import hashlib
+import threading
+import time
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from reports.cache import report_cache
+
+from .serializers import LookupRequestSerializer
+
+LOOKUP_FIELDS = ('id', 'name', 'is_active')
+
+_entries = {}
+_lock = threading.Lock()
+
+
+class LookupEntry:
+    """One model's lookup rows sorted by case-folded name"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = sorted(rows, key=lambda row: (row['name'].casefold(), row['id']))
+        self.keys = [row['name'].casefold() for row in self.rows]
+
+    def search(self, search='', is_active=None, limit=None):
+        """Rows whose name starts with ``search``, in name order"""
+        prefix = search.casefold()
+        results = []
+        for index in range(bisect.bisect_left(self.keys, prefix), len(self.rows)):
+            if not self.keys[index].startswith(prefix):
+                break
+            row = self.rows[index]
+            if is_active is None or row['is_active'] == is_active:
+                results.append(row)
+                if len(results) == limit:
+                    break
+        return results
+
+
+def _version_key(model):
+    return f'lookup-version:{model._meta.label}'
+
+
+def lookup_version(model):
+    """The model's change counter, started from the clock so a cleared cache never repeats a version"""
+    cache = report_cache()
+    version = cache.get(_version_key(model))
+    if version is None:
+        cache.add(_version_key(model), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(model))
+    return version
+
+
+def lookup_entry(model, version):
+    """The cached entry of ``model`` at ``version``, loading it when missing or stale"""
+    with _lock:
+        entry = _entries.get(model)
+    if entry is None or entry.version != version:
+        entry = LookupEntry(version, model.objects.order_by('name').values(*LOOKUP_FIELDS))
+        with _lock:
+            _entries[model] = entry
+    return entry
+
+
+def invalidate_lookup(model):
+    """Drop this process's entry and bump the shared version for the others"""
+    with _lock:
+        _entries.pop(model, None)
+    try:
+        report_cache().incr(_version_key(model))
+    except ValueError:
+        # Not set yet; the next read starts a new counter
+        pass
+
+
+def lookup_etag(model, version, params):
+    raw = f'{model._meta.label}:{version}:{sorted(params.items())}'
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+class LookupMixin:
+    """Adds the cached ``lookup`` list action to a ``ModelViewSet``"""
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """Id, name and active flag of every row, filtered by name prefix"""
+        params = LookupRequestSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        model = self.get_queryset().model
+
+        version = lookup_version(model)
+        etag = lookup_etag(model, version, params.validated_data)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        rows = lookup_entry(model, version).search(**params.validated_data)
+        return Response(rows, headers=headers)
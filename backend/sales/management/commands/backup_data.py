@@ -1,19 +1,166 @@
 """
 Management command to backup all database data to Excel and JSON files
-Usage: python manage.py backup_data
+Usage: python manage.py backup_data [--excel-mode streaming|standard] [--json-compression none|gzip|zstd]
+                                   [--incremental] [--format excel-json|native]
+
+``--incremental`` writes only a JSON file with the rows changed and deleted
+since the newest JSON backup in the output directory (see ``sales.backups``).
+``--format native`` writes a compressed, checksummed database snapshot
+instead (see ``sales.native_backups``); restore it with ``restore_native``.
+
+Called from code (see ``sales.jobs``), ``progress`` may be passed an object
+with ``started(statistics)`` and ``wrote(stage, table, rows)`` methods to
+follow the run; the written paths are left on ``excel_file`` and ``json_file``.
 """
-from django.core.management.base import BaseCommand
-from django.core.serializers import serialize
+from itertools import chain, islice
+
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
-from sales.models import Customer, DailyRate, Purchase, Sale, Payment, Expense
+from openpyxl.utils import get_column_letter
+from sales.backups import (
+    COMPRESSION_EXTENSIONS, JSON_SECTIONS, BackupError, changed_since, high_water_marks, open_backup_writer,
+    read_backup_header, read_manifest, record_backups, table_counts, write_json_records,
+)
+from sales.native_backups import snapshot
+from sales.models import Customer, DailyRate, Purchase, Sale, Payment, Expense, Supplier
 import json
 import os
 
+# Rows read per database round trip when writing sheets
+CHUNK_SIZE = 2000
+# Rows sampled to size the columns of a streamed sheet
+WIDTH_SAMPLE_ROWS = 500
+MAX_COLUMN_WIDTH = 50
+
+
+def _date(value):
+    return value.strftime('%Y-%m-%d')
+
+
+def _datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ExcelSheet:
+    """One backup sheet: its headers and rows read with a chunked ``values_list``"""
+
+    def __init__(self, title, headers, queryset, fields, row):
+        self.title = title
+        self.headers = headers
+        self.queryset = queryset
+        self.fields = fields
+        self.row = row
+
+    def rows(self):
+        values = self.queryset.values_list(*self.fields).iterator(chunk_size=CHUNK_SIZE)
+        return (self.row(*row) for row in values)
+
+
+PAYMENT_METHODS = dict(Payment.PAYMENT_METHODS)
+EXPENSE_CATEGORIES = dict(Expense.EXPENSE_CATEGORIES)
+
+EXCEL_SHEETS = [
+    ExcelSheet(
+        'Customers',
+        ['ID', 'Name', 'Phone', 'Address', 'Opening Balance',
+         'Running Balance', 'Is Active', 'Created At', 'Updated At'],
+        Customer.objects.order_by('id'),
+        ['id', 'name', 'phone', 'address', 'opening_balance', 'current_balance',
+         'is_active', 'created_at', 'updated_at'],
+        lambda id, name, phone, address, opening, balance, active, created, updated: [
+            id, name, phone, address, float(opening), float(balance),
+            'Yes' if active else 'No', _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Suppliers',
+        ['ID', 'Name', 'Phone', 'Opening Balance', 'Closing Balance',
+         'Is Active', 'Created At', 'Updated At'],
+        Supplier.objects.order_by('id'),
+        ['id', 'name', 'phone', 'opening_balance', 'current_balance',
+         'is_active', 'created_at', 'updated_at'],
+        lambda id, name, phone, opening, balance, active, created, updated: [
+            id, name, phone, float(opening), float(balance),
+            'Yes' if active else 'No', _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Daily Rates',
+        ['ID', 'Date', 'Default Cost Rate', 'Default Sale Rate', 'Created At', 'Updated At'],
+        DailyRate.objects.order_by('-date'),
+        ['id', 'date', 'default_cost_rate', 'default_sale_rate', 'created_at', 'updated_at'],
+        lambda id, date, cost_rate, sale_rate, created, updated: [
+            id, _date(date), float(cost_rate), float(sale_rate), _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Purchases',
+        ['ID', 'Date', 'Supplier', 'KG', 'Cost Rate per KG',
+         'Total Cost', 'Note', 'Created At', 'Updated At'],
+        Purchase.objects.order_by('-date', '-created_at'),
+        ['id', 'date', 'supplier__name', 'kg', 'cost_rate_per_kg', 'note', 'created_at', 'updated_at'],
+        lambda id, date, supplier, kg, cost_rate, note, created, updated: [
+            id, _date(date), supplier, float(kg), float(cost_rate), float(kg * cost_rate),
+            note, _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Sales',
+        ['ID', 'Date', 'Customer', 'KG', 'Sale Rate per KG',
+         'Cost Rate Snapshot', 'Total Amount', 'Amount Received',
+         'Borrow Amount', 'Profit', 'Note', 'Created At', 'Updated At'],
+        Sale.objects.order_by('-date', '-created_at'),
+        ['id', 'date', 'customer__name', 'kg', 'sale_rate_per_kg', 'cost_rate_snapshot',
+         'amount_received', 'note', 'created_at', 'updated_at'],
+        lambda id, date, customer, kg, sale_rate, cost_rate, received, note, created, updated: [
+            id, _date(date), customer, float(kg), float(sale_rate), float(cost_rate),
+            float(kg * sale_rate), float(received), float(kg * sale_rate - received),
+            float(kg * (sale_rate - cost_rate)), note, _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Payments',
+        ['ID', 'Date', 'Customer', 'Amount', 'Payment Method', 'Note', 'Created At', 'Updated At'],
+        Payment.objects.order_by('-date', '-created_at'),
+        ['id', 'date', 'customer__name', 'amount', 'method', 'note', 'created_at', 'updated_at'],
+        lambda id, date, customer, amount, method, note, created, updated: [
+            id, _date(date), customer, float(amount), PAYMENT_METHODS.get(method, method),
+            note, _datetime(created), _datetime(updated),
+        ],
+    ),
+    ExcelSheet(
+        'Expenses',
+        ['ID', 'Date', 'Category', 'Amount', 'Note', 'Created At', 'Updated At'],
+        Expense.objects.order_by('-date', '-created_at'),
+        ['id', 'date', 'category', 'amount', 'note', 'created_at', 'updated_at'],
+        lambda id, date, category, amount, note, created, updated: [
+            id, _date(date), EXPENSE_CATEGORIES.get(category, category), float(amount),
+            note, _datetime(created), _datetime(updated),
+        ],
+    ),
+]
+
+
+def column_widths(headers, rows):
+    """Column widths fitting the headers and the given (sampled) rows"""
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def sheet_table(sheet):
+    """Table key of a sheet, as used by ``table_counts``"""
+    return sheet.title.lower().replace(' ', '_')
+
 
 class Command(BaseCommand):
     help = 'Backup all database data to Excel and JSON files'
+    stealth_options = ('progress',)
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -22,9 +169,42 @@ class Command(BaseCommand):
             default='backups',
             help='Directory to store backup files (default: backups/)'
         )
+        parser.add_argument(
+            '--excel-mode',
+            choices=['streaming', 'standard'],
+            default='streaming',
+            help='streaming writes sheets with a write-only workbook in constant memory (default); '
+                 'standard builds the whole workbook in memory'
+        )
+        parser.add_argument(
+            '--json-compression',
+            choices=list(COMPRESSION_EXTENSIONS),
+            default='none',
+            help='Compress the JSON backup with gzip or zstd (zstd needs the zstandard package)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['excel-json', 'native'],
+            default='excel-json',
+            help='excel-json writes Excel and JSON files through the ORM (default); native writes a '
+                 'database snapshot (SQLite backup API or PostgreSQL COPY)'
+        )
+        parser.add_argument(
+            '--native-compression',
+            choices=list(COMPRESSION_EXTENSIONS),
+            default='gzip',
+            help='Compression of a native snapshot (default: gzip)'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only write the rows changed and deleted since the newest JSON backup in the output '
+                 'directory (JSON only, no Excel file)'
+        )
 
     def handle(self, *args, **options):
         output_dir = options['output_dir']
+        self.progress = options.get('progress')
         timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
         
         # Create output directory if it doesn't exist
@@ -33,49 +213,136 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'\n🔄 Starting backup process...'))
         self.stdout.write(f'📁 Output directory: {output_dir}')
         self.stdout.write(f'⏰ Timestamp: {timestamp}\n')
+        
+        self.excel_file = self.json_file = None
+        if options['format'] == 'native':
+            return self.backup_native(output_dir, timestamp, options['native_compression'])
+        
+        # Read before any rows, so changes made during the run land in the next incremental
+        previous = self.previous_backup(output_dir) if options['incremental'] else None
+        marks = high_water_marks()
+        
+        # Row counts of every table from one query, shared by the whole run
+        self.statistics = table_counts()
+        self.stdout.write(f'📦 {sum(self.statistics.values())} records in {len(self.statistics)} tables\n')
+        if self.progress:
+            self.progress.started(self.statistics)
 
-        # Backup to Excel
-        excel_file = self.backup_to_excel(output_dir, timestamp)
+        # Backup to Excel (full backups only)
+        excel_file = self.excel_file = None
+        if previous is None:
+            excel_file = self.excel_file = self.backup_to_excel(output_dir, timestamp, options['excel_mode'])
         
         # Backup to JSON (for complete data restoration)
-        json_file = self.backup_to_json(output_dir, timestamp)
+        json_file = self.json_file = self.backup_to_json(
+            output_dir, timestamp, options['json_compression'], marks, previous
+        )
+        
+        # List the new files in the directory's manifest
+        record_backups(output_dir, [path for path in (excel_file, json_file) if path])
         
         self.stdout.write(self.style.SUCCESS(f'\n✅ Backup completed successfully!'))
-        self.stdout.write(f'📊 Excel file: {excel_file}')
+        if excel_file:
+            self.stdout.write(f'📊 Excel file: {excel_file}')
         self.stdout.write(f'📄 JSON file: {json_file}')
         self.stdout.write(f'💾 Backup timestamp: {timestamp}\n')
 
-    def backup_to_excel(self, output_dir, timestamp):
+    def backup_to_excel(self, output_dir, timestamp, mode='streaming'):
         """Create Excel backup with all data"""
         filename = os.path.join(output_dir, f'ahmad_poultry_backup_{timestamp}.xlsx')
-        wb = Workbook()
+        write_only = mode == 'streaming'
+        wb = Workbook(write_only=write_only)
         
-        # Remove default sheet
-        wb.remove(wb.active)
+        if not write_only:
+            # Remove default sheet
+            wb.remove(wb.active)
         
         # Backup each model
-        self._backup_customers(wb)
-        self._backup_daily_rates(wb)
-        self._backup_purchases(wb)
-        self._backup_sales(wb)
-        self._backup_payments(wb)
-        self._backup_expenses(wb)
+        counts = {}
+        for sheet in EXCEL_SHEETS:
+            ws = wb.create_sheet(sheet.title)
+            if write_only:
+                counts[sheet.title] = self._write_sheet_streaming(ws, sheet)
+            else:
+                counts[sheet.title] = self._write_sheet(ws, sheet)
+            self.stdout.write(f'✓ Backed up {counts[sheet.title]} {sheet.title.lower()}')
+            self._report('excel', sheet_table(sheet), counts[sheet.title])
+            self._check_count(sheet_table(sheet), counts[sheet.title])
         
         # Add summary sheet
-        self._add_summary_sheet(wb, timestamp)
+        self._add_summary_sheet(wb, timestamp, counts)
         
         wb.save(filename)
         return filename
 
+    def _report(self, stage, table, rows):
+        """Pass rows written so far to the ``progress`` listener, if any"""
+        if getattr(self, 'progress', None):
+            self.progress.wrote(stage, table, rows)
+
+    def _check_count(self, table, written):
+        """Warn when a table changed between the start-of-run statistics and its export"""
+        expected = getattr(self, 'statistics', {}).get(table)
+        if expected is not None and expected != written:
+            self.stdout.write(self.style.WARNING(
+                f'⚠ {table}: wrote {written} records, {expected} existed when the backup started'
+            ))
+
+    def _write_sheet(self, ws, sheet):
+        """Fill a sheet of an in-memory workbook and size it from every cell"""
+        ws.append(sheet.headers)
+        count = 0
+        for row in sheet.rows():
+            ws.append(row)
+            count += 1
+            if not count % CHUNK_SIZE:
+                self._report('excel', sheet_table(sheet), count)
+        self._style_header(ws)
+        return count
+
+    def _write_sheet_streaming(self, ws, sheet):
+        """
+        Stream a sheet of a write-only workbook.
+
+        Rows go straight from the chunked query to the sheet's temporary
+        file. Column widths, which must be set before the first row, are
+        sized from the first ``WIDTH_SAMPLE_ROWS`` rows.
+        """
+        rows = sheet.rows()
+        sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+        for index, width in enumerate(column_widths(sheet.headers, sample), start=1):
+            ws.column_dimensions[get_column_letter(index)].width = width
+        
+        header = []
+        for value in sheet.headers:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.fill, cell.font, cell.alignment = self._header_style()
+            header.append(cell)
+        ws.append(header)
+        
+        count = 0
+        for row in chain(sample, rows):
+            ws.append(row)
+            count += 1
+            if not count % CHUNK_SIZE:
+                self._report('excel', sheet_table(sheet), count)
+        return count
+
+    def _header_style(self):
+        return (
+            PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid"),
+            Font(bold=True, color="FFFFFF", size=11),
+            Alignment(horizontal='center', vertical='center'),
+        )
+
     def _style_header(self, ws):
         """Apply styling to header row"""
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
+        header_fill, header_font, header_alignment = self._header_style()
         
         for cell in ws[1]:
             cell.fill = header_fill
             cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.alignment = header_alignment
         
         # Auto-adjust column widths
         for column in ws.columns:
@@ -87,255 +354,143 @@ class Command(BaseCommand):
                         max_length = len(str(cell.value))
                 except:
                     pass
-            adjusted_width = min(max_length + 2, 50)
+            adjusted_width = min(max_length + 2, MAX_COLUMN_WIDTH)
             ws.column_dimensions[column_letter].width = adjusted_width
 
-    def _backup_customers(self, wb):
-        """Backup customers to Excel sheet"""
-        ws = wb.create_sheet("Customers")
-        
-        # Headers
-        headers = ['ID', 'Name', 'Phone', 'Address', 'Opening Balance', 
-                  'Running Balance', 'Is Active', 'Created At', 'Updated At']
-        ws.append(headers)
-        
-        # Data
-        customers = Customer.objects.all().order_by('id')
-        for customer in customers:
-            ws.append([
-                customer.id,
-                customer.name,
-                customer.phone,
-                customer.address,
-                float(customer.opening_balance),
-                float(customer.running_balance),
-                'Yes' if customer.is_active else 'No',
-                customer.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                customer.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {customers.count()} customers')
+    def _add_summary_sheet(self, wb, timestamp, counts):
+        """
+        Add summary sheet with backup information.
 
-    def _backup_daily_rates(self, wb):
-        """Backup daily rates to Excel sheet"""
-        ws = wb.create_sheet("Daily Rates")
-        
-        # Headers
-        headers = ['ID', 'Date', 'Default Cost Rate', 'Default Sale Rate', 
-                  'Created At', 'Updated At']
-        ws.append(headers)
+        The sheet is written row by row so write-only workbooks get it too;
+        record counts are those gathered while writing the data sheets.
+        """
+        ws = wb.create_sheet("Backup Summary", 0)  # Make it first sheet
         
-        # Data
-        rates = DailyRate.objects.all().order_by('-date')
-        for rate in rates:
-            ws.append([
-                rate.id,
-                rate.date.strftime('%Y-%m-%d'),
-                float(rate.default_cost_rate),
-                float(rate.default_sale_rate),
-                rate.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                rate.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
+        # Style (write-only sheets need widths before any row)
+        ws.column_dimensions['A'].width = 30
+        ws.column_dimensions['B'].width = 30
         
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {rates.count()} daily rates')
+        bold = Font(bold=True)
+        rows = [
+            # Title
+            [('Ahmad Poultry Services - Data Backup', Font(bold=True, size=16, color="4472C4"))],
+            [],
+            # Backup info
+            ['Backup Date & Time:', timezone.now().strftime('%Y-%m-%d %H:%M:%S')],
+            ['Backup Timestamp:', timestamp],
+            [],
+            # Record counts
+            [('Data Summary:', Font(bold=True, size=12))],
+            *[[f'{title}:', count] for title, count in counts.items()],
+            [],
+            [('Total Records:', bold), (sum(counts.values()), bold)],
+            [],
+            # Notes
+            [('Notes:', bold)],
+            ['• This backup includes all data from the database'],
+            ['• Each sheet contains data from one model/table'],
+            ['• Running Balance is the stored balance at backup time'],
+            ['• For data restoration, use the JSON backup file with restore_data'],
+        ]
+        for row in rows:
+            ws.append([self._summary_cell(ws, value) for value in row])
+        if not wb.write_only:
+            ws.merge_cells('A1:B1')
 
-    def _backup_purchases(self, wb):
-        """Backup purchases to Excel sheet"""
-        ws = wb.create_sheet("Purchases")
-        
-        # Headers
-        headers = ['ID', 'Date', 'Supplier', 'KG', 'Cost Rate per KG', 
-                  'Total Cost', 'Note', 'Created At', 'Updated At']
-        ws.append(headers)
-        
-        # Data
-        purchases = Purchase.objects.all().order_by('-date', '-created_at')
-        for purchase in purchases:
-            ws.append([
-                purchase.id,
-                purchase.date.strftime('%Y-%m-%d'),
-                purchase.supplier,
-                float(purchase.kg),
-                float(purchase.cost_rate_per_kg),
-                float(purchase.total_cost),
-                purchase.note,
-                purchase.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                purchase.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {purchases.count()} purchases')
+    def _summary_cell(self, ws, value):
+        """Plain values pass through, ``(value, font)`` pairs become styled cells"""
+        if not isinstance(value, tuple):
+            return value
+        value, font = value
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = font
+        return cell
 
-    def _backup_sales(self, wb):
-        """Backup sales to Excel sheet"""
-        ws = wb.create_sheet("Sales")
-        
-        # Headers
-        headers = ['ID', 'Date', 'Customer', 'KG', 'Sale Rate per KG', 
-                  'Cost Rate Snapshot', 'Total Amount', 'Amount Received', 
-                  'Borrow Amount', 'Profit', 'Note', 'Created At', 'Updated At']
-        ws.append(headers)
-        
-        # Data
-        sales = Sale.objects.select_related('customer').all().order_by('-date', '-created_at')
-        for sale in sales:
-            ws.append([
-                sale.id,
-                sale.date.strftime('%Y-%m-%d'),
-                sale.customer.name,
-                float(sale.kg),
-                float(sale.sale_rate_per_kg),
-                float(sale.cost_rate_snapshot),
-                float(sale.total_amount),
-                float(sale.amount_received),
-                float(sale.borrow_amount),
-                float(sale.profit),
-                sale.note,
-                sale.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                sale.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {sales.count()} sales')
+    def backup_native(self, output_dir, timestamp, compression):
+        """Write a native database snapshot and its checksum"""
+        try:
+            path, digest = snapshot(output_dir, timestamp, compression)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        record_backups(output_dir, [path])
+        
+        self.stdout.write(self.style.SUCCESS('\n✅ Native snapshot completed successfully!'))
+        self.stdout.write(f'🗄  Snapshot file: {path} ({os.path.getsize(path)} bytes)')
+        self.stdout.write(f'🔒 SHA-256: {digest}')
+        self.native_file = path
 
-    def _backup_payments(self, wb):
-        """Backup payments to Excel sheet"""
-        ws = wb.create_sheet("Payments")
-        
-        # Headers
-        headers = ['ID', 'Date', 'Customer', 'Amount', 'Payment Method', 
-                  'Note', 'Created At', 'Updated At']
-        ws.append(headers)
-        
-        # Data
-        payments = Payment.objects.select_related('customer').all().order_by('-date', '-created_at')
-        for payment in payments:
-            ws.append([
-                payment.id,
-                payment.date.strftime('%Y-%m-%d'),
-                payment.customer.name,
-                float(payment.amount),
-                payment.get_method_display(),
-                payment.note,
-                payment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                payment.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {payments.count()} payments')
+    def previous_backup(self, output_dir):
+        """``(filename, header)`` of the newest JSON backup in ``output_dir`` that records marks"""
+        for entry in read_manifest(output_dir):
+            path = os.path.join(output_dir, entry['filename'])
+            if entry['format'] != 'json' or not os.path.exists(path):
+                continue
+            try:
+                header = read_backup_header(path)
+            except BackupError as exc:
+                raise CommandError(f'Cannot read {entry["filename"]}: {exc}')
+            if header.get('marks'):
+                return entry['filename'], header
+        raise CommandError(f'No JSON backup with high-water marks in {output_dir}; run a full backup first')
 
-    def _backup_expenses(self, wb):
-        """Backup expenses to Excel sheet"""
-        ws = wb.create_sheet("Expenses")
-        
-        # Headers
-        headers = ['ID', 'Date', 'Category', 'Amount', 'Note', 
-                  'Created At', 'Updated At']
-        ws.append(headers)
-        
-        # Data
-        expenses = Expense.objects.all().order_by('-date', '-created_at')
-        for expense in expenses:
-            ws.append([
-                expense.id,
-                expense.date.strftime('%Y-%m-%d'),
-                expense.get_category_display(),
-                float(expense.amount),
-                expense.note,
-                expense.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                expense.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        self._style_header(ws)
-        self.stdout.write(f'✓ Backed up {expenses.count()} expenses')
+    def backup_to_json(self, output_dir, timestamp, compression='none', marks=None, previous=None):
+        """
+        Create JSON backup with complete data for restoration.
 
-    def _add_summary_sheet(self, wb, timestamp):
-        """Add summary sheet with backup information"""
-        ws = wb.create_sheet("Backup Summary", 0)  # Make it first sheet
-        
-        # Title
-        ws['A1'] = 'Ahmad Poultry Services - Data Backup'
-        ws['A1'].font = Font(bold=True, size=16, color="4472C4")
-        ws.merge_cells('A1:B1')
-        
-        # Backup info
-        ws['A3'] = 'Backup Date & Time:'
-        ws['B3'] = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-        ws['A4'] = 'Backup Timestamp:'
-        ws['B4'] = timestamp
-        
-        # Record counts
-        ws['A6'] = 'Data Summary:'
-        ws['A6'].font = Font(bold=True, size=12)
-        
-        ws['A7'] = 'Customers:'
-        ws['B7'] = Customer.objects.count()
-        
-        ws['A8'] = 'Daily Rates:'
-        ws['B8'] = DailyRate.objects.count()
-        
-        ws['A9'] = 'Purchases:'
-        ws['B9'] = Purchase.objects.count()
-        
-        ws['A10'] = 'Sales:'
-        ws['B10'] = Sale.objects.count()
-        
-        ws['A11'] = 'Payments:'
-        ws['B11'] = Payment.objects.count()
-        
-        ws['A12'] = 'Expenses:'
-        ws['B12'] = Expense.objects.count()
-        
-        ws['A14'] = 'Total Records:'
-        ws['B14'] = (Customer.objects.count() + DailyRate.objects.count() + 
-                     Purchase.objects.count() + Sale.objects.count() + 
-                     Payment.objects.count() + Expense.objects.count())
-        ws['A14'].font = Font(bold=True)
-        ws['B14'].font = Font(bold=True)
-        
-        # Notes
-        ws['A16'] = 'Notes:'
-        ws['A16'].font = Font(bold=True)
-        ws['A17'] = '• This backup includes all data from the database'
-        ws['A18'] = '• Each sheet contains data from one model/table'
-        ws['A19'] = '• Running Balance is calculated at backup time'
-        ws['A20'] = '• For data restoration, use the JSON backup file'
-        
-        # Style
-        ws.column_dimensions['A'].width = 30
-        ws.column_dimensions['B'].width = 30
-
-    def backup_to_json(self, output_dir, timestamp):
-        """Create JSON backup with complete data for restoration"""
-        filename = os.path.join(output_dir, f'ahmad_poultry_backup_{timestamp}.json')
+        Each model's records are streamed from a chunked iterator straight
+        into the (optionally compressed) file without indentation, and the
+        record counts are taken from the same pass. With a ``previous``
+        backup, only the rows changed after its marks are written, followed
+        by the ids deleted since.
+        """
+        kind = 'full' if previous is None else 'incremental'
+        suffix = '' if previous is None else '_incremental'
+        filename = os.path.join(
+            output_dir, f'ahmad_poultry_backup_{timestamp}{suffix}{COMPRESSION_EXTENSIONS[compression]}'
+        )
         
-        backup_data = {
+        header = {
             'backup_timestamp': timestamp,
             'backup_datetime': timezone.now().isoformat(),
-            'data': {
-                'customers': json.loads(serialize('json', Customer.objects.all())),
-                'daily_rates': json.loads(serialize('json', DailyRate.objects.all())),
-                'purchases': json.loads(serialize('json', Purchase.objects.all())),
-                'sales': json.loads(serialize('json', Sale.objects.all())),
-                'payments': json.loads(serialize('json', Payment.objects.all())),
-                'expenses': json.loads(serialize('json', Expense.objects.all())),
-            },
-            'counts': {
-                'customers': Customer.objects.count(),
-                'daily_rates': DailyRate.objects.count(),
-                'purchases': Purchase.objects.count(),
-                'sales': Sale.objects.count(),
-                'payments': Payment.objects.count(),
-                'expenses': Expense.objects.count(),
-            }
+            'kind': kind,
+            'marks': marks or high_water_marks(),
         }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(backup_data, f, indent=2, ensure_ascii=False)
-        
-        self.stdout.write(f'✓ Created JSON backup with {sum(backup_data["counts"].values())} total records')
+        if previous is None:
+            querysets, deleted = {section: model.objects.all() for section, model in JSON_SECTIONS}, None
+        else:
+            base, base_header = previous
+            header.update(base=base, since=base_header['marks'])
+            querysets, deleted = changed_since(base_header['marks'])
+        
+        counts = {}
+        try:
+            stream = open_backup_writer(filename, compression)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        with stream:
+            stream.write(json.dumps(header)[:-1] + ',"data":{')
+            for index, (section, queryset) in enumerate(querysets.items()):
+                if index:
+                    stream.write(',')
+                stream.write(f'{json.dumps(section)}:')
+                counts[section] = write_json_records(
+                    stream, queryset,
+                    on_chunk=lambda rows, section=section: self._report('json', section, rows),
+                )
+                self._report('json', section, counts[section])
+                if previous is None:
+                    self._check_count(section, counts[section])
+            stream.write('}')
+            if deleted is not None:
+                stream.write(',"deleted":%s' % json.dumps(deleted))
+            stream.write(',"counts":%s}' % json.dumps(counts))
+        
+        if deleted is None:
+            self.stdout.write(f'✓ Created JSON backup with {sum(counts.values())} total records')
+        else:
+            self.stdout.write(
+                f'✓ Created incremental JSON backup on {previous[0]} with {sum(counts.values())} changed '
+                f'and {sum(len(ids) for ids in deleted.values())} deleted records'
+            )
         
         return filename
-
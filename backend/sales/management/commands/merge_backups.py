@@ -0,0 +1,145 @@
+"""
+Management command to merge a full JSON backup and its incrementals into one snapshot
+Usage: python manage.py merge_backups <full.json> [<incremental.json> ...] [--output FILE]
+                                     [--json-compression none|gzip|zstd]
+
+Passing only the newest incremental follows the ``base`` of each backup back
+to the full one in the same directory. The merged snapshot is a full backup
+carrying the last incremental's marks, so it can be restored with
+``restore_data`` and further incrementals can build on it.
+"""
+from heapq import merge
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from sales.backups import (
+    COMPRESSION_EXTENSIONS, JSON_SECTIONS, BackupError, BackupReader, open_backup_reader, open_backup_writer,
+    read_backup_header, record_backups, write_json_dicts
+)
+
+
+def record_pk(record):
+    return record['pk']
+
+
+class Command(BaseCommand):
+    help = 'Merge a full JSON backup and its incremental backups into one restorable snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'backup_files',
+            nargs='+',
+            help='The full backup followed by its incrementals in order, or just the newest incremental'
+        )
+        parser.add_argument('--output', help='Snapshot file (default: a new _merged file next to the full backup)')
+        parser.add_argument(
+            '--json-compression',
+            choices=list(COMPRESSION_EXTENSIONS),
+            default='none',
+            help='Compress the snapshot with gzip or zstd (zstd needs the zstandard package)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            chain = self.resolve_chain(options['backup_files'])
+            full, incrementals = chain[0], chain[1:]
+            self.stdout.write(self.style.SUCCESS(
+                f'\n🔄 Merging {os.path.basename(full[0])} with {len(incrementals)} incremental backups...'
+            ))
+            changed, deleted = self.collect_changes([path for path, _ in incrementals])
+            output = options['output'] or self.default_output(full[0], options['json_compression'])
+            counts = self.write_snapshot(output, options['json_compression'], chain, changed, deleted)
+        except (BackupError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        if not options['output']:
+            record_backups(os.path.dirname(output), [output])
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Wrote {sum(counts.values())} records to {output}'))
+
+    def resolve_chain(self, paths):
+        """``[(path, header)]`` from the full backup to the newest incremental, checked for gaps"""
+        chain = [(path, read_backup_header(path)) for path in paths]
+        while chain[0][1].get('kind') == 'incremental':
+            path = os.path.join(os.path.dirname(chain[0][0]), chain[0][1]['base'])
+            if not os.path.exists(path):
+                raise BackupError(
+                    f'{os.path.basename(chain[0][0])} builds on {chain[0][1]["base"]}, which is missing'
+                )
+            chain.insert(0, (path, read_backup_header(path)))
+
+        if not chain[0][1].get('marks'):
+            raise BackupError(f'{os.path.basename(chain[0][0])} has no high-water marks to build on')
+        for (base, _), (path, header) in zip(chain, chain[1:]):
+            if header.get('kind') != 'incremental' or header.get('base') != os.path.basename(base):
+                raise BackupError(
+                    f'{os.path.basename(path)} is not an incremental backup of {os.path.basename(base)}'
+                )
+        return chain
+
+    def collect_changes(self, paths):
+        """
+        Latest record of every changed row and the ids deleted, per section.
+
+        Incrementals are applied in order: a row changed in a later one
+        replaces the earlier copy, and a delete drops any changed copy.
+        """
+        changed = {section: {} for section, _ in JSON_SECTIONS}
+        deleted = {section: set() for section, _ in JSON_SECTIONS}
+        for path in paths:
+            with open_backup_reader(path) as stream:
+                reader = BackupReader(stream)
+                for section, records in reader.sections():
+                    for record in records:
+                        changed.setdefault(section, {})[record['pk']] = record
+                        deleted.setdefault(section, set()).discard(record['pk'])
+                for section, ids in reader.metadata.get('deleted', {}).items():
+                    for pk in ids:
+                        changed.setdefault(section, {}).pop(pk, None)
+                        deleted.setdefault(section, set()).add(pk)
+        return changed, deleted
+
+    def default_output(self, full_path, compression):
+        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+        return os.path.join(
+            os.path.dirname(full_path),
+            f'ahmad_poultry_backup_{timestamp}_merged{COMPRESSION_EXTENSIONS[compression]}'
+        )
+
+    def write_snapshot(self, output, compression, chain, changed, deleted):
+        """
+        Stream the full backup into ``output`` with the changes applied.
+
+        Rows of the full backup that were changed or deleted later are
+        skipped and the changed copies merged in, keeping primary key order.
+        """
+        header = {
+            'backup_timestamp': timezone.now().strftime('%Y%m%d_%H%M%S'),
+            'backup_datetime': timezone.now().isoformat(),
+            'kind': 'full',
+            'marks': chain[-1][1]['marks'],
+            'merged_from': [os.path.basename(path) for path, _ in chain],
+        }
+        counts = {}
+        with open_backup_reader(chain[0][0]) as source, open_backup_writer(output, compression) as stream:
+            stream.write(json.dumps(header)[:-1] + ',"data":{')
+            for section, records in BackupReader(source).sections():
+                replaced = changed.pop(section, {})
+                dropped = deleted.get(section, set())
+                kept = (record for record in records if record['pk'] not in replaced and record['pk'] not in dropped)
+                replacements = sorted(replaced.values(), key=record_pk)
+                self.write_section(stream, counts, section, merge(kept, replacements, key=record_pk))
+            # Sections missing from an older full backup
+            for section, replaced in changed.items():
+                if replaced:
+                    self.write_section(stream, counts, section, sorted(replaced.values(), key=record_pk))
+            stream.write('},"counts":%s}' % json.dumps(counts))
+        return counts
+
+    def write_section(self, stream, counts, section, records):
+        if counts:
+            stream.write(',')
+        stream.write(f'{json.dumps(section)}:')
+        counts[section] = write_json_dicts(stream, records)
+        self.stdout.write(f'✓ {counts[section]} {section.replace("_", " ")}')
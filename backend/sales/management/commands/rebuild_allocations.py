@@ -0,0 +1,46 @@
+"""
+Management command to rebuild payment-to-sale allocations for all customers
+Usage: python manage.py rebuild_allocations [--chunk-size 100] [--customer ID]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sales.allocation import rebuild_customer_allocations
+from sales.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Replay every allocated payment and rebuild its allocation records, in chunks of customers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Number of customers rebuilt per transaction (default: 100)'
+        )
+        parser.add_argument(
+            '--customer',
+            type=int,
+            action='append',
+            help='Only rebuild this customer id (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        customer_ids = options['customer'] or list(
+            Payment.objects.filter(auto_allocated=True)
+            .order_by('customer_id')
+            .values_list('customer_id', flat=True)
+            .distinct()
+        )
+
+        self.stdout.write(f'🔄 Rebuilding allocations for {len(customer_ids)} customers...')
+        total_rows = 0
+        for start in range(0, len(customer_ids), chunk_size):
+            chunk = customer_ids[start:start + chunk_size]
+            with transaction.atomic():
+                for customer_id in chunk:
+                    total_rows += rebuild_customer_allocations(customer_id)
+            self.stdout.write(f'✓ {min(start + chunk_size, len(customer_ids))}/{len(customer_ids)} customers')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt {total_rows} allocation records'))
@@ -0,0 +1,39 @@
+"""
+Management command to rebuild and verify materialized customer and supplier balances
+Usage: python manage.py rebuild_balances [--verify-only]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from sales.balances import (
+    customer_balance_mismatches, rebuild_customer_balances,
+    rebuild_supplier_balances, supplier_balance_mismatches
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild stored customer and supplier balances from transactions and verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Only compare stored balances against a recomputation, do not write'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            with transaction.atomic():
+                customers = rebuild_customer_balances()
+                suppliers = rebuild_supplier_balances()
+            self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt balances for {customers} customers'))
+            self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt balances for {suppliers} suppliers'))
+
+        mismatches = customer_balance_mismatches() + supplier_balance_mismatches()
+        for owner, stored, computed in mismatches:
+            self.stdout.write(self.style.WARNING(
+                f'✗ {owner._meta.verbose_name} {owner.name} (#{owner.pk}): stored {stored}, computed {computed}'
+            ))
+
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} balance(s) do not match')
+        self.stdout.write(self.style.SUCCESS('✓ All customer and supplier balances verified'))
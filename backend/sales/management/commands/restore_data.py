@@ -0,0 +1,166 @@
+"""
+Management command to restore the database from a JSON backup
+Usage: python manage.py restore_data <backup.json[.gz|.zst]> [--truncate] [--batch-size 2000]
+
+Records are streamed from the file and inserted with ``bulk_create`` in
+dependency order inside one transaction, so no per-row saves or signals run.
+Materialized data (balances, report rollups, the inventory ledger) is then
+rebuilt from the restored rows and the report cache is cleared.
+"""
+from contextlib import contextmanager
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.python import Deserializer
+from django.db import DatabaseError, connection, transaction
+from reports.cache import report_cache
+from reports.inventory import rebuild_inventory_ledger
+from reports.rollups import rebuild_rollups
+from sales.allocation import rebuild_customer_allocations
+from sales.backups import JSON_SECTIONS, BackupError, BackupReader, open_backup_reader, table_counts
+from sales.balances import rebuild_customer_balances, rebuild_supplier_balances
+from sales.models import Payment
+
+
+@contextmanager
+def restored_timestamps(models):
+    """
+    Keep the backed-up ``auto_now``/``auto_now_add`` values while inserting.
+
+    ``bulk_create`` would otherwise stamp every restored row with the
+    current time.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Restore all data from a JSON backup created by backup_data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup_file', help='JSON backup file (.json, .json.gz or .json.zst)')
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help='Delete all existing data first (otherwise the tables must be empty)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Records inserted per INSERT statement (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.batch_size = max(options['batch_size'], 1)
+        self.models = dict(JSON_SECTIONS)
+
+        self.stdout.write(self.style.SUCCESS(f'\n🔄 Restoring from {options["backup_file"]}...'))
+        try:
+            stream = open_backup_reader(options['backup_file'])
+        except (BackupError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        try:
+            with stream, transaction.atomic():
+                if options['truncate']:
+                    self.truncate()
+                else:
+                    self.check_empty()
+                reader = BackupReader(stream)
+                with restored_timestamps(self.models.values()):
+                    counts = self.insert_all(reader)
+                self.check_counts(counts, reader.metadata.get('counts') or {})
+                self.reset_sequences()
+                self.rebuild_derived(counts)
+                transaction.on_commit(report_cache().clear)
+        except (BackupError, DeserializationError, DatabaseError) as exc:
+            raise CommandError(f'Restore failed, nothing was changed: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✅ Restored {sum(counts.values())} records in {time.monotonic() - started:.1f}s'
+        ))
+
+    def truncate(self):
+        """Delete every row of the restored tables without signals or cascade collection"""
+        tables = [model._meta.db_table for model in self.models.values()]
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables, allow_cascade=True))
+        self.stdout.write(f'🗑  Emptied {len(tables)} tables')
+
+    def check_empty(self):
+        existing = {section: count for section, count in table_counts(self.models).items() if count}
+        if existing:
+            raise CommandError(
+                f'Tables already hold data ({", ".join(existing)}); pass --truncate to replace it'
+            )
+
+    def insert_all(self, reader):
+        counts = {}
+        for section, records in reader.sections():
+            if reader.metadata.get('kind') == 'incremental':
+                raise BackupError('This is an incremental backup; combine it with merge_backups first')
+            if section not in self.models:
+                raise BackupError(f'Unknown section {section!r} in backup file')
+            counts[section] = self.insert(section, records)
+            self.stdout.write(f'✓ Restored {counts[section]} {section.replace("_", " ")}')
+        return counts
+
+    def insert(self, section, records):
+        """Insert a section's records in ``bulk_create`` batches; returns the number inserted"""
+        model = self.models[section]
+        count = 0
+        batch = []
+        for restored in Deserializer(records, ignorenonexistent=True):
+            if type(restored.object) is not model:
+                raise BackupError(f'Section {section!r} holds a {restored.object._meta.label} record')
+            batch.append(restored.object)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def check_counts(self, counts, expected):
+        """Fail when the file's own record counts disagree with what was read"""
+        for section, count in expected.items():
+            if counts.get(section, 0) != count:
+                raise BackupError(f'{section}: backup lists {count} records but holds {counts.get(section, 0)}')
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), list(self.models.values()))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def rebuild_derived(self, counts):
+        """Recompute the data that is not stored in backups from the restored rows"""
+        if 'payment_allocations' not in counts:
+            # Backups taken before allocations were exported: record them again
+            customer_ids = (
+                Payment.objects.filter(auto_allocated=True)
+                .order_by('customer_id').values_list('customer_id', flat=True).distinct()
+            )
+            for customer_id in customer_ids:
+                rebuild_customer_allocations(customer_id, adopt_legacy=True)
+        customers = rebuild_customer_balances()
+        suppliers = rebuild_supplier_balances()
+        self.stdout.write(f'✓ Rebuilt balances for {customers} customers and {suppliers} suppliers')
+        days = rebuild_rollups()
+        stock_days = rebuild_inventory_ledger()
+        self.stdout.write(f'✓ Rebuilt report rollups for {days} dates and inventory for {stock_days} dates')
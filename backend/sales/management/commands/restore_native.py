@@ -0,0 +1,45 @@
+"""
+Management command to restore a native snapshot written by backup_data --format native
+Usage: python manage.py restore_native <snapshot> [--noinput]
+
+The snapshot is checked against its .sha256 file first. All current data is
+replaced: a SQLite snapshot is copied over the whole database, a PostgreSQL
+snapshot truncates every table and copies the data back in one transaction.
+Run ``migrate`` afterwards if the snapshot predates the current code.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from reports.cache import report_cache
+from sales.backups import BackupError
+from sales.native_backups import restore
+
+
+class Command(BaseCommand):
+    help = 'Restore the database from a native snapshot (SQLite backup or PostgreSQL COPY)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', help='Snapshot file written by backup_data --format native')
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation before replacing all data'
+        )
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            answer = input('This replaces ALL data in the database. Type "yes" to continue: ')
+            if answer.strip().lower() != 'yes':
+                raise CommandError('Restore cancelled')
+
+        started = time.monotonic()
+        self.stdout.write(self.style.SUCCESS(f'\n🔄 Restoring snapshot {options["snapshot"]}...'))
+        try:
+            restore(options['snapshot'])
+        except (BackupError, DatabaseError, OSError) as exc:
+            raise CommandError(f'Restore failed: {exc}')
+        report_cache().clear()
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Snapshot restored in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:15
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_current_balance(apps, schema_editor):
+    """Compute every customer's balance from existing transactions"""
+    Customer = apps.get_model('sales', 'Customer')
+    balance_field = DecimalField(max_digits=18, decimal_places=6)
+
+    def total(model_name, expression):
+        queryset = (
+            apps.get_model('sales', model_name).objects
+            .filter(customer=OuterRef('pk'))
+            .order_by()
+            .values('customer')
+            .annotate(total=Sum(expression, output_field=balance_field))
+            .values('total')
+        )
+        return Coalesce(Subquery(queryset), Value(Decimal('0.000')), output_field=balance_field)
+
+    Customer.objects.update(
+        current_balance=(
+            F('opening_balance')
+            + total('Sale', F('kg') * F('sale_rate_per_kg'))
+            - total('Payment', F('amount'))
+            - total('CustomerDeduction', F('amount'))
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0004_migrate_supplier_to_fk"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="current_balance",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=Decimal("0.000"),
+                editable=False,
+                help_text="Materialized running balance, maintained on every sale/payment/deduction write",
+                max_digits=18,
+            ),
+        ),
+        migrations.RunPython(backfill_current_balance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:16
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_current_balance(apps, schema_editor):
+    """Compute every supplier's payable balance from existing transactions"""
+    Supplier = apps.get_model('sales', 'Supplier')
+    balance_field = DecimalField(max_digits=18, decimal_places=6)
+
+    def total(model_name, expression):
+        queryset = (
+            apps.get_model('sales', model_name).objects
+            .filter(supplier=OuterRef('pk'))
+            .order_by()
+            .values('supplier')
+            .annotate(total=Sum(expression, output_field=balance_field))
+            .values('total')
+        )
+        return Coalesce(Subquery(queryset), Value(Decimal('0.000')), output_field=balance_field)
+
+    Supplier.objects.update(
+        current_balance=(
+            F('opening_balance')
+            + total('Purchase', F('kg') * F('cost_rate_per_kg'))
+            - total('Purchase', F('amount_paid'))
+            - total('SupplierPayment', F('amount'))
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0005_customer_current_balance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="supplier",
+            name="current_balance",
+            field=models.DecimalField(
+                decimal_places=6,
+                default=Decimal("0.000"),
+                editable=False,
+                help_text="Materialized payable balance, maintained on every purchase/supplier payment write",
+                max_digits=18,
+            ),
+        ),
+        migrations.RunPython(backfill_current_balance, migrations.RunPython.noop),
+    ]
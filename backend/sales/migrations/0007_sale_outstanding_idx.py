@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:17
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0006_supplier_current_balance"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                condition=models.Q(
+                    (
+                        "amount_received__lt",
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("kg"), "*", models.F("sale_rate_per_kg")
+                        ),
+                    )
+                ),
+                fields=["customer", "date", "created_at"],
+                name="sale_outstanding_idx",
+            ),
+        ),
+    ]
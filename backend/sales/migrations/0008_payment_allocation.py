@@ -0,0 +1,93 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:19
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def adopt_legacy_allocations(apps, schema_editor):
+    """
+    Record allocations for payments allocated before allocation rows existed.
+
+    Their amounts were added straight to ``Sale.amount_received``, so they
+    are taken back off each customer's oldest sales and replayed.
+    """
+    from sales.allocation import rebuild_customer_allocations
+
+    Payment = apps.get_model('sales', 'Payment')
+    customer_ids = (
+        Payment.objects.filter(auto_allocated=True)
+        .order_by('customer_id')
+        .values_list('customer_id', flat=True)
+        .distinct()
+    )
+    for customer_id in customer_ids:
+        rebuild_customer_allocations(
+            customer_id,
+            sale_model=apps.get_model('sales', 'Sale'),
+            payment_model=Payment,
+            allocation_model=apps.get_model('sales', 'PaymentAllocation'),
+            adopt_legacy=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0007_sale_outstanding_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentAllocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=3,
+                        max_digits=12,
+                        validators=[
+                            django.core.validators.MinValueValidator(Decimal("0.001"))
+                        ],
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="allocations",
+                        to="sales.payment",
+                    ),
+                ),
+                (
+                    "sale",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="allocations",
+                        to="sales.sale",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="paymentallocation",
+            constraint=models.UniqueConstraint(
+                fields=("payment", "sale"), name="unique_payment_sale_allocation"
+            ),
+        ),
+        migrations.RunPython(adopt_legacy_allocations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:03
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0010_incremental_backups"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="sale",
+            name="sale_outstanding_idx",
+        ),
+        migrations.AddField(
+            model_name="purchase",
+            name="borrow_amount",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("kg"), "*", models.F("cost_rate_per_kg")
+                    ),
+                    "-",
+                    models.F("amount_paid"),
+                ),
+                help_text="Outstanding amount owed to supplier",
+                output_field=models.DecimalField(decimal_places=6, max_digits=18),
+            ),
+        ),
+        migrations.AddField(
+            model_name="purchase",
+            name="total_cost",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    models.F("kg"), "*", models.F("cost_rate_per_kg")
+                ),
+                help_text="Total cost of purchase",
+                output_field=models.DecimalField(decimal_places=6, max_digits=18),
+            ),
+        ),
+        migrations.AddField(
+            model_name="sale",
+            name="borrow_amount",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("kg"), "*", models.F("sale_rate_per_kg")
+                    ),
+                    "-",
+                    models.F("amount_received"),
+                ),
+                help_text="Amount still to be collected",
+                output_field=models.DecimalField(decimal_places=6, max_digits=18),
+            ),
+        ),
+        migrations.AddField(
+            model_name="sale",
+            name="profit",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    models.F("kg"),
+                    "*",
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("sale_rate_per_kg"),
+                        "-",
+                        models.F("cost_rate_snapshot"),
+                    ),
+                ),
+                help_text="Profit at the cost rate snapshot",
+                output_field=models.DecimalField(decimal_places=6, max_digits=18),
+            ),
+        ),
+        migrations.AddField(
+            model_name="sale",
+            name="total_amount",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    models.F("kg"), "*", models.F("sale_rate_per_kg")
+                ),
+                help_text="Total sale amount",
+                output_field=models.DecimalField(decimal_places=6, max_digits=18),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                condition=models.Q(("borrow_amount__gt", 0)),
+                fields=["customer", "date", "created_at"],
+                name="sale_outstanding_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                condition=models.Q(("borrow_amount__gt", 0)),
+                fields=["-date", "-created_at"],
+                name="sale_receivable_idx",
+            ),
+        ),
+    ]
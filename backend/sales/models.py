@@ -1,9 +1,98 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
 
-class Customer(models.Model):
+def amount_field():
+    """Output field of the generated amounts: kg * rate at full precision, like the stored balances"""
+    return models.DecimalField(max_digits=18, decimal_places=6)
+
+
+class TrackedModel(models.Model):
+    """
+    Abstract base for transaction rows that feed materialized data.
+
+    Every save runs inside a database transaction and keeps the row as it was
+    before the write in ``_previous`` (``None`` on insert), so the receivers in
+    ``sales.signals`` and ``reports.signals`` can apply exact deltas within
+    the same transaction. Generated columns are read back after an update;
+    inserts get them from the ``INSERT`` itself.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self._previous = None
+            if self.pk is not None and not self._state.adding:
+                self._previous = (
+                    type(self)._default_manager.select_for_update()
+                    .filter(pk=self.pk).values().first()
+                )
+            super().save(*args, **kwargs)
+            generated = [field.attname for field in self._meta.concrete_fields if field.generated]
+            if self._previous is not None and generated:
+                self.refresh_from_db(fields=generated)
+            self.after_save(self._previous)
+
+    def after_save(self, previous):
+        """
+        Hook run in the save's transaction after all ``post_save`` receivers.
+
+        Work that changes other rows based on this one belongs here, so the
+        receivers all see the row exactly as it was written.
+        """
+
+
+class StoredBalanceModel(models.Model):
+    """
+    Abstract base for parties carrying a materialized ``current_balance``.
+
+    The balance is only ever changed with relative ``F()`` updates, so saves
+    never write a possibly stale in-memory value back. Opening balance edits
+    are applied to it as a delta.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        model = type(self)
+        if self._state.adding:
+            self.current_balance = self.opening_balance
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous_opening = (
+                model._default_manager.select_for_update()
+                .filter(pk=self.pk)
+                .values_list('opening_balance', flat=True)
+                .first()
+            )
+            if previous_opening is None:
+                return super().save(*args, **kwargs)
+
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != 'current_balance'
+                ]
+            super().save(*args, **kwargs)
+
+            delta = self.opening_balance - previous_opening
+            if delta:
+                model._default_manager.filter(pk=self.pk).update(
+                    current_balance=F('current_balance') + delta
+                )
+            self.refresh_from_db(fields=['current_balance'])
+
+
+class Customer(StoredBalanceModel):
     """Customer model to store customer information"""
     name = models.CharField(max_length=255, unique=True, db_index=True)
     phone = models.CharField(max_length=20, blank=True)
@@ -14,6 +103,14 @@ class Customer(models.Model):
         default=Decimal('0.000'),
         validators=[MinValueValidator(Decimal('0.000'))]
     )
+    # Stored with 6 decimal places so sums of kg * rate stay exact
+    current_balance = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        default=Decimal('0.000'),
+        editable=False,
+        help_text="Materialized running balance, maintained on every sale/payment/deduction write"
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -30,25 +127,8 @@ class Customer(models.Model):
 
     @property
     def running_balance(self):
-        """Calculate customer's running balance"""
-        from django.db.models import F, Sum
-        
-        # Calculate total sales: sum of (kg * sale_rate_per_kg) for each sale
-        total_sales = self.sales.aggregate(
-            total=Sum(F('kg') * F('sale_rate_per_kg'))
-        )['total'] or Decimal('0.000')
-        
-        # Calculate total payments
-        total_payments = self.payments.aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.000')
-        
-        # Calculate total deductions (reduces what customer owes)
-        total_deductions = self.deductions.aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.000')
-        
-        return self.opening_balance + total_sales - total_payments - total_deductions
+        """Customer's running balance (opening + sales - payments - deductions)"""
+        return self.current_balance
 
 
 class DailyRate(models.Model):
@@ -77,7 +157,7 @@ class DailyRate(models.Model):
         return f"{self.date} - Cost: {self.default_cost_rate}, Sale: {self.default_sale_rate}"
 
 
-class Supplier(models.Model):
+class Supplier(StoredBalanceModel):
     """Supplier model to store supplier information"""
     name = models.CharField(max_length=255, unique=True, db_index=True)
     phone = models.CharField(max_length=20, blank=True)
@@ -88,6 +168,14 @@ class Supplier(models.Model):
         validators=[MinValueValidator(Decimal('0.000'))],
         help_text="Opening balance we owe to supplier"
     )
+    # Stored with 6 decimal places so sums of kg * rate stay exact
+    current_balance = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        default=Decimal('0.000'),
+        editable=False,
+        help_text="Materialized payable balance, maintained on every purchase/supplier payment write"
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -104,29 +192,11 @@ class Supplier(models.Model):
 
     @property
     def closing_balance(self):
-        """Calculate supplier's closing balance (what we owe them)"""
-        from django.db.models import F, Sum
-        
-        # Calculate total purchases: sum of (kg * cost_rate_per_kg) for each purchase
-        total_purchases = self.purchases.aggregate(
-            total=Sum(F('kg') * F('cost_rate_per_kg'))
-        )['total'] or Decimal('0.000')
-        
-        # Calculate total paid to supplier (from purchases)
-        total_paid_in_purchases = self.purchases.aggregate(
-            total=Sum('amount_paid')
-        )['total'] or Decimal('0.000')
-        
-        # Calculate total standalone payments to supplier
-        total_standalone_payments = self.supplier_payments.aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('0.000')
-        
-        # Closing balance = opening + total purchases - total paid in purchases - standalone payments
-        return self.opening_balance + total_purchases - total_paid_in_purchases - total_standalone_payments
-
-
-class Purchase(models.Model):
+        """Supplier's closing balance (what we owe them)"""
+        return self.current_balance
+
+
+class Purchase(TrackedModel):
     """Track daily purchases from poultry farms"""
     date = models.DateField(db_index=True)
     supplier = models.ForeignKey(
@@ -154,6 +224,20 @@ class Purchase(models.Model):
         validators=[MinValueValidator(Decimal('0.000'))],
         help_text="Amount paid to supplier for this purchase"
     )
+    # Computed by the database on every write; generated columns cannot
+    # refer to each other, so each repeats the arithmetic
+    total_cost = models.GeneratedField(
+        expression=F('kg') * F('cost_rate_per_kg'),
+        output_field=amount_field(),
+        db_persist=True,
+        help_text="Total cost of purchase"
+    )
+    borrow_amount = models.GeneratedField(
+        expression=F('kg') * F('cost_rate_per_kg') - F('amount_paid'),
+        output_field=amount_field(),
+        db_persist=True,
+        help_text="Outstanding amount owed to supplier"
+    )
     note = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -170,25 +254,15 @@ class Purchase(models.Model):
         supplier_name = self.supplier.name if self.supplier else "No Supplier"
         return f"{self.date} - {supplier_name} - {self.kg}kg @ {self.cost_rate_per_kg}/kg"
 
-    @property
-    def total_cost(self):
-        """Calculate total cost of purchase"""
-        return self.kg * self.cost_rate_per_kg
-    
-    @property
-    def borrow_amount(self):
-        """Calculate outstanding amount owed to supplier"""
-        return self.total_cost - self.amount_paid
-    
     @property
     def supplier_closing_balance(self):
-        """Get supplier's closing balance at time of this purchase"""
+        """Get supplier's current closing balance"""
         if self.supplier:
-            return self.supplier.closing_balance
+            return self.supplier.current_balance
         return Decimal('0.000')
 
 
-class Sale(models.Model):
+class Sale(TrackedModel):
     """Track sales to customers"""
     date = models.DateField(db_index=True)
     customer = models.ForeignKey(
@@ -218,6 +292,24 @@ class Sale(models.Model):
         default=Decimal('0.000'),
         validators=[MinValueValidator(Decimal('0.000'))]
     )
+    total_amount = models.GeneratedField(
+        expression=F('kg') * F('sale_rate_per_kg'),
+        output_field=amount_field(),
+        db_persist=True,
+        help_text="Total sale amount"
+    )
+    borrow_amount = models.GeneratedField(
+        expression=F('kg') * F('sale_rate_per_kg') - F('amount_received'),
+        output_field=amount_field(),
+        db_persist=True,
+        help_text="Amount still to be collected"
+    )
+    profit = models.GeneratedField(
+        expression=F('kg') * (F('sale_rate_per_kg') - F('cost_rate_snapshot')),
+        output_field=amount_field(),
+        db_persist=True,
+        help_text="Profit at the cost rate snapshot"
+    )
     note = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -228,28 +320,30 @@ class Sale(models.Model):
             models.Index(fields=['date']),
             models.Index(fields=['customer', 'date']),
             models.Index(fields=['-date', '-created_at']),
+            # Only sales with something left to collect, for payment allocation
+            models.Index(
+                fields=['customer', 'date', 'created_at'],
+                condition=models.Q(borrow_amount__gt=0),
+                name='sale_outstanding_idx',
+            ),
+            # Receivables list: outstanding sales, newest first
+            models.Index(
+                fields=['-date', '-created_at'],
+                condition=models.Q(borrow_amount__gt=0),
+                name='sale_receivable_idx',
+            ),
         ]
 
     def __str__(self):
         return f"{self.date} - {self.customer.name} - {self.kg}kg"
 
-    @property
-    def total_amount(self):
-        """Calculate total sale amount"""
-        return self.kg * self.sale_rate_per_kg
+    def after_save(self, previous):
+        """Release or reapply payment allocations affected by an edit"""
+        from .allocation import sale_changed
+        sale_changed(self, previous)
 
-    @property
-    def borrow_amount(self):
-        """Calculate outstanding amount"""
-        return self.total_amount - self.amount_received
-
-    @property
-    def profit(self):
-        """Calculate profit on this sale"""
-        return self.kg * (self.sale_rate_per_kg - self.cost_rate_snapshot)
 
-
-class Payment(models.Model):
+class Payment(TrackedModel):
     """Track customer payments"""
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
@@ -295,36 +389,47 @@ class Payment(models.Model):
         """
         if self.auto_allocated:
             return  # Already allocated
-        
-        remaining_amount = self.amount
-        
-        # Get customer's sales with outstanding borrow amounts
-        # Prioritize: same date first, then oldest first
-        sales_same_date = self.customer.sales.filter(date=self.date).order_by('created_at')
-        sales_other_dates = self.customer.sales.exclude(date=self.date).order_by('date', 'created_at')
-        
-        # Combine querysets: same date first, then others
-        from itertools import chain
-        all_sales = list(chain(sales_same_date, sales_other_dates))
-        
-        for sale in all_sales:
-            if remaining_amount <= 0:
-                break
-            
-            current_borrow = sale.borrow_amount
-            if current_borrow > 0:
-                # Allocate as much as possible to this sale
-                allocation = min(remaining_amount, current_borrow)
-                sale.amount_received = sale.amount_received + allocation
-                sale.save(update_fields=['amount_received', 'updated_at'])
-                remaining_amount -= allocation
-        
-        # Mark payment as allocated
-        self.auto_allocated = True
-        self.save(update_fields=['auto_allocated', 'updated_at'])
-
-
-class Expense(models.Model):
+
+        from .allocation import allocate_payment
+        allocate_payment(self)
+
+    def after_save(self, previous):
+        """Reapply this payment's allocations after an edit"""
+        from .allocation import payment_changed
+        payment_changed(self, previous)
+
+
+class PaymentAllocation(models.Model):
+    """Portion of a payment applied to a sale's amount received"""
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.CASCADE,
+        related_name='allocations'
+    )
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.CASCADE,
+        related_name='allocations'
+    )
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=3,
+        validators=[MinValueValidator(Decimal('0.001'))]
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'sale'], name='unique_payment_sale_allocation'),
+        ]
+
+    def __str__(self):
+        return f"Payment #{self.payment_id} -> Sale #{self.sale_id}: {self.amount}"
+
+
+class Expense(TrackedModel):
     """Track business expenses"""
     EXPENSE_CATEGORIES = [
         ('van_repair', 'Van Repair'),
@@ -357,7 +462,7 @@ class Expense(models.Model):
         return f"{self.date} - {self.get_category_display()} - {self.amount}"
 
 
-class CustomerDeduction(models.Model):
+class CustomerDeduction(TrackedModel):
     """Track deductions from customer balance (e.g., returns, discounts, adjustments)"""
     DEDUCTION_TYPES = [
         ('return', 'Product Return'),
@@ -399,7 +504,7 @@ class CustomerDeduction(models.Model):
         return f"{self.date} - {self.customer.name} - Deduction: {self.amount}"
 
 
-class SupplierPayment(models.Model):
+class SupplierPayment(TrackedModel):
     """Track standalone payments to suppliers (outside of purchase transactions)"""
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
@@ -434,3 +539,63 @@ class SupplierPayment(models.Model):
 
     def __str__(self):
         return f"{self.date} - {self.supplier.name} - Payment: {self.amount}"
+
+
+class DeletionLog(models.Model):
+    """
+    A deleted row of a backed-up table.
+
+    Written by ``sales.signals`` on every delete, so incremental backups can
+    carry deletions as well as the rows changed since their ``updated_at``
+    high-water marks.
+    """
+    section = models.CharField(max_length=40, help_text="Backup section of the deleted row's table")
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-deleted_at']
+
+    def __str__(self):
+        return f"{self.section} #{self.object_id} deleted {self.deleted_at}"
+
+
+class BackupJob(models.Model):
+    """
+    A backup run started from the API.
+
+    Jobs run on the thread pool in ``sales.jobs``; their state lives here so
+    any server process can report progress and serve the finished files.
+    """
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    options = models.JSONField(default=dict, blank=True, help_text="backup_data options of this run")
+    totals = models.JSONField(default=dict, blank=True, help_text="Rows per table when the run started")
+    progress = models.JSONField(default=dict, blank=True, help_text="Rows written per file and table")
+    excel_file = models.CharField(max_length=255, blank=True)
+    json_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='backup_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Backup {self.id} ({self.status})"
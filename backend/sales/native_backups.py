@@ -0,0 +1,195 @@
+"""
+Native database snapshots for disaster recovery.
+
+These bypass the ORM and copy the database with its own tools:
+
+- SQLite: ``sqlite3.Connection.backup`` copies the database page by page in
+  steps of ``SQLITE_PAGES_PER_STEP``, so other connections keep reading and
+  writing between steps. The snapshot is a complete database file.
+- PostgreSQL: every Django table is streamed with ``COPY ... TO STDOUT``
+  inside one read-only repeatable-read transaction, giving a consistent
+  snapshot. The file is a data-only script in ``pg_dump``'s plain format
+  (``COPY ... FROM stdin;`` blocks), so ``psql`` can load it too. Generated
+  columns are left out of the column lists: the database computes them and
+  ``COPY ... FROM`` rejects them.
+
+Snapshots are compressed like JSON backups and get a ``<file>.sha256``
+checksum in ``sha256sum`` format, which restores verify first. Restores
+replace all data: SQLite copies the snapshot over the live database,
+PostgreSQL truncates the tables of the migrated schema and copies the data
+back in one transaction.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .backups import (
+    BACKUP_PREFIX, COMPRESSION_SUFFIXES, NATIVE_EXTENSIONS, BackupError, open_binary_reader, open_binary_writer
+)
+
+SQLITE_PAGES_PER_STEP = 1024
+COPY_END = b'\\.\n'
+
+
+def snapshot_filename(output_dir, timestamp, compression):
+    if connection.vendor not in NATIVE_EXTENSIONS:
+        raise BackupError(f'Native backups are not supported on {connection.vendor}')
+    return os.path.join(
+        output_dir,
+        f'{BACKUP_PREFIX}{timestamp}{NATIVE_EXTENSIONS[connection.vendor]}{COMPRESSION_SUFFIXES[compression]}'
+    )
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_checksum(path):
+    """Write ``<path>.sha256`` and return the digest"""
+    digest = file_sha256(path)
+    with open(f'{path}.sha256', 'w', encoding='utf-8') as stream:
+        stream.write(f'{digest}  {os.path.basename(path)}\n')
+    return digest
+
+
+def verify_checksum(path):
+    """Raise ``BackupError`` unless ``path`` matches its ``.sha256`` file"""
+    try:
+        with open(f'{path}.sha256', encoding='utf-8') as stream:
+            expected = stream.read().split()[0]
+    except (OSError, IndexError):
+        raise BackupError(f'No checksum file {os.path.basename(path)}.sha256')
+    if file_sha256(path) != expected:
+        raise BackupError(f'{os.path.basename(path)} does not match its checksum')
+
+
+def snapshot(output_dir, timestamp, compression='gzip'):
+    """Write a native snapshot of the default database; returns ``(path, sha256)``"""
+    path = snapshot_filename(output_dir, timestamp, compression)
+    if connection.vendor == 'sqlite':
+        _snapshot_sqlite(path, compression)
+    else:
+        _snapshot_postgresql(path, compression)
+    return path, write_checksum(path)
+
+
+def _snapshot_sqlite(path, compression):
+    connection.ensure_connection()
+    directory = os.path.dirname(path) or None
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.sqlite3', delete=False) as temporary:
+        temporary_path = temporary.name
+    try:
+        target = sqlite3.connect(temporary_path)
+        try:
+            connection.connection.backup(target, pages=SQLITE_PAGES_PER_STEP)
+        finally:
+            target.close()
+        with open(temporary_path, 'rb') as source, open_binary_writer(path, compression) as stream:
+            shutil.copyfileobj(source, stream, 1 << 20)
+    finally:
+        os.remove(temporary_path)
+
+
+def _generated_columns(table):
+    """Columns of ``table`` that the database computes, which ``COPY`` cannot load"""
+    return {
+        field.column
+        for model in apps.get_models(include_auto_created=True) if model._meta.db_table == table
+        for field in model._meta.concrete_fields if field.generated
+    }
+
+
+def _table_columns(cursor, table):
+    quote = connection.ops.quote_name
+    description = connection.introspection.get_table_description(cursor, table)
+    generated = _generated_columns(table)
+    columns = ', '.join(quote(column.name) for column in description if column.name not in generated)
+    return f'{quote(table)} ({columns})'
+
+
+def _snapshot_postgresql(path, compression):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        tables = sorted(connection.introspection.django_table_names(only_existing=True, include_views=False))
+        with open_binary_writer(path, compression) as stream:
+            for table in tables:
+                target = _table_columns(cursor, table)
+                stream.write(f'COPY {target} FROM stdin;\n'.encode('utf-8'))
+                cursor.copy_expert(f'COPY {target} TO STDOUT', stream)
+                stream.write(COPY_END + b'\n')
+
+
+def restore(path):
+    """Verify and restore the native snapshot at ``path`` into the default database"""
+    verify_checksum(path)
+    if NATIVE_EXTENSIONS['sqlite'] in os.path.basename(path):
+        if connection.vendor != 'sqlite':
+            raise BackupError('This is a SQLite snapshot; the database is not SQLite')
+        _restore_sqlite(path)
+    else:
+        if connection.vendor != 'postgresql':
+            raise BackupError('This is a PostgreSQL snapshot; the database is not PostgreSQL')
+        _restore_postgresql(path)
+
+
+def _restore_sqlite(path):
+    with tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False) as temporary:
+        with open_binary_reader(path) as stream:
+            shutil.copyfileobj(stream, temporary, 1 << 20)
+    try:
+        source = sqlite3.connect(temporary.name)
+        try:
+            connection.ensure_connection()
+            source.backup(connection.connection, pages=SQLITE_PAGES_PER_STEP)
+        finally:
+            source.close()
+    finally:
+        os.remove(temporary.name)
+
+
+class _CopyBlock:
+    """File-like view of one ``COPY`` block's data, ending at its ``\\.`` line"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.done = False
+
+    def readline(self, size=-1):
+        if self.done:
+            return b''
+        line = self.stream.readline()
+        if not line:
+            raise BackupError('Unexpected end of snapshot file')
+        if line == COPY_END:
+            self.done = True
+            return b''
+        return line
+
+    def read(self, size=-1):
+        return self.readline()
+
+
+def _restore_postgresql(path):
+    quote = connection.ops.quote_name
+    tables = connection.introspection.django_table_names(only_existing=True, include_views=False)
+    with transaction.atomic(), connection.cursor() as cursor, open_binary_reader(path) as stream:
+        cursor.execute(f'TRUNCATE {", ".join(quote(table) for table in tables)} RESTART IDENTITY CASCADE')
+        for line in iter(stream.readline, b''):
+            line = line.decode('utf-8').strip()
+            if not line:
+                continue
+            if not (line.startswith('COPY ') and line.endswith(' FROM stdin;')):
+                raise BackupError(f'Unexpected line in snapshot file: {line[:80]}')
+            cursor.copy_expert(line[:-len(' stdin;')] + ' STDIN', _CopyBlock(stream))
+        for sql in connection.ops.sequence_reset_sql(no_style(), apps.get_models()):
+            cursor.execute(sql)
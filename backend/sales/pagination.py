@@ -0,0 +1,224 @@
+"""
+Pagination for the transaction list endpoints.
+
+``TransactionPagination`` keeps the default page-number behaviour and adds
+two opt-in modes per request:
+
+- ``?pagination=cursor`` (or any request carrying ``cursor``) pages with a
+  keyset on ``(date, created_at, id)``. Each page is one indexed range scan
+  with no ``COUNT(*)`` and no ``OFFSET``, so page 10,000 costs the same as
+  page 1. Ordering is ``-date`` (default) or ``date``.
+- ``?count=false`` with page numbers skips the exact ``COUNT(*)``; ``count``
+  is returned as ``null`` and ``next`` is decided by fetching one extra row.
+  Pages are still read with ``OFFSET``, so only the count is saved and deep
+  pages still cost in proportion to their offset; use cursor mode for those.
+"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+KEYSET_FIELDS = ('date', 'created_at', 'id')
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on ``(date, created_at, id)``"""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 25)
+    max_page_size = settings.REST_FRAMEWORK.get('MAX_PAGE_SIZE', 1000)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.descending = self.get_descending(request)
+
+        position, reverse = self.decode_cursor(request)
+        # Walking backwards reads the rows before the cursor in the opposite order
+        descending = self.descending != reverse
+        direction = '-' if descending else ''
+        queryset = queryset.order_by(*(direction + field for field in KEYSET_FIELDS))
+        if position is not None:
+            queryset = queryset.filter(self.after(position, descending))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (position is not None) if not reverse else has_more
+        self.first = rows[0] if rows else None
+        self.last = rows[-1] if rows else None
+        if not rows and reverse:
+            self.has_next = False
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be a positive integer'})
+        if size < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be a positive integer'})
+        return min(size, self.max_page_size)
+
+    def get_descending(self, request):
+        ordering = request.query_params.get('ordering', '-date')
+        if ordering not in ('-date', 'date'):
+            raise ValidationError({'ordering': "Cursor pagination only supports ordering by 'date' or '-date'"})
+        return ordering == '-date'
+
+    @staticmethod
+    def after(position, descending):
+        """Rows strictly after ``position`` in the keyset order"""
+        day, created_at, pk = position
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'date__{op}': day})
+            | Q(date=day, **{f'created_at__{op}': created_at})
+            | Q(date=day, created_at=created_at, **{f'id__{op}': pk})
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = (
+                date.fromisoformat(payload['d']),
+                datetime.fromisoformat(payload['c']),
+                int(payload['i']),
+            )
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        payload = {'d': row.date.isoformat(), 'c': row.created_at.isoformat(), 'i': row.pk}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            # Walked past the start; the first page has no cursor
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.first, reverse=True)
+
+
+class TransactionPagination(PageNumberPagination):
+    """
+    Page-number pagination with per-request keyset and count-free modes.
+
+    See the module docstring for the query parameters.
+    """
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset_class = KeysetPagination
+    # Row fields the cursors are built from; sparse fieldsets always load them
+    keyset_fields = KEYSET_FIELDS
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        self.skip_count = request.query_params.get(self.count_query_param, '').lower() in ('false', '0', 'no')
+        if self.skip_count:
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_without_count(self, queryset, request):
+        """Page-number paging that skips ``COUNT(*)`` but still reads with ``OFFSET``"""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number=None, message='Invalid page.'))
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=self.page_number, message='Invalid page.'))
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next_page = len(rows) > page_size
+        rows = rows[:page_size]
+        if not rows and self.page_number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.page_number, message='That page contains no results'
+            ))
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        if self.skip_count:
+            return Response(OrderedDict([
+                ('count', None),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if not self.skip_count:
+            return super().get_next_link()
+        if not self.has_next_page:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if not self.skip_count:
+            return super().get_previous_link()
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
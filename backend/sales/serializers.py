@@ -1,9 +1,74 @@
+import os
+
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment
+from rest_framework.reverse import reverse
+from .backups import COMPRESSION_EXTENSIONS
+from .balances import BalanceLoader
+from .fieldsets import SparseFieldsMixin
+from .models import (
+    Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment, BackupJob
+)
 from decimal import Decimal
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class BalanceListSerializer(serializers.ListSerializer):
+    """Primes the balance loader with the owners of every row before rendering any of them"""
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.prime_balances(rows)
+        return super().to_representation(rows)
+
+
+class BalanceFieldsMixin:
+    """
+    Serializer mixin reading owner balances through a ``BalanceLoader``.
+
+    ``Meta.balance_fields`` maps each balance field to the foreign key of its
+    owner. The loader is kept in the ``balances`` context entry, created on
+    first use unless the caller passes one, so it lives as long as the
+    request's serializer. Balances of owners already loaded with the row
+    (``select_related``) are used as they are.
+    """
+
+    def balance_loader(self):
+        return self.context.setdefault('balances', BalanceLoader())
+
+    def _owner_field(self, name):
+        return self.Meta.model._meta.get_field(self.Meta.balance_fields[name])
+
+    def _loaded_balance(self, obj, field):
+        owner = field.get_cached_value(obj, default=None)
+        if owner is not None and 'current_balance' not in owner.get_deferred_fields():
+            return owner
+        return None
+
+    def prime_balances(self, rows):
+        loader = self.balance_loader()
+        for name in self.Meta.balance_fields:
+            if name not in self.fields:
+                continue
+            field = self._owner_field(name)
+            ids = []
+            for row in rows:
+                owner = self._loaded_balance(row, field)
+                if owner is not None:
+                    loader.put(field.related_model, owner.pk, owner.current_balance)
+                else:
+                    ids.append(getattr(row, field.attname))
+            loader.prime(field.related_model, ids)
+
+    def owner_balance(self, obj, name):
+        field = self._owner_field(name)
+        owner = self._loaded_balance(obj, field)
+        if owner is not None:
+            return owner.current_balance
+        return self.balance_loader().get(field.related_model, getattr(obj, field.attname))
+
+
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     running_balance = serializers.DecimalField(
         max_digits=12, 
         decimal_places=3, 
@@ -17,9 +82,10 @@ class CustomerSerializer(serializers.ModelSerializer):
             'is_active', 'running_balance', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        field_sources = {'running_balance': ['current_balance']}
 
 
-class DailyRateSerializer(serializers.ModelSerializer):
+class DailyRateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = DailyRate
         fields = [
@@ -29,7 +95,7 @@ class DailyRateSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     closing_balance = serializers.DecimalField(
         max_digits=12,
         decimal_places=3,
@@ -43,9 +109,10 @@ class SupplierSerializer(serializers.ModelSerializer):
             'is_active', 'closing_balance', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        field_sources = {'closing_balance': ['current_balance']}
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class PurchaseSerializer(BalanceFieldsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
     supplier_closing_balance = serializers.SerializerMethodField()
     total_cost = serializers.DecimalField(
@@ -67,11 +134,14 @@ class PurchaseSerializer(serializers.ModelSerializer):
             'supplier_closing_balance', 'note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = BalanceListSerializer
+        balance_fields = {'supplier_closing_balance': 'supplier'}
+        field_sources = {'supplier_closing_balance': ['supplier__current_balance']}
     
     def get_supplier_closing_balance(self, obj):
         """Get supplier's current closing balance"""
-        if obj.supplier:
-            return obj.supplier.closing_balance
+        if obj.supplier_id:
+            return self.owner_balance(obj, 'supplier_closing_balance')
         return Decimal('0.000')
     
     def validate(self, data):
@@ -90,7 +160,7 @@ class PurchaseSerializer(serializers.ModelSerializer):
         return data
 
 
-class SaleSerializer(serializers.ModelSerializer):
+class SaleSerializer(BalanceFieldsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     customer_name = serializers.CharField(source='customer.name', read_only=True)
     customer_closing_balance = serializers.SerializerMethodField()
     total_amount = serializers.DecimalField(
@@ -118,10 +188,13 @@ class SaleSerializer(serializers.ModelSerializer):
             'note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = BalanceListSerializer
+        balance_fields = {'customer_closing_balance': 'customer'}
+        field_sources = {'customer_closing_balance': ['customer__current_balance']}
     
     def get_customer_closing_balance(self, obj):
         """Get customer's current closing balance"""
-        return obj.customer.running_balance
+        return self.owner_balance(obj, 'customer_closing_balance')
 
     def validate(self, data):
         """Validate that amount_received doesn't exceed total_amount"""
@@ -139,7 +212,7 @@ class SaleSerializer(serializers.ModelSerializer):
         return data
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer_name = serializers.CharField(source='customer.name', read_only=True)
     
     class Meta:
@@ -151,7 +224,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'auto_allocated']
 
 
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_display = serializers.CharField(source='get_category_display', read_only=True)
     
     class Meta:
@@ -161,9 +234,10 @@ class ExpenseSerializer(serializers.ModelSerializer):
             'note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        field_sources = {'category_display': ['category']}
 
 
-class CustomerDeductionSerializer(serializers.ModelSerializer):
+class CustomerDeductionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer_name = serializers.CharField(source='customer.name', read_only=True)
     deduction_type_display = serializers.CharField(source='get_deduction_type_display', read_only=True)
     
@@ -174,9 +248,10 @@ class CustomerDeductionSerializer(serializers.ModelSerializer):
             'deduction_type', 'deduction_type_display', 'note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        field_sources = {'deduction_type_display': ['deduction_type']}
 
 
-class SupplierPaymentSerializer(serializers.ModelSerializer):
+class SupplierPaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
     method_display = serializers.CharField(source='get_method_display', read_only=True)
     
@@ -187,4 +262,78 @@ class SupplierPaymentSerializer(serializers.ModelSerializer):
             'method', 'method_display', 'note', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        field_sources = {'method_display': ['method']}
+
+
+class BackupRequestSerializer(serializers.Serializer):
+    """Options accepted when starting a backup job"""
+    excel_mode = serializers.ChoiceField(choices=['streaming', 'standard'], default='streaming')
+    json_compression = serializers.ChoiceField(choices=list(COMPRESSION_EXTENSIONS), default='none')
+
+
+class LookupRequestSerializer(serializers.Serializer):
+    """Query parameters of the customer and supplier ``lookup`` actions"""
+    search = serializers.CharField(default='', allow_blank=True, trim_whitespace=True)
+    is_active = serializers.BooleanField(default=None, allow_null=True)
+    limit = serializers.IntegerField(default=None, allow_null=True, min_value=1)
+
+
+class LedgerRequestSerializer(serializers.Serializer):
+    """Query parameters of the customer statement in ``ledger`` mode"""
+    start_date = serializers.DateField(default=None, allow_null=True)
+    end_date = serializers.DateField(default=None, allow_null=True)
+    page_size = serializers.IntegerField(
+        default=100, min_value=1, max_value=settings.REST_FRAMEWORK.get('MAX_PAGE_SIZE', 1000)
+    )
+
+    def validate(self, data):
+        if data['start_date'] and data['end_date'] and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError('start_date cannot be after end_date')
+        return data
+
+
+class LedgerEntrySerializer(serializers.Serializer):
+    """One sale, payment or deduction of a customer ledger with the balance after it"""
+    kind = serializers.CharField()
+    id = serializers.IntegerField()
+    date = serializers.DateField()
+    created_at = serializers.DateTimeField()
+    kg = serializers.DecimalField(max_digits=10, decimal_places=3, allow_null=True)
+    rate = serializers.DecimalField(max_digits=10, decimal_places=3, allow_null=True)
+    method = serializers.CharField(allow_null=True)
+    deduction_type = serializers.CharField(allow_null=True)
+    note = serializers.CharField()
+    debit = serializers.DecimalField(max_digits=12, decimal_places=3)
+    credit = serializers.DecimalField(max_digits=12, decimal_places=3)
+    balance = serializers.DecimalField(max_digits=12, decimal_places=3)
+
+
+class BackupJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    excel_file = serializers.SerializerMethodField()
+    json_file = serializers.SerializerMethodField()
+    downloads = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BackupJob
+        fields = [
+            'id', 'status', 'options', 'totals', 'progress', 'excel_file', 'json_file',
+            'downloads', 'error', 'created_at', 'started_at', 'finished_at', 'updated_at'
+        ]
+        read_only_fields = fields
+        field_sources = {'downloads': ['id', 'status', 'excel_file', 'json_file']}
+
+    def get_excel_file(self, obj):
+        return os.path.basename(obj.excel_file) or None
+
+    def get_json_file(self, obj):
+        return os.path.basename(obj.json_file) or None
 
+    def get_downloads(self, obj):
+        """Download URL of each finished file"""
+        if obj.status != 'completed':
+            return {}
+        request = self.context.get('request')
+        return {
+            artifact: reverse('backup-job-download', args=[obj.pk], request=request) + f'?artifact={artifact}'
+            for artifact in ('excel', 'json') if getattr(obj, f'{artifact}_file')
+        }
@@ -0,0 +1,107 @@
+"""
+Signal receivers keeping materialized data in step with transaction writes.
+
+``TrackedModel.save`` runs inside a transaction and records the previous row
+in ``_previous``; deletes run inside the collector's transaction. Both paths
+therefore update the derived data atomically with the write itself.
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import allocation
+from .backups import JSON_SECTIONS
+from .balances import record_balance_change
+from .lookups import invalidate_lookup
+from .models import (
+    Customer, CustomerDeduction, DeletionLog, Expense, Payment, Purchase, Sale, Supplier, SupplierPayment
+)
+
+# Sent after ``Sale.amount_received`` was changed with a bulk update (payment
+# allocation), which bypasses ``post_save``. ``changes`` is a list of
+# ``(sale_id, date, delta)`` tuples.
+received_changed = Signal()
+
+
+def row_values(instance):
+    """
+    Current attribute values of ``instance`` keyed like ``QuerySet.values()``.
+
+    Generated columns are left out: ``post_save`` runs before ``save``
+    reloads them, so the instance may still hold the old values.
+    """
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields if not field.generated
+    }
+
+
+def deleted_values(instance):
+    """Row values of a deleted ``instance`` as stored, falling back to its attributes"""
+    return getattr(instance, '_stored_row', None) or row_values(instance)
+
+
+@receiver(pre_delete, sender=Sale)
+@receiver(pre_delete, sender=Payment)
+@receiver(pre_delete, sender=CustomerDeduction)
+@receiver(pre_delete, sender=Purchase)
+@receiver(pre_delete, sender=SupplierPayment)
+@receiver(pre_delete, sender=Expense)
+def tracked_row_deleting(sender, instance, **kwargs):
+    # The instance may be stale (allocation bulk-updates ``amount_received``),
+    # so the deltas of a delete are taken from the stored row.
+    instance._stored_row = sender._default_manager.filter(pk=instance.pk).values().first()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=CustomerDeduction)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=SupplierPayment)
+def balance_source_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_balance_change(sender, getattr(instance, '_previous', None), row_values(instance))
+
+
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=CustomerDeduction)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=SupplierPayment)
+def balance_source_deleted(sender, instance, **kwargs):
+    record_balance_change(sender, deleted_values(instance), None)
+
+
+@receiver(pre_delete, sender=Payment)
+def payment_deleting(sender, instance, **kwargs):
+    allocation.reverse_payment(instance.pk)
+
+
+@receiver(pre_delete, sender=Sale)
+def sale_deleting(sender, instance, **kwargs):
+    instance._allocated_payment_ids = list(instance.allocations.values_list('payment_id', flat=True))
+
+
+@receiver(post_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    allocation.sale_deleted(getattr(instance, '_allocated_payment_ids', []))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Supplier)
+def lookup_source_changed(sender, **kwargs):
+    invalidate_lookup(sender)
+
+
+BACKUP_SECTIONS = {model: section for section, model in JSON_SECTIONS}
+
+
+def log_deletion(sender, instance, **kwargs):
+    """Record the delete for incremental backups"""
+    DeletionLog.objects.create(section=BACKUP_SECTIONS[sender], object_id=instance.pk)
+
+
+for model in BACKUP_SECTIONS:
+    post_delete.connect(log_deletion, sender=model, dispatch_uid=f'log_deletion_{model._meta.label}')
@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import csv
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from reports.cache import report_cache
+from reports.models import DailySummary, InventoryLedger
+from reports.views import SUMMARY_FIELDS
+from sales.backups import JSON_SECTIONS, BackupReader, open_backup_reader, read_manifest, table_counts
+from sales.balances import (
+    computed_customer_balance, computed_supplier_balance, customer_balance_mismatches, supplier_balance_mismatches
+)
+from sales.jobs import expire_stale_jobs, run_backup_job
+from sales.management.commands.backup_data import Command as BackupCommand
+from sales.models import (
+    BackupJob, Customer, CustomerDeduction, DailyRate, Expense, Payment, PaymentAllocation, Purchase, Sale,
+    Supplier, SupplierPayment
+)
+from sales.native_backups import _generated_columns, _table_columns
+from sales.serializers import PaymentSerializer, PurchaseSerializer, SaleSerializer
+
+
+class BackupStatusTests(TestCase):
+    """The backup status card reads its counts in one query and its files from the manifest"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        settings = override_settings(BACKUP_DIR=self.backup_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        Customer.objects.create(name='Customer')
+
+    def test_status_costs_one_query(self):
+        call_command('backup_data', output_dir=self.backup_dir, stdout=io.StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/backup/status/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        self.assertEqual(response.data['statistics']['customers'], 1)
+        self.assertEqual(response.data['statistics']['total_records'], 1)
+        self.assertEqual(len(response.data['recent_backups']), 1)
+        self.assertTrue(response.data['recent_backups'][0]['filename'].endswith('.xlsx'))
+
+
+class LookupTests(TestCase):
+    """Lookups are cached per process, searched by name prefix and revalidated by ETag"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        for name in ['Bilal', 'ahmad traders', 'Ahmad', 'Zubair']:
+            Customer.objects.create(name=name)
+        Customer.objects.create(name='Ahsan', is_active=False)
+
+    def test_prefix_search(self):
+        response = self.client.get('/api/customers/lookup/', {'search': 'AH'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data], ['Ahmad', 'ahmad traders', 'Ahsan'])
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'is_active'})
+
+        response = self.client.get('/api/customers/lookup/', {'search': 'ah', 'is_active': 'true', 'limit': 1})
+        self.assertEqual([row['name'] for row in response.data], ['Ahmad'])
+
+    def test_unchanged_list_is_not_modified(self):
+        first = self.client.get('/api/customers/lookup/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/customers/lookup/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        Customer.objects.filter(name='Zubair').get().delete()
+        response = self.client.get('/api/customers/lookup/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Zubair', [row['name'] for row in response.data])
+
+    def test_changes_invalidate_the_cache(self):
+        self.client.get('/api/suppliers/lookup/')
+        Supplier.objects.create(name='Farm')
+        response = self.client.get('/api/suppliers/lookup/')
+        self.assertEqual([row['name'] for row in response.data], ['Farm'])
+
+    def test_other_processes_changes_are_picked_up(self):
+        first = self.client.get('/api/customers/lookup/')
+        # Another process renamed a customer: only the shared version moved
+        Customer.objects.filter(name='Bilal').update(name='Bashir')
+        report_cache().incr(f'lookup-version:{Customer._meta.label}')
+        response = self.client.get('/api/customers/lookup/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Bashir', [row['name'] for row in response.data])
+
+        # A cleared cache starts a new version rather than repeating an old one
+        report_cache().clear()
+        response = self.client.get('/api/customers/lookup/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class SparseFieldsetTests(TestCase):
+    """``?fields=``/``?omit=`` trim rows and load only the columns they need"""
+
+    endpoints = [
+        '/api/customers/', '/api/suppliers/', '/api/daily-rates/', '/api/purchases/', '/api/sales/',
+        '/api/payments/', '/api/expenses/', '/api/customer-deductions/', '/api/supplier-payments/',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        customer = Customer.objects.create(name='Customer')
+        supplier = Supplier.objects.create(name='Supplier')
+        day = date(2024, 1, 1)
+        DailyRate.objects.create(date=day, default_cost_rate=Decimal('100'), default_sale_rate=Decimal('120'))
+        for _ in range(3):
+            Sale.objects.create(
+                date=day, customer=customer, kg=Decimal('10'), sale_rate_per_kg=Decimal('120'),
+                cost_rate_snapshot=Decimal('100'), amount_received=Decimal('200')
+            )
+            Purchase.objects.create(date=day, supplier=supplier, kg=Decimal('10'), cost_rate_per_kg=Decimal('100'))
+            Payment.objects.create(date=day, customer=customer, amount=Decimal('50'))
+            Expense.objects.create(date=day, category='petrol', amount=Decimal('20'))
+            CustomerDeduction.objects.create(date=day, customer=customer, amount=Decimal('5'))
+            SupplierPayment.objects.create(date=day, supplier=supplier, amount=Decimal('30'))
+
+    def assertCostsNoMoreThanFullRows(self, url, params):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertLessEqual(len(sparse), len(full), f'{url} {params}')
+        return response
+
+    def test_every_field_can_be_selected_alone(self):
+        for url in self.endpoints:
+            fields = list(self.client.get(url).data['results'][0])
+            for field in fields:
+                response = self.assertCostsNoMoreThanFullRows(url, {'fields': field})
+                self.assertEqual(set(response.data['results'][0]), {'id', field})
+
+    def test_omitted_fields_are_not_loaded(self):
+        response = self.assertCostsNoMoreThanFullRows(
+            '/api/sales/', {'omit': 'customer_name,customer_closing_balance', 'pagination': 'cursor'}
+        )
+        self.assertNotIn('customer_closing_balance', response.data['results'][0])
+        self.assertIn('profit', response.data['results'][0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/sales/', {'fields': 'kg,total_amount'})
+        self.assertNotIn('sales_customer', queries[-1]['sql'])
+        self.assertNotIn('"note"', queries[-1]['sql'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/sales/', {'fields': 'kg,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.data['fields']))
+
+
+class BalanceLoaderTests(TestCase):
+    """A page of rows reads its owners' balances once per owner model"""
+
+    def test_page_resolves_balances_in_one_query(self):
+        day = date(2024, 1, 1)
+        for index in range(10):
+            customer = Customer.objects.create(name=f'Customer {index}')
+            supplier = Supplier.objects.create(name=f'Supplier {index}')
+            for _ in range(3):
+                Sale.objects.create(
+                    date=day, customer=customer, kg=Decimal('1'), sale_rate_per_kg=Decimal(index + 1),
+                    cost_rate_snapshot=Decimal('1')
+                )
+                Purchase.objects.create(date=day, supplier=supplier, kg=Decimal('1'), cost_rate_per_kg=Decimal('2'))
+        Purchase.objects.create(date=day, kg=Decimal('1'), cost_rate_per_kg=Decimal('2'))
+        sales = list(Sale.objects.all())
+        purchases = list(Purchase.objects.all())
+
+        with self.assertNumQueries(1):
+            data = SaleSerializer(sales, many=True, fields=['customer_closing_balance']).data
+        balances = dict(Customer.objects.values_list('pk', 'current_balance'))
+        for sale, row in zip(sales, data):
+            self.assertEqual(row['customer_closing_balance'], balances[sale.customer_id])
+
+        with self.assertNumQueries(1):
+            data = PurchaseSerializer(purchases, many=True, fields=['supplier_closing_balance']).data
+        self.assertEqual(sorted({row['supplier_closing_balance'] for row in data}), [Decimal('0.000'), Decimal('6')])
+
+
+class GeneratedAmountTests(TestCase):
+    """Sale and purchase amounts are database columns that follow every write"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        self.customer = Customer.objects.create(name='Customer')
+        self.sales = [
+            Sale.objects.create(
+                date=date(2024, 1, day), customer=self.customer, kg=Decimal('10'),
+                sale_rate_per_kg=Decimal(100 + day), cost_rate_snapshot=Decimal('100'),
+                amount_received=received,
+            )
+            for day, received in [(1, Decimal('1010')), (2, Decimal('0')), (3, Decimal('500'))]
+        ]
+
+    def test_amounts_follow_saves_and_bulk_updates(self):
+        sale = self.sales[1]
+        self.assertEqual((sale.total_amount, sale.borrow_amount, sale.profit), (1020, 1020, 20))
+        sale.kg = Decimal('5')
+        sale.save()
+        self.assertEqual((sale.total_amount, sale.borrow_amount, sale.profit), (510, 510, 10))
+
+        Sale.objects.filter(pk=sale.pk).update(amount_received=Decimal('10'))
+        self.assertEqual(Sale.objects.get(pk=sale.pk).borrow_amount, 500)
+
+    def test_filter_and_order_by_amounts(self):
+        response = self.client.get('/api/sales/', {'outstanding': 'true', 'ordering': '-profit'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.sales[2].pk, self.sales[1].pk])
+
+        response = self.client.get('/api/sales/', {'borrow_amount_min': '600'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.sales[1].pk])
+
+
+class LedgerTests(TestCase):
+    """The ledger statement lists every movement in order with the balance after it"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        self.customer = Customer.objects.create(name='Customer', opening_balance=Decimal('50'))
+        for day in range(1, 6):
+            Sale.objects.create(
+                date=date(2024, 1, day), customer=self.customer, kg=Decimal('10'),
+                sale_rate_per_kg=Decimal('10'), cost_rate_snapshot=Decimal('8'),
+            )
+            Payment.objects.create(date=date(2024, 1, day), customer=self.customer, amount=Decimal('30'))
+        CustomerDeduction.objects.create(
+            date=date(2024, 1, 3), customer=self.customer, amount=Decimal('5'), deduction_type='discount'
+        )
+        self.url = f'/api/customers/{self.customer.pk}/statement/'
+
+    def pages(self, **params):
+        response = self.client.get(self.url, {'mode': 'ledger', **params})
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+        return pages
+
+    def test_running_balance_continues_across_pages(self):
+        pages = self.pages(page_size=3)
+        entries = [entry for page in pages for entry in page['results']]
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(len(entries), 11)
+        self.assertEqual(
+            [(entry['date'], entry['kind']) for entry in entries[:3]],
+            [('2024-01-01', 'sale'), ('2024-01-01', 'payment'), ('2024-01-02', 'sale')],
+        )
+        balance = Decimal('50')
+        for entry in entries:
+            balance += Decimal(entry['debit']) - Decimal(entry['credit'])
+            self.assertEqual(Decimal(entry['balance']), balance)
+        self.customer.refresh_from_db()
+        self.assertEqual(balance, self.customer.current_balance)
+        self.assertEqual(pages[-1]['closing_balance'], self.customer.current_balance)
+
+    def test_range_starts_from_balance_on_start_date(self):
+        page = self.pages(start_date='2024-01-03', end_date='2024-01-04')[0]
+        # 50 opening + two days of 100 sales less 30 payments
+        self.assertEqual(page['opening_balance'], Decimal('190'))
+        self.assertEqual(page['closing_balance'], Decimal('325'))
+        self.assertEqual(len(page['results']), 5)
+        self.assertEqual([entry['kind'] for entry in page['results']][:3], ['sale', 'payment', 'deduction'])
+        self.assertEqual(Decimal(page['results'][-1]['balance']), Decimal('325'))
+
+    def test_tampered_cursor_is_rejected(self):
+        next_link = self.pages(page_size=3)[0]['next']
+        response = self.client.get(next_link.replace('cursor=', 'cursor=x'))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self.url, {'mode': 'ledger', 'start_date': '2024-02-01', 'end_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StoredBalanceTests(TestCase):
+    """Stored balances follow every write to the transactions behind them"""
+
+    def assertBalancesMatchTransactions(self):
+        computed = dict(Customer.objects.annotate(computed=computed_customer_balance()).values_list('pk', 'computed'))
+        self.assertEqual(dict(Customer.objects.values_list('pk', 'current_balance')), computed)
+        computed = dict(Supplier.objects.annotate(computed=computed_supplier_balance()).values_list('pk', 'computed'))
+        self.assertEqual(dict(Supplier.objects.values_list('pk', 'current_balance')), computed)
+
+    def test_balances_follow_creates_edits_moves_and_deletes(self):
+        first = Customer.objects.create(name='First', opening_balance=Decimal('100'))
+        second = Customer.objects.create(name='Second')
+        farm = Supplier.objects.create(name='Farm', opening_balance=Decimal('40'))
+        other_farm = Supplier.objects.create(name='Other farm')
+        day = date(2024, 1, 1)
+
+        sale = Sale.objects.create(
+            date=day, customer=first, kg=Decimal('10'), sale_rate_per_kg=Decimal('120'),
+            cost_rate_snapshot=Decimal('100')
+        )
+        payment = Payment.objects.create(date=day, customer=first, amount=Decimal('300'))
+        deduction = CustomerDeduction.objects.create(date=day, customer=first, amount=Decimal('20'))
+        purchase = Purchase.objects.create(
+            date=day, supplier=farm, kg=Decimal('50'), cost_rate_per_kg=Decimal('90'), amount_paid=Decimal('500')
+        )
+        supplier_payment = SupplierPayment.objects.create(date=day, supplier=farm, amount=Decimal('1000'))
+        first.refresh_from_db()
+        farm.refresh_from_db()
+        self.assertEqual(first.current_balance, Decimal('980'))
+        self.assertEqual(farm.current_balance, Decimal('3040'))
+        self.assertBalancesMatchTransactions()
+
+        sale.kg = Decimal('12.5')
+        sale.save()
+        payment.amount = Decimal('250')
+        payment.save()
+        purchase.amount_paid = Decimal('0')
+        purchase.save()
+        self.assertBalancesMatchTransactions()
+
+        sale.customer = second
+        sale.save()
+        deduction.customer = second
+        deduction.save()
+        purchase.supplier = other_farm
+        purchase.save()
+        supplier_payment.supplier = other_farm
+        supplier_payment.save()
+        self.assertBalancesMatchTransactions()
+        second.refresh_from_db()
+        self.assertEqual(second.current_balance, Decimal('1480'))
+
+        for row in (sale, payment, deduction, purchase, supplier_payment):
+            row.delete()
+        self.assertBalancesMatchTransactions()
+        self.assertEqual(
+            list(Customer.objects.order_by('pk').values_list('current_balance', flat=True)), [100, 0]
+        )
+        self.assertEqual(list(Supplier.objects.order_by('pk').values_list('current_balance', flat=True)), [40, 0])
+
+    def updated_customers(self, row, customer):
+        """Ids of the customers whose balance is updated, in order, when ``row`` moves to ``customer``"""
+        row.customer = customer
+        with CaptureQueriesContext(connection) as queries:
+            row.save()
+        return [
+            int(re.search(r'"sales_customer"\."id" = (\d+)', query['sql']).group(1)) for query in queries
+            if query['sql'].startswith('UPDATE "sales_customer" SET "current_balance"')
+        ]
+
+    def test_moves_update_balances_in_one_order(self):
+        first = Customer.objects.create(name='First')
+        second = Customer.objects.create(name='Second')
+        day = date(2024, 1, 1)
+        sale = Sale.objects.create(
+            date=day, customer=first, kg=Decimal('10'), sale_rate_per_kg=Decimal('120'),
+            cost_rate_snapshot=Decimal('100')
+        )
+        deduction = CustomerDeduction.objects.create(date=day, customer=second, amount=Decimal('20'))
+
+        # Both directions lock the lower id first, so opposite moves cannot deadlock
+        for row, customer in ((sale, second), (deduction, first), (sale, first), (deduction, second)):
+            self.assertEqual(self.updated_customers(row, customer), [first.pk, second.pk])
+        self.assertBalancesMatchTransactions()
+
+
+class RebuildBalancesTests(TestCase):
+    """``rebuild_balances`` reports drifted balances and recomputes them"""
+
+    def test_corrupted_balances_are_reported_and_fixed(self):
+        customer = Customer.objects.create(name='Customer', opening_balance=Decimal('10'))
+        supplier = Supplier.objects.create(name='Supplier')
+        Sale.objects.create(
+            date=date(2024, 1, 1), customer=customer, kg=Decimal('2'), sale_rate_per_kg=Decimal('100'),
+            cost_rate_snapshot=Decimal('90')
+        )
+        Purchase.objects.create(
+            date=date(2024, 1, 1), supplier=supplier, kg=Decimal('2'), cost_rate_per_kg=Decimal('90')
+        )
+        Customer.objects.filter(pk=customer.pk).update(current_balance=Decimal('999'))
+        Supplier.objects.filter(pk=supplier.pk).update(current_balance=Decimal('0'))
+
+        self.assertEqual(customer_balance_mismatches(), [(customer, Decimal('999'), Decimal('210'))])
+        self.assertEqual([row[1:] for row in supplier_balance_mismatches()], [(Decimal('0'), Decimal('180'))])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', verify_only=True, stdout=io.StringIO())
+
+        out = io.StringIO()
+        call_command('rebuild_balances', stdout=out)
+        self.assertIn('All customer and supplier balances verified', out.getvalue())
+        self.assertEqual(customer_balance_mismatches() + supplier_balance_mismatches(), [])
+        customer.refresh_from_db()
+        self.assertEqual(customer.current_balance, Decimal('210'))
+
+
+class PaymentAllocationTests(TestCase):
+    """Payments go to same-date sales first, then the oldest, never beyond what is owed"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Customer')
+
+    def sale(self, day, total, received=Decimal('0')):
+        return Sale.objects.create(
+            date=date(2024, 1, day), customer=self.customer, kg=Decimal('1'), sale_rate_per_kg=Decimal(total),
+            cost_rate_snapshot=Decimal('0'), amount_received=received
+        )
+
+    def pay(self, day, amount):
+        payment = Payment.objects.create(date=date(2024, 1, day), customer=self.customer, amount=Decimal(amount))
+        payment.allocate_to_sales()
+        return payment
+
+    def received(self, *sales):
+        return [Sale.objects.get(pk=sale.pk).amount_received for sale in sales]
+
+    def test_same_date_first_then_oldest_capped_at_borrow_amount(self):
+        oldest = self.sale(1, 1000, received=Decimal('200'))
+        settled = self.sale(2, 500, received=Decimal('500'))
+        middle = self.sale(3, 300)
+        same_day = self.sale(5, 400)
+
+        payment = self.pay(5, 1000)
+        self.assertTrue(Payment.objects.get(pk=payment.pk).auto_allocated)
+        self.assertEqual(self.received(oldest, settled, middle, same_day), [800, 500, 0, 400])
+        self.assertEqual(
+            sorted(payment.allocations.values_list('sale_id', 'amount')), [(oldest.pk, 600), (same_day.pk, 400)]
+        )
+
+        # More than is owed: every sale is settled exactly and the rest stays unallocated
+        self.pay(4, 5000)
+        self.assertEqual(self.received(oldest, settled, middle, same_day), [1000, 500, 300, 400])
+        self.assertFalse(Sale.objects.filter(borrow_amount__gt=0).exists())
+
+    def test_query_count_does_not_grow_with_history(self):
+        def queries_for_payment(history):
+            for _ in range(history):
+                self.sale(1, 100, received=Decimal('100'))
+                self.sale(20, 100)
+            self.sale(10, 100)
+            self.sale(11, 100)
+            payment = Payment.objects.create(date=date(2024, 1, 10), customer=self.customer, amount=Decimal('150'))
+            with CaptureQueriesContext(connection) as queries:
+                payment.allocate_to_sales()
+            self.assertEqual(payment.allocations.count(), 2)
+            # Leave out savepoints and the report rollups' own per-date updates
+            return len([
+                query for query in queries
+                if 'reports_' not in query['sql'] and 'SAVEPOINT' not in query['sql']
+            ])
+
+        # Lock customer and payment, allocated total, outstanding sales, existing
+        # allocations, then one write each for sales, allocations and the payment
+        self.assertEqual(queries_for_payment(2), 8)
+        self.customer = Customer.objects.create(name='Long-standing customer')
+        self.assertEqual(queries_for_payment(60), 8)
+
+
+class ReallocationTests(TestCase):
+    """Edits and deletes only reverse and reapply the allocations they affect"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Customer')
+        self.sales = [self.sale(self.customer, day) for day in (1, 2, 3)]
+        self.payment = self.pay(self.customer, 700)
+
+    def sale(self, customer, day, total=300):
+        return Sale.objects.create(
+            date=date(2024, 1, day), customer=customer, kg=Decimal('1'), sale_rate_per_kg=Decimal(total),
+            cost_rate_snapshot=Decimal('0')
+        )
+
+    def pay(self, customer, amount):
+        payment = Payment.objects.create(date=date(2024, 1, 9), customer=customer, amount=Decimal(amount))
+        payment.allocate_to_sales()
+        return payment
+
+    def received(self):
+        return [Sale.objects.get(pk=sale.pk).amount_received for sale in self.sales]
+
+    def allocations(self):
+        return set(PaymentAllocation.objects.values_list('payment_id', 'sale_id', 'amount'))
+
+    def test_moves_lock_both_customers_first_in_one_ordered_query(self):
+        other = Customer.objects.create(name='Other')
+        for row in (self.payment, self.sales[2]):
+            for customer in (other, self.customer):
+                row.customer = customer
+                with CaptureQueriesContext(connection) as queries:
+                    row.save()
+                locks = [
+                    query['sql'] for query in queries
+                    if query['sql'].startswith('SELECT "sales_customer"."id" FROM "sales_customer"')
+                ]
+                # The first lock takes both customers; later ones only re-lock rows already held
+                self.assertIn(f'IN ({self.customer.pk}, {other.pk})', locks[0])
+                self.assertTrue(locks[0].endswith('ORDER BY "sales_customer"."id" ASC'))
+        self.assertEqual(self.received(), [300, 300, 100])
+
+    def test_payment_edits_release_newest_first_and_allocate_the_difference(self):
+        self.assertEqual(self.received(), [300, 300, 100])
+        self.payment.amount = Decimal('400')
+        self.payment.save()
+        self.assertEqual(self.received(), [300, 100, 0])
+        self.assertEqual(
+            self.allocations(), {(self.payment.pk, self.sales[0].pk, 300), (self.payment.pk, self.sales[1].pk, 100)}
+        )
+
+        self.payment.amount = Decimal('1000')
+        self.payment.save()
+        self.assertEqual(self.received(), [300, 300, 300])
+        self.assertEqual(sum(amount for _, _, amount in self.allocations()), 900)
+
+        self.payment.delete()
+        self.assertEqual(self.received(), [0, 0, 0])
+        self.assertEqual(self.allocations(), set())
+
+    def test_deleted_sale_passes_its_money_to_the_next_outstanding_sale(self):
+        first = self.sales.pop(0)
+        first.delete()
+        self.assertEqual(self.received(), [300, 300])
+        self.assertEqual(
+            self.allocations(), {(self.payment.pk, self.sales[0].pk, 300), (self.payment.pk, self.sales[1].pk, 300)}
+        )
+
+    def test_sale_moved_to_another_customer(self):
+        other = Customer.objects.create(name='Other')
+        credit = self.pay(other, 100)
+        moved = self.sales[1]
+        moved.customer = other
+        moved.save()
+
+        self.assertEqual(self.received(), [300, 100, 300])
+        self.assertEqual(self.allocations(), {
+            (self.payment.pk, self.sales[0].pk, 300),
+            (self.payment.pk, self.sales[2].pk, 300),
+            (credit.pk, moved.pk, 100),
+        })
+
+    def test_sale_shrunk_below_its_allocations(self):
+        sale = self.sales[0]
+        sale.kg = Decimal('0.5')
+        sale.save()
+        self.assertEqual(self.received(), [150, 300, 250])
+
+    def test_rebuild_reproduces_the_allocations(self):
+        self.pay(self.customer, 150)
+        self.sales.pop(0).delete()
+        self.payment.amount = Decimal('450')
+        self.payment.save()
+        self.sales.append(self.sale(self.customer, 4))
+        other = Customer.objects.create(name='Other')
+        self.sales.append(self.sale(other, 1))
+        self.pay(other, 200)
+        allocations, received = self.allocations(), self.received()
+        self.assertEqual(received, [300, 300, 0, 200])
+
+        PaymentAllocation.objects.all().delete()
+        Sale.objects.update(amount_received=Decimal('0'))
+        call_command('rebuild_allocations', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(self.allocations(), allocations)
+        self.assertEqual(self.received(), received)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the whole list once in order, forwards and backwards"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        customer = Customer.objects.create(name='Customer')
+        # Several payments per date, so pages split inside a date
+        for index in range(23):
+            Payment.objects.create(date=date(2024, 1, 1 + index % 5), customer=customer, amount=Decimal('10'))
+        self.expected = list(Payment.objects.order_by('-date', '-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, url, params=None, direction='next'):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data[direction]:
+                return pages
+            response = self.client.get(response.data[direction])
+
+    def test_walk_to_the_end_and_back(self):
+        pages = self.walk('/api/payments/', {'pagination': 'cursor', 'page_size': 5})
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+        last = self.client.get('/api/payments/', {'pagination': 'cursor', 'page_size': 5})
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        back = self.walk(last.data['previous'], direction='previous')
+        self.assertEqual([pk for page in reversed(back) for pk in page], self.expected[:20])
+
+        ascending = self.walk('/api/payments/', {'pagination': 'cursor', 'page_size': 7, 'ordering': 'date'})
+        self.assertEqual([pk for page in ascending for pk in page], self.expected[::-1])
+
+    def test_count_free_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/payments/', {'count': 'false'})
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], self.expected)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class ExportTests(TestCase):
+    """Exports stream every row matching the list filters"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', password='secret'))
+        customer = Customer.objects.create(name='Customer')
+        for day in range(1, 8):
+            Payment.objects.create(date=date(2024, 1, day), customer=customer, amount=Decimal(day), method='cash')
+        Payment.objects.create(date=date(2024, 1, 8), customer=customer, amount=Decimal('5'), method='bank')
+
+    def export(self, **params):
+        response = self.client.get('/api/payments/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_has_a_header_and_every_row(self):
+        response, content = self.export(method='cash')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('attachment; filename="payment_', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], list(PaymentSerializer().fields))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual({row[rows[0].index('method')] for row in rows[1:]}, {'cash'})
+
+    def test_ndjson_and_sparse_fields(self):
+        _, content = self.export(export_format='ndjson', fields='amount', ordering='date')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(set(rows[0]), {'id', 'amount'})
+        self.assertEqual(rows[0]['amount'], '1.000')
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get('/api/payments/export/', {'export_format': 'xml'}).status_code, 400)
+
+
+class ExcelBackupTests(TestCase):
+    """The streamed Excel backup holds the same sheets and values as the in-memory one"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        customer = Customer.objects.create(name='Customer', opening_balance=Decimal('100'))
+        for day in range(1, 4):
+            Sale.objects.create(
+                date=date(2024, 1, day), customer=customer, kg=Decimal('10'), sale_rate_per_kg=Decimal('250'),
+                cost_rate_snapshot=Decimal('200'), amount_received=Decimal('500')
+            )
+        Payment.objects.create(date=date(2024, 1, 3), customer=customer, amount=Decimal('700'), method='bank')
+
+    def workbook(self, mode):
+        output_dir = os.path.join(self.backup_dir, mode)
+        os.makedirs(output_dir)
+        path = BackupCommand(stdout=io.StringIO()).backup_to_excel(output_dir, '20240101_000000', mode)
+        workbook = load_workbook(path, read_only=True)
+        return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+
+    def test_streaming_matches_standard(self):
+        streamed = self.workbook('streaming')
+        self.assertEqual(
+            list(streamed),
+            ['Backup Summary', 'Customers', 'Suppliers', 'Daily Rates', 'Purchases', 'Sales', 'Payments', 'Expenses'],
+        )
+        sales = streamed['Sales']
+        self.assertEqual(sales[0][:4], ['ID', 'Date', 'Customer', 'KG'])
+        self.assertEqual(len(sales), 4)
+        self.assertEqual(sales[1][6:10], [2500, 500, 2000, 500])
+        self.assertEqual(streamed['Payments'][1][4], 'Bank Transfer')
+
+        standard = self.workbook('standard')
+        for title in streamed:
+            if title != 'Backup Summary':
+                self.assertEqual(streamed[title], standard[title], title)
+
+
+class JsonBackupTests(TestCase):
+    """JSON backups read back record for record, plain or compressed"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        customer = Customer.objects.create(name='Müşteri')
+        for day in range(1, 6):
+            Sale.objects.create(
+                date=date(2024, 1, day), customer=customer, kg=Decimal('10'), sale_rate_per_kg=Decimal('250'),
+                cost_rate_snapshot=Decimal('200')
+            )
+        Expense.objects.create(date=date(2024, 1, 1), category='feed', amount=Decimal('75'))
+
+    def read_back(self, compression):
+        path = BackupCommand(stdout=io.StringIO()).backup_to_json(self.backup_dir, '20240101_000000', compression)
+        with open_backup_reader(path) as stream:
+            reader = BackupReader(stream)
+            sections = {section: list(records) for section, records in reader.sections()}
+        return path, reader.metadata, sections
+
+    def assertRoundTrips(self, compression, extension):
+        path, metadata, sections = self.read_back(compression)
+        self.assertTrue(path.endswith(extension))
+        self.assertEqual(metadata['kind'], 'full')
+        self.assertEqual(list(sections), [section for section, _ in JSON_SECTIONS])
+        self.assertEqual(metadata['counts'], {section: len(records) for section, records in sections.items()})
+        self.assertEqual(
+            sorted(record['pk'] for record in sections['sales']), sorted(Sale.objects.values_list('pk', flat=True))
+        )
+        self.assertEqual(sections['customers'][0]['fields']['name'], 'Müşteri')
+        self.assertEqual(sections['expenses'][0]['fields']['amount'], '75.000')
+
+    def test_plain(self):
+        self.assertRoundTrips('none', '.json')
+
+    def test_gzip(self):
+        self.assertRoundTrips('gzip', '.json.gz')
+        with open(os.path.join(self.backup_dir, 'ahmad_poultry_backup_20240101_000000.json.gz'), 'rb') as stream:
+            self.assertEqual(stream.read(2), b'\x1f\x8b')
+
+    @skipUnless(importlib.util.find_spec('zstandard'), 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertRoundTrips('zstd', '.json.zst')
+
+    def test_reader_crosses_read_boundaries(self):
+        with mock.patch('sales.backups.READ_SIZE', 7):
+            _, metadata, sections = self.read_back('gzip')
+        self.assertEqual(len(sections['sales']), 5)
+        self.assertEqual(metadata['counts']['sales'], 5)
+
+
+class BackupQueryTests(TestCase):
+    """A backup run costs the same number of queries however many parties and rows there are"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        self.runs = 0
+
+    def add_parties(self, count):
+        for index in range(Customer.objects.count(), Customer.objects.count() + count):
+            customer = Customer.objects.create(name=f'Customer {index}')
+            supplier = Supplier.objects.create(name=f'Supplier {index}', opening_balance=Decimal(index))
+            Sale.objects.create(
+                date=date(2024, 1, 1), customer=customer, kg=Decimal('1'), sale_rate_per_kg=Decimal('10'),
+                cost_rate_snapshot=Decimal('8')
+            )
+            Purchase.objects.create(
+                date=date(2024, 1, 1), supplier=supplier, kg=Decimal('1'), cost_rate_per_kg=Decimal('8')
+            )
+
+    def backup_queries(self):
+        self.runs += 1
+        output_dir = os.path.join(self.backup_dir, str(self.runs))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('backup_data', output_dir=output_dir, stdout=io.StringIO())
+        return len(queries), output_dir
+
+    def test_query_count_does_not_grow(self):
+        self.add_parties(2)
+        small, _ = self.backup_queries()
+        self.add_parties(40)
+        large, output_dir = self.backup_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(table_counts()['suppliers'], 42)
+
+        excel = next(entry for entry in read_manifest(output_dir) if entry['format'] == 'excel')
+        path = os.path.join(output_dir, excel['filename'])
+        suppliers = list(load_workbook(path, read_only=True)['Suppliers'].iter_rows(values_only=True))
+        self.assertEqual(suppliers[0][4], 'Closing Balance')
+        self.assertEqual(
+            {row[1]: row[4] for row in suppliers[1:]},
+            {name: float(balance) for name, balance in Supplier.objects.values_list('name', 'current_balance')},
+        )
+
+
+class BackupJobTests(TestCase):
+    """Backup jobs move from queued to running to completed or failed, and stale runs stay failed"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        settings = override_settings(BACKUP_DIR=self.backup_dir, BACKUP_JOB_STALE_SECONDS=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        Customer.objects.create(name='Customer')
+
+    def queue(self, **options):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/backup/', options, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(len(callbacks), 1)
+        return BackupJob.objects.get(pk=response.data['id'])
+
+    def test_backups_do_not_run_in_the_request(self):
+        with mock.patch('sales.jobs.call_command') as command:
+            response = self.client.get('/api/backup/')
+        self.assertEqual(response.status_code, 405)
+        command.assert_not_called()
+        self.assertFalse(BackupJob.objects.exists())
+        self.assertEqual(os.listdir(self.backup_dir), [])
+
+    def test_completed_job(self):
+        job = self.queue(json_compression='gzip')
+        run_backup_job(job.pk)
+
+        response = self.client.get(f'/api/backup/jobs/{job.pk}/')
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertTrue(response.data['json_file'].endswith('.json.gz'))
+        self.assertEqual(response.data['totals']['customers'], 1)
+        self.assertEqual(response.data['progress']['json']['customers'], 1)
+        self.assertEqual(set(response.data['downloads']), {'excel', 'json'})
+        download = self.client.get(response.data['downloads']['json'])
+        self.assertEqual(download.status_code, 200)
+        download.close()
+
+        # A finished job is not run again
+        with mock.patch('sales.jobs.call_command') as command:
+            run_backup_job(job.pk)
+        command.assert_not_called()
+
+    def test_failed_job(self):
+        job = self.queue()
+        with mock.patch('sales.jobs.call_command', side_effect=OSError('Disk full')):
+            run_backup_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Disk full'))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_expired_job_keeps_its_failure(self):
+        job = self.queue()
+
+        def stall(*args, **kwargs):
+            call_command(*args, **kwargs)
+            BackupJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+            self.assertEqual(expire_stale_jobs(), 1)
+
+        with mock.patch('sales.jobs.call_command', side_effect=stall):
+            run_backup_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('stopped making progress', job.error)
+        self.assertEqual(job.json_file, '')
+
+    def test_expired_queued_job_is_not_started(self):
+        job = self.queue()
+        BackupJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(expire_stale_jobs(), 1)
+        with mock.patch('sales.jobs.call_command') as command:
+            run_backup_job(job.pk)
+        command.assert_not_called()
+        self.assertEqual(BackupJob.objects.get(pk=job.pk).status, 'failed')
+
+
+class RestoreDataTests(TransactionTestCase):
+    """A JSON backup restores every row and rebuilds the data derived from them"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        customer = Customer.objects.create(name='Customer', opening_balance=Decimal('100'))
+        supplier = Supplier.objects.create(name='Supplier', opening_balance=Decimal('50'))
+        for day in (1, 2, 3):
+            Purchase.objects.create(
+                date=date(2024, 1, day), supplier=supplier, vehicle_number='V1', kg=Decimal('100'),
+                cost_rate_per_kg=Decimal('200'), amount_paid=Decimal('1000')
+            )
+            Sale.objects.create(
+                date=date(2024, 1, day), customer=customer, kg=Decimal('60'), sale_rate_per_kg=Decimal('250'),
+                cost_rate_snapshot=Decimal('200'), amount_received=Decimal('5000')
+            )
+        payment = Payment.objects.create(date=date(2024, 1, 3), customer=customer, amount=Decimal('12000'))
+        payment.allocate_to_sales()
+        CustomerDeduction.objects.create(date=date(2024, 1, 3), customer=customer, amount=Decimal('30'))
+        SupplierPayment.objects.create(date=date(2024, 1, 3), supplier=supplier, amount=Decimal('4000'))
+        Expense.objects.create(date=date(2024, 1, 2), category='feed', amount=Decimal('75'))
+
+    def snapshot(self):
+        # The JSON encoder keeps timestamps to the millisecond
+        def value(v):
+            return v.replace(microsecond=v.microsecond // 1000 * 1000) if isinstance(v, datetime) else v
+
+        rows = {
+            section: sorted(
+                tuple(value(v) for v in row) for row in model.objects.values_list(*[
+                    field.attname for field in model._meta.concrete_fields if field.attname != 'updated_at'
+                ])
+            )
+            for section, model in JSON_SECTIONS
+        }
+        rows['summaries'] = sorted(DailySummary.objects.values_list('date', *SUMMARY_FIELDS))
+        rows['inventory'] = sorted(InventoryLedger.objects.values_list('date', 'opening_kg', 'closing_kg'))
+        return rows
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        call_command(
+            'backup_data', output_dir=self.backup_dir, json_compression='gzip', stdout=io.StringIO()
+        )
+        backup = next(entry for entry in read_manifest(self.backup_dir) if entry['format'] == 'json')
+        path = os.path.join(self.backup_dir, backup['filename'])
+
+        with self.assertRaises(CommandError):
+            call_command('restore_data', path, stdout=io.StringIO())
+
+        # Derived data that is not in the backup is rebuilt, not carried over
+        Customer.objects.update(current_balance=Decimal('0'))
+        DailySummary.objects.all().delete()
+        InventoryLedger.objects.all().delete()
+        call_command('restore_data', path, truncate=True, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(customer_balance_mismatches() + supplier_balance_mismatches(), [])
+
+        # Sequences continue after the restored ids
+        customer = Customer.objects.create(name='New customer')
+        self.assertGreater(customer.pk, max(pk for pk, *_ in before['customers']))
+
+    def test_incremental_round_trip(self):
+        call_command('backup_data', output_dir=self.backup_dir, stdout=io.StringIO())
+        customer = Customer.objects.get()
+        customer.phone = '0300'
+        customer.save()
+        Sale.objects.create(
+            date=date(2024, 1, 4), customer=customer, kg=Decimal('10'), sale_rate_per_kg=Decimal('250'),
+            cost_rate_snapshot=Decimal('200'), amount_received=Decimal('2500')
+        )
+        Expense.objects.get().delete()
+        Purchase.objects.filter(date=date(2024, 1, 1)).delete()
+        before = self.snapshot()
+
+        call_command('backup_data', output_dir=self.backup_dir, incremental=True, stdout=io.StringIO())
+        incremental = next(
+            entry['filename'] for entry in read_manifest(self.backup_dir)
+            if entry['filename'].endswith('_incremental.json')
+        )
+        merged = os.path.join(self.backup_dir, 'merged.json')
+        call_command(
+            'merge_backups', os.path.join(self.backup_dir, incremental), output=merged, stdout=io.StringIO()
+        )
+        call_command('restore_data', merged, truncate=True, stdout=io.StringIO())
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(Expense.objects.exists())
+        self.assertEqual(Customer.objects.get().phone, '0300')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite snapshots')
+class NativeBackupTests(TransactionTestCase):
+    """backup_data --format native and restore_native on SQLite"""
+
+    def setUp(self):
+        self.backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.backup_dir)
+        self.customer = Customer.objects.create(name='Customer', opening_balance=Decimal('100'))
+        Sale.objects.create(
+            date=date(2024, 1, 1), customer=self.customer, kg=Decimal('60'), sale_rate_per_kg=Decimal('250'),
+            cost_rate_snapshot=Decimal('200'), amount_received=Decimal('5000')
+        )
+
+    def snapshot(self):
+        call_command(
+            'backup_data', output_dir=self.backup_dir, format='native', native_compression='gzip',
+            stdout=io.StringIO()
+        )
+        entry = next(entry for entry in read_manifest(self.backup_dir) if entry['format'] == 'native')
+        self.assertTrue(entry['filename'].endswith('.sqlite3.gz'))
+        return os.path.join(self.backup_dir, entry['filename'])
+
+    def test_restore_replaces_all_data(self):
+        path = self.snapshot()
+        sales = list(Sale.objects.values_list('id', 'kg', 'total_amount'))
+        Sale.objects.all().delete()
+        Customer.objects.create(name='Added after the snapshot')
+
+        call_command('restore_native', path, interactive=False, stdout=io.StringIO())
+
+        self.assertEqual(list(Customer.objects.values_list('name', flat=True)), ['Customer'])
+        self.assertEqual(list(Sale.objects.values_list('id', 'kg', 'total_amount')), sales)
+
+    def test_restore_checks_the_checksum(self):
+        path = self.snapshot()
+        with open(f'{path}.sha256', 'w', encoding='utf-8') as stream:
+            stream.write(f'{"0" * 64}  {os.path.basename(path)}\n')
+
+        with self.assertRaisesMessage(CommandError, 'does not match its checksum'):
+            call_command('restore_native', path, interactive=False, stdout=io.StringIO())
+        self.assertTrue(Sale.objects.exists())
+
+
+class CopyColumnTests(TestCase):
+    """Column lists of the PostgreSQL snapshot COPY statements"""
+
+    def test_generated_columns_are_left_out(self):
+        self.assertEqual(_generated_columns('sales_sale'), {'total_amount', 'borrow_amount', 'profit'})
+        with connection.cursor() as cursor:
+            target = _table_columns(cursor, 'sales_sale')
+        columns = {column.strip().strip('"') for column in target.split('(', 1)[1].rstrip(')').split(',')}
+        self.assertIn('kg', columns)
+        self.assertIn('sale_rate_per_kg', columns)
+        self.assertFalse(columns & {'total_amount', 'borrow_amount', 'profit'})
@@ -3,25 +3,36 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
 from django.db.models import Q
 from django.http import FileResponse, HttpResponse
-from django.utils import timezone
-from django.core.management import call_command
-from .models import Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from .models import (
+    Customer, DailyRate, Purchase, Sale, Payment, Expense, CustomerDeduction, Supplier, SupplierPayment, BackupJob
+)
 from .serializers import (
     CustomerSerializer, DailyRateSerializer, PurchaseSerializer,
     SaleSerializer, PaymentSerializer, ExpenseSerializer, CustomerDeductionSerializer,
-    SupplierSerializer, SupplierPaymentSerializer
+    SupplierSerializer, SupplierPaymentSerializer, BackupRequestSerializer, BackupJobSerializer,
+    LedgerRequestSerializer, LedgerEntrySerializer
 )
 from .filters import (
     CustomerFilter, PurchaseFilter, SaleFilter,
     PaymentFilter, ExpenseFilter, DailyRateFilter, CustomerDeductionFilter,
     SupplierFilter, SupplierPaymentFilter
 )
+from .backups import read_manifest, table_counts
+from .exports import ExportMixin
+from .fieldsets import SparseQuerysetMixin
+from .jobs import enqueue_backup, expire_stale_jobs
+from .ledger import LedgerPage
+from .lookups import LookupMixin
+from .pagination import TransactionPagination
 import os
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(LookupMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Customer model"""
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
@@ -36,6 +47,8 @@ class CustomerViewSet(viewsets.ModelViewSet):
     def statement(self, request, pk=None):
         """Get customer statement with all transactions"""
         customer = self.get_object()
+        if request.query_params.get('mode') == 'ledger':
+            return self.ledger(request, customer)
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
@@ -58,11 +71,26 @@ class CustomerViewSet(viewsets.ModelViewSet):
             'sales': SaleSerializer(sales, many=True).data,
             'payments': PaymentSerializer(payments, many=True).data,
             'opening_balance': customer.opening_balance,
-            'closing_balance': customer.running_balance,
+            'closing_balance': customer.current_balance,
+        })
+
+    def ledger(self, request, customer):
+        """Statement as one dated sequence with running balances, paginated by cursor"""
+        params = LedgerRequestSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = LedgerPage(request, customer, **params.validated_data)
+        return Response({
+            'customer': CustomerSerializer(customer).data,
+            'start_date': params.validated_data['start_date'],
+            'end_date': params.validated_data['end_date'],
+            'opening_balance': page.opening_balance,
+            'closing_balance': page.closing_balance,
+            'next': page.next_link(),
+            'results': LedgerEntrySerializer(page.entries, many=True).data,
         })
 
 
-class DailyRateViewSet(viewsets.ModelViewSet):
+class DailyRateViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for DailyRate model"""
     queryset = DailyRate.objects.all()
     serializer_class = DailyRateSerializer
@@ -73,7 +101,7 @@ class DailyRateViewSet(viewsets.ModelViewSet):
     ordering = ['-date']
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(LookupMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Supplier model"""
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
@@ -110,11 +138,11 @@ class SupplierViewSet(viewsets.ModelViewSet):
             'purchases': PurchaseSerializer(purchases, many=True).data,
             'payments': SupplierPaymentSerializer(payments, many=True).data,
             'opening_balance': supplier.opening_balance,
-            'closing_balance': supplier.closing_balance,
+            'closing_balance': supplier.current_balance,
         })
 
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Purchase model"""
     queryset = Purchase.objects.select_related('supplier').all()
     serializer_class = PurchaseSerializer
@@ -122,11 +150,12 @@ class PurchaseViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = PurchaseFilter
     search_fields = ['supplier__name', 'vehicle_number', 'note']
-    ordering_fields = ['date', 'kg', 'cost_rate_per_kg', 'created_at']
+    ordering_fields = ['date', 'kg', 'cost_rate_per_kg', 'total_cost', 'amount_paid', 'borrow_amount', 'created_at']
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
 
 
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Sale model"""
     queryset = Sale.objects.select_related('customer').all()
     serializer_class = SaleSerializer
@@ -134,11 +163,14 @@ class SaleViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = SaleFilter
     search_fields = ['customer__name', 'note']
-    ordering_fields = ['date', 'kg', 'sale_rate_per_kg', 'created_at']
+    ordering_fields = [
+        'date', 'kg', 'sale_rate_per_kg', 'total_amount', 'amount_received', 'borrow_amount', 'profit', 'created_at'
+    ]
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Payment model"""
     queryset = Payment.objects.select_related('customer').all()
     serializer_class = PaymentSerializer
@@ -148,22 +180,25 @@ class PaymentViewSet(viewsets.ModelViewSet):
     search_fields = ['customer__name', 'note']
     ordering_fields = ['date', 'amount', 'created_at']
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
     
     def perform_create(self, serializer):
         """Create payment and auto-allocate to customer's outstanding sales"""
-        payment = serializer.save()
-        # Auto-allocate this payment to customer's sales with outstanding borrow amounts
-        payment.allocate_to_sales()
+        with transaction.atomic():
+            payment = serializer.save()
+            # Auto-allocate this payment to customer's sales with outstanding borrow amounts
+            payment.allocate_to_sales()
     
     def perform_update(self, serializer):
         """Update payment and re-allocate if needed"""
-        payment = serializer.save()
-        # If payment details changed and not yet allocated, allocate it
-        if not payment.auto_allocated:
-            payment.allocate_to_sales()
+        with transaction.atomic():
+            payment = serializer.save()
+            # If payment details changed and not yet allocated, allocate it
+            if not payment.auto_allocated:
+                payment.allocate_to_sales()
 
 
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for Expense model"""
     queryset = Expense.objects.all()
     serializer_class = ExpenseSerializer
@@ -173,9 +208,10 @@ class ExpenseViewSet(viewsets.ModelViewSet):
     search_fields = ['note']
     ordering_fields = ['date', 'amount', 'category', 'created_at']
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
 
 
-class CustomerDeductionViewSet(viewsets.ModelViewSet):
+class CustomerDeductionViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for CustomerDeduction model"""
     queryset = CustomerDeduction.objects.select_related('customer').all()
     serializer_class = CustomerDeductionSerializer
@@ -185,9 +221,10 @@ class CustomerDeductionViewSet(viewsets.ModelViewSet):
     search_fields = ['customer__name', 'note']
     ordering_fields = ['date', 'amount', 'created_at']
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
 
 
-class SupplierPaymentViewSet(viewsets.ModelViewSet):
+class SupplierPaymentViewSet(ExportMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet for SupplierPayment model"""
     queryset = SupplierPayment.objects.select_related('supplier').all()
     serializer_class = SupplierPaymentSerializer
@@ -197,71 +234,79 @@ class SupplierPaymentViewSet(viewsets.ModelViewSet):
     search_fields = ['supplier__name', 'note']
     ordering_fields = ['date', 'amount', 'created_at']
     ordering = ['-date', '-created_at']
+    pagination_class = TransactionPagination
 
 
-@api_view(['POST', 'GET'])
+@api_view(['POST'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def backup_database(request):
     """
-    Create and download database backup
+    Create a database backup
     Only accessible to admin users
-    Returns Excel file with all data
+
+    Queues a background backup job and returns it (202); poll
+    ``/api/backup/jobs/<id>/`` and download its files when it completes.
+    A synchronous backup is only available as ``manage.py backup_data``.
     """
     import logging
     logger = logging.getLogger(__name__)
     
-    try:
-        output_dir = 'backups'
-        
-        # Create backups directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        
-        logger.info("Starting backup process...")
-        
-        # Call the management command to create backup
-        call_command('backup_data', output_dir=output_dir)
-        
-        logger.info("Backup command completed, looking for latest file...")
-        
-        # Get the most recently created Excel file
-        excel_files = [f for f in os.listdir(output_dir) if f.endswith('.xlsx') and f.startswith('ahmad_poultry_backup_')]
-        
-        if not excel_files:
-            logger.error("No backup files found after command execution")
-            return Response(
-                {'error': 'Backup file not created. Please check server logs.'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
-        # Sort by modification time to get the latest
-        excel_files.sort(key=lambda x: os.path.getmtime(os.path.join(output_dir, x)), reverse=True)
-        latest_file = excel_files[0]
-        excel_file_path = os.path.join(output_dir, latest_file)
-        
-        logger.info(f"Found backup file: {latest_file}")
-        
-        # Return the Excel file as download
-        if os.path.exists(excel_file_path):
-            file_handle = open(excel_file_path, 'rb')
-            response = FileResponse(
-                file_handle,
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{latest_file}"'
-            return response
-        else:
-            logger.error(f"Backup file exists check failed: {excel_file_path}")
-            return Response(
-                {'error': 'Backup file not found after creation'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    options = BackupRequestSerializer(data=request.data)
+    options.is_valid(raise_exception=True)
     
-    except Exception as e:
-        logger.error(f"Backup failed with exception: {str(e)}", exc_info=True)
+    job = enqueue_backup(request.user, **options.validated_data)
+    logger.info(f"Queued backup job {job.pk}")
+    return Response(
+        BackupJobSerializer(job, context={'request': request}).data,
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def backup_jobs(request):
+    """
+    List the most recent backup jobs
+    Only accessible to admin users
+    """
+    expire_stale_jobs()
+    jobs = BackupJob.objects.all()[:20]
+    return Response(BackupJobSerializer(jobs, many=True, context={'request': request}).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def backup_job_detail(request, job_id):
+    """
+    Get a backup job's status and rows written per table
+    Only accessible to admin users
+    """
+    expire_stale_jobs()
+    job = get_object_or_404(BackupJob, pk=job_id)
+    return Response(BackupJobSerializer(job, context={'request': request}).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def backup_job_download(request, job_id):
+    """
+    Download a file of a completed backup job (``?artifact=excel|json``)
+    Only accessible to admin users
+    """
+    job = get_object_or_404(BackupJob, pk=job_id)
+    artifact = request.query_params.get('artifact', 'excel')
+    if artifact not in ('excel', 'json'):
+        return Response({'error': "artifact must be 'excel' or 'json'"}, status=status.HTTP_400_BAD_REQUEST)
+    if job.status != 'completed':
         return Response(
-            {'error': f'Backup failed: {str(e)}. Please contact administrator.'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': f'Backup job is {job.status}', 'status': job.status},
+            status=status.HTTP_409_CONFLICT
         )
+    
+    path = getattr(job, f'{artifact}_file')
+    if not path or not os.path.exists(path):
+        return Response({'error': 'Backup file no longer exists'}, status=status.HTTP_410_GONE)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
 
 
 @api_view(['GET'])
@@ -272,44 +317,17 @@ def backup_status(request):
     Only accessible to admin users
     """
     try:
-        output_dir = 'backups'
+        output_dir = settings.BACKUP_DIR
         
-        # Get list of backup files
-        backup_files = []
-        if os.path.exists(output_dir):
-            files = [f for f in os.listdir(output_dir) if f.endswith('.xlsx')]
-            files.sort(reverse=True)
-            
-            for file in files[:10]:  # Return last 10 backups
-                file_path = os.path.join(output_dir, file)
-                file_stat = os.stat(file_path)
-                backup_files.append({
-                    'filename': file,
-                    'size': file_stat.st_size,
-                    'created_at': timezone.datetime.fromtimestamp(file_stat.st_mtime).isoformat()
-                })
+        # Last 10 Excel backups from the directory's manifest
+        backup_files = [
+            {key: entry[key] for key in ('filename', 'size', 'created_at')}
+            for entry in read_manifest(output_dir) if entry['format'] == 'excel'
+        ][:10]
         
-        # Get current database statistics
-        stats = {
-            'customers': Customer.objects.count(),
-            'suppliers': Supplier.objects.count(),
-            'daily_rates': DailyRate.objects.count(),
-            'purchases': Purchase.objects.count(),
-            'sales': Sale.objects.count(),
-            'payments': Payment.objects.count(),
-            'supplier_payments': SupplierPayment.objects.count(),
-            'expenses': Expense.objects.count(),
-            'total_records': (
-                Customer.objects.count() +
-                Supplier.objects.count() +
-                DailyRate.objects.count() +
-                Purchase.objects.count() +
-                Sale.objects.count() +
-                Payment.objects.count() +
-                SupplierPayment.objects.count() +
-                Expense.objects.count()
-            )
-        }
+        # Current database statistics, all counted in one query
+        stats = table_counts()
+        stats['total_records'] = sum(stats.values())
         
         return Response({
             'statistics': stats,
@@ -1,11 +1,11 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { Autocomplete, TextField, CircularProgress } from '@mui/material';
-import type { Customer } from '../types';
+import type { LookupItem } from '../types';
 import { CustomerService } from '../services/customerService';
 
 interface CustomerAutocompleteProps {
-  value: Customer | null;
-  onChange: (customer: Customer | null) => void;
+  value: LookupItem | null;
+  onChange: (customer: LookupItem | null) => void;
   label?: string;
   placeholder?: string;
   required?: boolean;
@@ -33,7 +33,7 @@ export function CustomerAutocomplete({
   id,
 }: CustomerAutocompleteProps) {
   const [inputValue, setInputValue] = useState('');
-  const [options, setOptions] = useState<Customer[]>([]);
+  const [options, setOptions] = useState<LookupItem[]>([]);
   const [loading, setLoading] = useState(false);
   const [loadingInitial, setLoadingInitial] = useState(true);
   const [searchTimeout, setSearchTimeout] = useState<ReturnType<typeof setTimeout> | null>(null);
@@ -96,32 +96,20 @@ export function CustomerAutocomplete({
   };
 
   // Handle selection change
-  const handleValueChange = (_event: React.SyntheticEvent, newValue: Customer | null) => {
+  const handleValueChange = (_event: React.SyntheticEvent, newValue: LookupItem | null) => {
     onChange(newValue);
   };
 
   // Get display text for selected value
-  const getOptionLabel = (option: Customer) => {
-    return `${option.name}${option.phone ? ` (${option.phone})` : ''}`;
+  const getOptionLabel = (option: LookupItem) => {
+    return option.name;
   };
 
   // Custom option rendering
-  const renderOption = (props: React.HTMLAttributes<HTMLLIElement>, option: Customer) => {
+  const renderOption = (props: React.HTMLAttributes<HTMLLIElement>, option: LookupItem) => {
     return (
       <li key={option.id} {...props}>
-        <div style={{ display: 'flex', flexDirection: 'column' }}>
-          <span style={{ fontWeight: 500 }}>{option.name}</span>
-          {option.phone && (
-            <span style={{ fontSize: '0.875rem', color: 'text.secondary' }}>
-              📞 {option.phone}
-            </span>
-          )}
-          {option.address && (
-            <span style={{ fontSize: '0.75rem', color: 'text.secondary' }}>
-              📍 {option.address.length > 50 ? `${option.address.substring(0, 50)}...` : option.address}
-            </span>
-          )}
-        </div>
+        <span style={{ fontWeight: 500 }}>{option.name}</span>
       </li>
     );
   };
@@ -130,9 +118,8 @@ export function CustomerAutocomplete({
   const handleKeyDown = (event: React.KeyboardEvent<HTMLDivElement>) => {
     if (event.key === 'Enter') {
       event.preventDefault();
-      const matchingOptions = options.filter(option => 
-        option.name.toLowerCase().includes(inputValue.toLowerCase()) ||
-        (option.phone && option.phone.includes(inputValue))
+      const matchingOptions = options.filter(option =>
+        option.name.toLowerCase().startsWith(inputValue.toLowerCase())
       );
       
       if (matchingOptions.length === 1) {
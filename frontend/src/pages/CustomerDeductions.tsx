@@ -23,14 +23,14 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import FilterListIcon from '@mui/icons-material/FilterList';
 import CalendarTodayIcon from '@mui/icons-material/CalendarToday';
 import api from '../services/api';
-import type { CustomerDeduction, Customer, PaginatedResponse } from '../types';
+import type { CustomerDeduction, LookupItem, PaginatedResponse } from '../types';
 import CustomerAutocomplete from '../components/CustomerAutocomplete';
 
 export default function CustomerDeductions() {
   const [open, setOpen] = useState(false);
   const [editMode, setEditMode] = useState(false);
   const [selectedDeduction, setSelectedDeduction] = useState<CustomerDeduction | null>(null);
-  const [selectedCustomer, setSelectedCustomer] = useState<Customer | null>(null);
+  const [selectedCustomer, setSelectedCustomer] = useState<LookupItem | null>(null);
   const [formData, setFormData] = useState({ 
     date: new Date().toISOString().split('T')[0], 
     customer: '', 
@@ -176,13 +176,7 @@ export default function CustomerDeductions() {
     setSelectedCustomer({
       id: deduction.customer,
       name: deduction.customer_name,
-      phone: '',
-      address: '',
-      opening_balance: '',
-      running_balance: '',
-      is_active: true,
-      created_at: '',
-      updated_at: ''
+      is_active: true
     });
     setFormData({
       date: deduction.date,
@@ -1,4 +1,4 @@
-import { useQuery } from '@tanstack/react-query';
+import { useQuery, useQueryClient } from '@tanstack/react-query';
 import {
   Box,
   Paper,
@@ -13,13 +13,15 @@ import {
 } from '@mui/material';
 import { Download, Backup, CheckCircle } from '@mui/icons-material';
 import api from '../services/api';
-import type { DailyReport } from '../types';
+import type { BackupJob, DailyReport } from '../types';
 import { useState } from 'react';
 
 export default function Dashboard() {
   const today = new Date().toISOString().split('T')[0];
   const [downloadingBackup, setDownloadingBackup] = useState(false);
   const [backupMessage, setBackupMessage] = useState<{ type: 'success' | 'error', message: string } | null>(null);
+  const [backupRows, setBackupRows] = useState(0);
+  const queryClient = useQueryClient();
 
   const { data: todayReport, isLoading } = useQuery<DailyReport>({
     queryKey: ['daily-report', today],
@@ -37,46 +39,51 @@ export default function Dashboard() {
     },
   });
 
+  // Poll a backup job until it completes or fails
+  const waitForBackup = async (job: BackupJob): Promise<BackupJob> => {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await api.get<BackupJob>(`/api/backup/jobs/${job.id}/`);
+      job = response.data;
+      setBackupRows(Object.values(job.progress.excel || {}).reduce((total, rows) => total + rows, 0));
+    }
+    return job;
+  };
+
   const handleDownloadBackup = async () => {
     try {
       setDownloadingBackup(true);
       setBackupMessage(null);
+      setBackupRows(0);
       
-      console.log('Initiating backup download...');
+      // Start the backup in the background and wait for it
+      const queued = await api.post<BackupJob>('/api/backup/', {});
+      const job = await waitForBackup(queued.data);
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Backup failed');
+      }
       
-      // Create backup and download
-      const response = await api.post('/api/backup/', {}, {
+      // Download the finished Excel file
+      const response = await api.get(`/api/backup/jobs/${job.id}/download/?artifact=excel`, {
         responseType: 'blob',
       });
       
-      // Create download link
       const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
       link.href = url;
-      
-      // Extract filename from response headers or use default
-      const contentDisposition = response.headers['content-disposition'];
-      let filename = 'ahmad_poultry_backup.xlsx';
-      if (contentDisposition) {
-        const filenameMatch = contentDisposition.match(/filename="?(.+)"?/);
-        if (filenameMatch) {
-          filename = filenameMatch[1];
-        }
-      }
-      
-      link.setAttribute('download', filename);
+      link.setAttribute('download', job.excel_file || 'ahmad_poultry_backup.xlsx');
       document.body.appendChild(link);
       link.click();
       link.remove();
       window.URL.revokeObjectURL(url);
       
       setBackupMessage({ type: 'success', message: 'Backup downloaded successfully!' });
-      console.log('Backup downloaded successfully');
+      queryClient.invalidateQueries({ queryKey: ['backup-status'] });
     } catch (error: any) {
       console.error('Backup download error:', error);
       setBackupMessage({ 
         type: 'error', 
-        message: error.response?.data?.error || 'Failed to download backup. Please try again.' 
+        message: error.response?.data?.error || error.message || 'Failed to download backup. Please try again.' 
       });
     } finally {
       setDownloadingBackup(false);
@@ -144,7 +151,9 @@ export default function Dashboard() {
             onClick={handleDownloadBackup}
             disabled={downloadingBackup}
           >
-            {downloadingBackup ? 'Creating Backup...' : 'Download Backup'}
+            {downloadingBackup
+              ? `Creating Backup...${backupRows ? ` (${backupRows.toLocaleString()} rows)` : ''}`
+              : 'Download Backup'}
           </Button>
         </Box>
 
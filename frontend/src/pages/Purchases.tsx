@@ -23,7 +23,7 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import FilterListIcon from '@mui/icons-material/FilterList';
 import CalendarTodayIcon from '@mui/icons-material/CalendarToday';
 import api from '../services/api';
-import type { Purchase, Supplier, PaginatedResponse } from '../types';
+import type { Purchase, LookupItem, PaginatedResponse } from '../types';
 
 export default function Purchases() {
   const [open, setOpen] = useState(false);
@@ -61,12 +61,11 @@ export default function Purchases() {
     },
   });
 
-  const { data: suppliers } = useQuery<PaginatedResponse<Supplier>>({
-    queryKey: ['suppliers-active'],
+  const { data: suppliers } = useQuery<LookupItem[]>({
+    queryKey: ['suppliers', 'lookup'],
     queryFn: async () => {
-      // Fetch ALL active suppliers (no pagination limit)
-      const response = await api.get('/api/suppliers/?is_active=true&page_size=10000');
-      console.log('Suppliers for purchases:', response.data);
+      // Id and name of the active suppliers only; unchanged lists come back as 304
+      const response = await api.get('/api/suppliers/lookup/?is_active=true');
       return response.data;
     },
   });
@@ -387,13 +386,13 @@ export default function Purchases() {
                 label="Supplier" 
                 value={formData.supplier} 
                 onChange={(e) => setFormData({ ...formData, supplier: e.target.value })} 
-                helperText={!suppliers?.results?.length ? "Loading suppliers..." : `${suppliers.results.length} suppliers available`}
+                helperText={!suppliers?.length ? "Loading suppliers..." : `${suppliers.length} suppliers available`}
               >
                 <MenuItem value="">
                   <em>None</em>
                 </MenuItem>
-                {suppliers?.results && suppliers.results.length > 0 ? (
-                  suppliers.results.map((supplier) => (
+                {suppliers && suppliers.length > 0 ? (
+                  suppliers.map((supplier) => (
                     <MenuItem key={supplier.id} value={supplier.id}>
                       {supplier.name}
                     </MenuItem>
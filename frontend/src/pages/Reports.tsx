@@ -14,7 +14,7 @@ export default function Reports() {
   const { data, isLoading, refetch } = useQuery<PeriodReport>({
     queryKey: ['period-report', startDate, endDate],
     queryFn: async () => {
-      const response = await api.get(`/api/reports/period/?start_date=${startDate}&end_date=${endDate}`);
+      const response = await api.get(`/api/reports/period/?start_date=${startDate}&end_date=${endDate}&sort=-revenue`);
       return response.data;
     },
   });
@@ -24,14 +24,14 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import FilterListIcon from '@mui/icons-material/FilterList';
 import CalendarTodayIcon from '@mui/icons-material/CalendarToday';
 import api from '../services/api';
-import type { Sale, Customer, PaginatedResponse, DailyRate } from '../types';
+import type { Sale, LookupItem, PaginatedResponse, DailyRate } from '../types';
 import CustomerAutocomplete from '../components/CustomerAutocomplete';
 
 export default function Sales() {
   const [open, setOpen] = useState(false);
   const [editMode, setEditMode] = useState(false);
   const [selectedSale, setSelectedSale] = useState<Sale | null>(null);
-  const [selectedCustomer, setSelectedCustomer] = useState<Customer | null>(null);
+  const [selectedCustomer, setSelectedCustomer] = useState<LookupItem | null>(null);
   const [formData, setFormData] = useState({
     date: new Date().toISOString().split('T')[0],
     customer: '',
@@ -320,13 +320,7 @@ export default function Sales() {
     setSelectedCustomer({
       id: sale.customer,
       name: sale.customer_name,
-      phone: '',
-      address: '',
-      opening_balance: '',
-      running_balance: '',
-      is_active: true,
-      created_at: '',
-      updated_at: ''
+      is_active: true
     });
     setFormData({
       date: sale.date,
@@ -23,7 +23,7 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import FilterListIcon from '@mui/icons-material/FilterList';
 import CalendarTodayIcon from '@mui/icons-material/CalendarToday';
 import api from '../services/api';
-import type { SupplierPayment, Supplier, PaginatedResponse } from '../types';
+import type { SupplierPayment, LookupItem, PaginatedResponse } from '../types';
 
 export default function SupplierPayments() {
   const [open, setOpen] = useState(false);
@@ -56,12 +56,11 @@ export default function SupplierPayments() {
     queryFn: async () => (await api.get(`/api/supplier-payments/${buildQueryString()}`)).data,
   });
 
-  const { data: suppliers } = useQuery<PaginatedResponse<Supplier>>({
-    queryKey: ['suppliers-active'],
+  const { data: suppliers } = useQuery<LookupItem[]>({
+    queryKey: ['suppliers', 'lookup'],
     queryFn: async () => {
-      // Fetch ALL active suppliers (no pagination limit)
-      const response = await api.get('/api/suppliers/?is_active=true&page_size=10000');
-      console.log('Suppliers for payments:', response.data);
+      // Id and name of the active suppliers only; unchanged lists come back as 304
+      const response = await api.get('/api/suppliers/lookup/?is_active=true');
       return response.data;
     },
   });
@@ -318,10 +317,10 @@ export default function SupplierPayments() {
                 value={formData.supplier}
                 onChange={(e) => setFormData({ ...formData, supplier: e.target.value })}
                 required
-                helperText={!suppliers?.results?.length ? "Loading suppliers..." : `${suppliers.results.length} suppliers available`}
+                helperText={!suppliers?.length ? "Loading suppliers..." : `${suppliers.length} suppliers available`}
               >
-                {suppliers?.results && suppliers.results.length > 0 ? (
-                  suppliers.results.map((supplier) => (
+                {suppliers && suppliers.length > 0 ? (
+                  suppliers.map((supplier) => (
                     <MenuItem key={supplier.id} value={supplier.id}>
                       {supplier.name}
                     </MenuItem>
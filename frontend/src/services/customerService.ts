@@ -1,5 +1,5 @@
 import api from './api';
-import type { Customer, PaginatedResponse } from '../types';
+import type { Customer, LedgerPage, LookupItem, PaginatedResponse } from '../types';
 
 // Service for customer-related API calls with enhanced search capabilities
 export class CustomerService {
@@ -50,20 +50,39 @@ export class CustomerService {
     }
   }
 
+  /**
+   * Get id, name and status of customers whose name starts with the search term
+   * Served from the server's lookup cache; unchanged lists come back as 304
+   */
+  static async lookupCustomers(searchTerm: string = '', limit?: number): Promise<LookupItem[]> {
+    try {
+      const params = new URLSearchParams({ is_active: 'true' });
+      if (searchTerm.trim()) {
+        params.append('search', searchTerm.trim());
+      }
+      if (limit) {
+        params.append('limit', limit.toString());
+      }
+      const response = await api.get(`/api/customers/lookup/?${params.toString()}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error looking up customers:', error);
+      throw error;
+    }
+  }
+
   /**
    * Get customers for autocomplete with search functionality
    * This is optimized for dropdowns with typing search
    */
-  static async getCustomersForAutocomplete(searchTerm?: string): Promise<Customer[]> {
+  static async getCustomersForAutocomplete(searchTerm?: string): Promise<LookupItem[]> {
     try {
       if (searchTerm && searchTerm.trim()) {
-        // Use server-side search for performance
-        const result = await this.searchCustomers(searchTerm, 50);
-        return result.results;
+        // Use server-side prefix search for performance
+        return await this.lookupCustomers(searchTerm, 50);
       } else {
         // Get all active customers if no search term
-        const result = await this.getActiveCustomers(1000);
-        return result.results;
+        return await this.lookupCustomers();
       }
     } catch (error) {
       console.error('Error fetching customers for autocomplete:', error);
@@ -141,6 +160,34 @@ export class CustomerService {
       throw error;
     }
   }
+
+  /**
+   * Get one page of the customer ledger with running balances
+   * Pass the previous page's `next` URL as `cursorUrl` to continue
+   */
+  static async getCustomerLedger(
+    customerId: number,
+    startDate?: string,
+    endDate?: string,
+    pageSize: number = 100,
+    cursorUrl?: string | null
+  ): Promise<LedgerPage> {
+    try {
+      if (cursorUrl) {
+        const response = await api.get(cursorUrl);
+        return response.data;
+      }
+      const params = new URLSearchParams({ mode: 'ledger', page_size: pageSize.toString() });
+      if (startDate) params.append('start_date', startDate);
+      if (endDate) params.append('end_date', endDate);
+
+      const response = await api.get(`/api/customers/${customerId}/statement/?${params.toString()}`);
+      return response.data;
+    } catch (error) {
+      console.error(`Error fetching ledger for customer ${customerId}:`, error);
+      throw error;
+    }
+  }
 }
 
 export default CustomerService;
\ No newline at end of file
@@ -12,6 +12,37 @@ export interface Customer {
   updated_at: string;
 }
 
+export interface LookupItem {
+  id: number;
+  name: string;
+  is_active: boolean;
+}
+
+export interface LedgerEntry {
+  kind: 'sale' | 'payment' | 'deduction';
+  id: number;
+  date: string;
+  created_at: string;
+  kg: string | null;
+  rate: string | null;
+  method: string | null;
+  deduction_type: string | null;
+  note: string;
+  debit: string;
+  credit: string;
+  balance: string;
+}
+
+export interface LedgerPage {
+  customer: Customer;
+  start_date: string | null;
+  end_date: string | null;
+  opening_balance: string;
+  closing_balance: string;
+  next: string | null;
+  results: LedgerEntry[];
+}
+
 export interface DailyRate {
   id: number;
   date: string;
@@ -134,6 +165,7 @@ export interface DailyReport {
   cash_from_payments: string;
   borrow: string;
   expenses_total: string;
+  opening_stock: string;
   closing_stock: string;
 }
 
@@ -167,3 +199,19 @@ export interface PaginatedResponse<T> {
   results: T[];
 }
 
+
+export interface BackupJob {
+  id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  options: Record<string, string>;
+  totals: Record<string, number>;
+  progress: Record<string, Record<string, number>>;
+  excel_file: string | null;
+  json_file: string | null;
+  downloads: Record<string, string>;
+  error: string;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  updated_at: string;
+}